@@ -2,8 +2,15 @@
 加密相關 (複製 HireMe 專案)
 """
 
+import os
 import hashlib
-from typing import Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# 批次雜湊時每個工作單位的筆數
+HASH_CHUNK_SIZE = 10_000
 
 
 def password_hash(value: str, unique_value: str, salt: Optional[str] = "moremoreSalt") -> str:
@@ -27,6 +34,55 @@ def password_hash(value: str, unique_value: str, salt: Optional[str] = "moremore
     result = hash_obj.hexdigest()
 
     return result
+
+
+def _hash_chunk(pairs: List[Tuple[str, str]]) -> List[str]:
+    """在工作行程中雜湊一批 (value, unique_value)"""
+    return [password_hash(value, unique_value) for value, unique_value in pairs]
+
+
+def _chunks(pairs: Iterable[Tuple[str, str]], chunk_size: int) -> Iterator[List[Tuple[str, str]]]:
+    iterator = iter(pairs)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def password_hash_batch(pairs: Iterable[Tuple[str, str]], workers: Optional[int] = None,
+                        chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[str]:
+    """
+    以多個行程批次雜湊 (value, unique_value)，結果與 password_hash 完全相同
+
+    輸入分成 chunk_size 筆一組送到行程池，同時處理中的組數以 workers 的兩倍為上限，
+    因此可以處理任意長度的串流，記憶體用量固定
+
+    Args:
+        pairs: (原始值, 唯一值) 的串流
+        workers: 行程數（預設為 CPU 數量，1 表示在目前行程中執行）
+        chunk_size: 每組的筆數
+
+    Yields:
+        與輸入順序相同的 SHA256 雜湊十六進位字串
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(pairs, chunk_size)
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from _hash_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_hash_chunk, chunk))
+            # 依序取出最早送出的結果，讓輸出保持輸入順序
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
     
 # if __name__ == "__main__":
 #     # 測試範例
@@ -0,0 +1,52 @@
+"""
+批次密碼雜湊效能比較
+比較逐筆呼叫 password_hash 與 password_hash_batch 在不同行程數下的每秒雜湊數
+
+執行方式：python benchmarks/bench_password_hash.py [--size 2000000] [--workers 1 2 4 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SHA_256 import password_hash, password_hash_batch, HASH_CHUNK_SIZE  # noqa: E402
+
+
+def make_pairs(size: int):
+    """產生 (密碼, 32 字元用戶 ID) 資料"""
+    return [(f"password{i}", f"{i:032x}") for i in range(size)]
+
+
+def timed(label: str, size: int, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed:>10.2f} 秒{size / elapsed:>14,.0f} 筆/秒")
+    return result
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="批次密碼雜湊效能比較")
+    parser.add_argument("--size", type=int, default=2_000_000, help="雜湊筆數（預設 200 萬）")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, cpu_count}), help="要比較的行程數")
+    parser.add_argument("--chunk-size", type=int, default=HASH_CHUNK_SIZE, help="每組的筆數")
+    args = parser.parse_args()
+
+    print(f"產生 {args.size:,} 筆資料，CPU 數量 {cpu_count}...")
+    pairs = make_pairs(args.size)
+
+    print(f"\n{'方式':<26}{'耗時':>10}{'吞吐量':>14}")
+    expected = timed("逐筆 password_hash", args.size, lambda: [password_hash(v, u) for v, u in pairs])
+    for workers in args.workers:
+        result = timed(f"batch workers={workers}", args.size,
+                       lambda: list(password_hash_batch(pairs, workers=workers, chunk_size=args.chunk_size)))
+        assert result == expected, "批次雜湊結果與逐筆結果不一致"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+週統計效能比較
+比較逐週掃描、單次二分搜尋與 NumPy 向量化三種方式統計 CreateDate 的耗時
+
+執行方式：python benchmarks/bench_week_bucketing.py [--size 10000000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hireme import count_dates_by_weeks, np  # noqa: E402
+from week_range import get_week_ranges  # noqa: E402
+
+
+def make_users(size: int):
+    """產生分布在報告期間前後的用戶資料"""
+    rng = random.Random(0)
+    base = datetime(2025, 11, 10)
+    return [{'CreateDate': base + timedelta(minutes=rng.randrange(70 * 24 * 60))} for _ in range(size)]
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed:>10.2f} 秒")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="週統計效能比較")
+    parser.add_argument("--size", type=int, default=10_000_000, help="日期筆數（預設 1000 萬）")
+    parser.add_argument("--skip-per-week", action="store_true", help="略過最慢的逐週掃描")
+    args = parser.parse_args()
+
+    weeks = get_week_ranges()
+    print(f"產生 {args.size:,} 筆資料，{len(weeks)} 週...")
+    create_dates = [user['CreateDate'] for user in make_users(args.size)]
+
+    print(f"\n{'方式':<26}{'耗時':>10}")
+    results = []
+    if not args.skip_per_week:
+        # 原本的做法：每一週都用純 Python 迴圈掃描全部用戶一次
+        results.append(timed("逐週掃描（原本的迴圈）",
+                             lambda: [count_dates_by_weeks(create_dates, [week], use_numpy=False)[0] for week in weeks]))
+    results.append(timed("單次掃描 + 二分搜尋", lambda: count_dates_by_weeks(create_dates, weeks, use_numpy=False)))
+    if np is not None:
+        results.append(timed("NumPy searchsorted/bincount", lambda: count_dates_by_weeks(create_dates, weeks, use_numpy=True)))
+    else:
+        print("未安裝 NumPy，略過向量化測試")
+
+    assert all(result == results[0] for result in results), "各方式統計結果不一致"
+    print(f"\n各週人數: {results[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,36 @@ HireMe 註冊人數統計報告
 import os
 import re
 import csv
+import time
+import tempfile
+import argparse
+from collections import OrderedDict
+from contextlib import ExitStack
 from datetime import datetime, date, timedelta
-from typing import Optional, Dict, List, Tuple
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, func, and_, or_, select, Table as SQLTable
+from functools import partial
+from itertools import islice
+from typing import Callable, Optional, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+from sqlalchemy import create_engine, Column, String, DateTime, Integer, func, and_, or_, select, text, bindparam, Table as SQLTable
 from sqlalchemy.orm import declarative_base, sessionmaker, aliased
 from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
 import logging
-from week_range import get_week_ranges, get_total_date_range
+from week_range import (
+    get_week_ranges,
+    get_total_date_range,
+    get_report_period,
+    format_total_period,
+    build_calendar,
+    get_bucket_index,
+    BucketIndex
+)
+from spill_buffer import SpillingBuffer
+
+# NumPy 為選用套件，未安裝時使用純 Python 的統計方式
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # 載入 .env 檔案
 load_dotenv()
@@ -98,6 +120,10 @@ def get_db_engine(database: str = "HireMePlz") -> Optional[Engine]:
         return None
 
 
+# 簡單的 email 格式檢查：包含 @ 和 .
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+
 def is_email_format(login_name: str) -> bool:
     """
     檢查 LoginName 是否為 email 格式
@@ -111,141 +137,777 @@ def is_email_format(login_name: str) -> bool:
     if not login_name:
         return False
 
-    # 簡單的 email 格式檢查：包含 @ 和 .
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(email_pattern, login_name))
+    return bool(re.match(EMAIL_PATTERN, login_name))
+
+
+
 
+# 串流查詢時每批從伺服器端游標讀取的筆數
+FETCH_BATCH_SIZE = 5000
 
+# 註冊用戶查詢的資料來源（跨資料庫查詢在 ORM 中較複雜，因此使用原生 SQL）
+USERS_FROM_SQL = """
+    FROM HireMePlz.dbo.[User] u
+    LEFT JOIN HireMePlz.dbo.userResumeTempStatus urts ON u.Id = urts.userId
+    LEFT JOIN JBHRIS_DISPATCH.dbo.REC_User ru ON ru.UserID = urts.backId
+"""
+
+# 註冊用戶查詢的條件
+USERS_WHERE_SQL = """
+    WHERE ru.CreateDate BETWEEN :start_date AND :end_date
+    AND u.lineUid IS NOT NULL
+"""
 
+# 已匯出且已完成的額外條件
+EXPORTED_FINISHED_FILTER_SQL = """
+    AND urts.hasExport = 1
+    AND urts.hasFin = 1
+"""
 
-def query_registered_users(engine: Engine) -> List[Dict]:
+# 與 is_email_format 等價的 T-SQL 條件（SQL Server 沒有正規表示式）：
+# 只含允許的字元、恰好一個 @、網域不含 _%+、最後一個 . 之後至少兩個英文字母
+# 以二進位定序比對，字元範圍只包含 ASCII（與 EMAIL_PATTERN 相同），不受資料庫預設定序影響
+# （不區分腔調或全半形的定序會讓 é 符合 [a-z]、全形句點等於 .）
+EMAIL_FORMAT_FILTER_SQL = """
+    AND u.LoginName COLLATE Latin1_General_BIN LIKE '_%@_%._%'
+    AND u.LoginName COLLATE Latin1_General_BIN NOT LIKE '%[^a-zA-Z0-9._%+@-]%'
+    AND u.LoginName COLLATE Latin1_General_BIN NOT LIKE '%@%@%'
+    AND u.LoginName COLLATE Latin1_General_BIN NOT LIKE '%@%[_%+]%'
+    AND PATINDEX('%[^a-zA-Z]%', REVERSE(u.LoginName) COLLATE Latin1_General_BIN) >= 3
+    AND SUBSTRING(REVERSE(u.LoginName), PATINDEX('%[^a-zA-Z]%', REVERSE(u.LoginName) COLLATE Latin1_General_BIN), 1)
+        COLLATE Latin1_General_BIN = '.'
+"""
+
+# 註冊用戶查詢
+REGISTERED_USERS_SQL = """
+    SELECT
+        u.Id,
+        u.LoginName,
+        ru.CreateDate,
+        ru.NameC
+""" + USERS_FROM_SQL + USERS_WHERE_SQL
+
+# 已匯出且已完成的用戶查詢
+EXPORTED_FINISHED_USERS_SQL = REGISTERED_USERS_SQL + EXPORTED_FINISHED_FILTER_SQL
+
+# 漏斗階段：(代號, 名稱, 條件)，新增階段只需加一列，不會增加查詢次數
+FUNNEL_STAGES = [
+    ("registered", "註冊", "1 = 1"),
+    ("exported", "已匯出", "urts.hasExport = 1"),
+    ("finished", "已匯出且已完成", "urts.hasExport = 1 AND urts.hasFin = 1"),
+]
+
+# 只查詢 HireMePlz 的用戶（不跨資料庫），REC_User 欄位另外以 backId 查詢後在本機 JOIN
+HIREME_USERS_SQL = """
+    SELECT
+        u.Id,
+        u.LoginName,
+        urts.backId
+    FROM dbo.[User] u
+    JOIN dbo.userResumeTempStatus urts ON u.Id = urts.userId
+    WHERE u.lineUid IS NOT NULL
+    AND urts.backId IS NOT NULL
+"""
+
+# 在 JBHRIS_DISPATCH 以 backId 查詢 REC_User（:user_ids 為展開的 IN 清單）
+DISPATCH_REC_USERS_SQL = """
+    SELECT
+        ru.UserID,
+        ru.CreateDate,
+        ru.NameC
+    FROM dbo.REC_User ru
+    WHERE ru.UserID IN :user_ids
+    AND ru.CreateDate BETWEEN :start_date AND :end_date
+"""
+
+# SQL Server 單一語句最多 2100 個參數，IN 清單每批不超過此數量
+IN_LIST_BATCH_SIZE = 2000
+
+
+def _iter_users(engine: Engine, sql: str, batch_size: int) -> Iterator[Dict]:
     """
-    查詢註冊用戶資料（使用 ORM）
+    以伺服器端游標分批讀取用戶資料，並即時過濾 email 格式
 
     Args:
         engine: 資料庫引擎
+        sql: 查詢語句
+        batch_size: 每批讀取的筆數
 
-    Returns:
-        用戶資料列表
+    Yields:
+        用戶資料字典
     """
-    try:
-        # 建立 Session
-        SessionLocal = sessionmaker(bind=engine)
-        session = SessionLocal()
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
 
-        try:
-            # 對於跨資料庫查詢，使用原生 SQL 但保持 ORM 風格的結果處理
-            from sqlalchemy import text
-
-            # 使用原生 SQL 查詢（因為跨資料庫查詢在 ORM 中較複雜）
-            # 但使用 ORM 模型來定義結果結構
-            sql_query = text("""
-                SELECT
-                    u.Id,
-                    u.LoginName,
-                    ru.CreateDate,
-                    ru.NameC
-                FROM HireMePlz.dbo.[User] u
-                LEFT JOIN HireMePlz.dbo.userResumeTempStatus urts ON u.Id = urts.userId
-                LEFT JOIN JBHRIS_DISPATCH.dbo.REC_User ru ON ru.UserID = urts.backId
-                WHERE ru.CreateDate BETWEEN :start_date AND :end_date
-                AND u.lineUid IS NOT NULL
-            """)
-
-            # 執行查詢
-            start_date, end_date = get_total_date_range()
-            result = session.execute(
-                sql_query,
-                {"start_date": start_date, "end_date": end_date}
-            )
-            results = result.fetchall()
+    try:
+        start_date, end_date = get_total_date_range()
+        result = session.execute(
+            text(sql),
+            {"start_date": start_date, "end_date": end_date},
+            execution_options={"stream_results": True}
+        )
 
-            users = []
-            for row in results:
+        for rows in result.partitions(batch_size):
+            for row in rows:
                 login_name = row.LoginName if row.LoginName else ""
                 # 只保留 email 格式的 LoginName
                 if is_email_format(login_name):
-                    users.append({
+                    yield {
                         'Id': row.Id,
                         'LoginName': login_name,
                         'CreateDate': row.CreateDate,
                         'NameC': row.NameC if row.NameC else ''
-                    })
+                    }
 
-            logger.info(f"查詢到 {len(users)} 位註冊用戶（email 格式）")
-            return users
+    finally:
+        session.close()
 
-        finally:
-            session.close()
+
+def iter_registered_users(engine: Engine, batch_size: int = FETCH_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    串流查詢註冊用戶資料，記憶體用量只與 batch_size 有關
+
+    Args:
+        engine: 資料庫引擎
+        batch_size: 每批讀取的筆數
+
+    Yields:
+        用戶資料字典
+    """
+    return _iter_users(engine, REGISTERED_USERS_SQL, batch_size)
+
+
+def iter_exported_finished_users(engine: Engine, batch_size: int = FETCH_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    串流查詢已匯出且已完成的用戶資料（hasExport = 1 and hasFin = 1）
+
+    Args:
+        engine: 資料庫引擎
+        batch_size: 每批讀取的筆數
+
+    Yields:
+        用戶資料字典
+    """
+    return _iter_users(engine, EXPORTED_FINISHED_USERS_SQL, batch_size)
+
+
+def iter_users_with_rec_lookup(engine: Engine,
+                               lookup: Callable[[Iterable[str], date, date], Dict[str, Tuple]],
+                               exported_finished: bool = False,
+                               batch_size: int = FETCH_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    只在 HireMePlz 查詢用戶，再以 backId 批次查詢 REC_User 並在本機做雜湊 JOIN
+
+    每批最多 batch_size 列，REC_User 的查詢結果只保留當批，
+    記憶體用量與總資料量無關。結果與跨資料庫 JOIN 的 SQL 相同（順序可能不同）。
+
+    Args:
+        engine: HireMePlz 資料庫引擎
+        lookup: 傳入 (backId 集合, 開始日期, 結束日期)，返回 backId 對應 (CreateDate, NameC) 的函式
+        exported_finished: 是否只查詢已匯出且已完成的用戶
+        batch_size: 每批讀取的筆數
+
+    Yields:
+        用戶資料字典
+    """
+    sql = HIREME_USERS_SQL + (EXPORTED_FINISHED_FILTER_SQL if exported_finished else "")
+
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+
+    try:
+        start_date, end_date = get_total_date_range()
+        result = session.execute(text(sql), execution_options={"stream_results": True})
+
+        for rows in result.partitions(batch_size):
+            # 先過濾 email 格式，減少需要查詢的 backId
+            candidates = []
+            for row in rows:
+                login_name = row.LoginName if row.LoginName else ""
+                if is_email_format(login_name):
+                    candidates.append((row.Id, login_name, row.backId))
+
+            if not candidates:
+                continue
+
+            rec_users = lookup({back_id for _, _, back_id in candidates}, start_date, end_date)
+            for user_id, login_name, back_id in candidates:
+                rec_user = rec_users.get(back_id)
+                if rec_user is not None:
+                    create_date, name_c = rec_user
+                    yield {
+                        'Id': user_id,
+                        'LoginName': login_name,
+                        'CreateDate': create_date,
+                        'NameC': name_c if name_c else ''
+                    }
+
+    finally:
+        session.close()
+
+
+def lookup_dispatch_rec_users(dispatch_engine: Engine, user_ids: Iterable[str],
+                              start_date: date, end_date: date) -> Dict[str, Tuple]:
+    """
+    直接在 JBHRIS_DISPATCH 以批次 IN 清單查詢 REC_User
+
+    Args:
+        dispatch_engine: JBHRIS_DISPATCH 資料庫引擎
+        user_ids: 要查詢的 UserID（即 backId）
+        start_date: 開始日期
+        end_date: 結束日期
+
+    Returns:
+        UserID 對應 (CreateDate, NameC) 的字典
+    """
+    keys = list(user_ids)
+    sql_query = text(DISPATCH_REC_USERS_SQL).bindparams(bindparam("user_ids", expanding=True))
+
+    SessionLocal = sessionmaker(bind=dispatch_engine)
+    session = SessionLocal()
+
+    try:
+        found = {}
+        for i in range(0, len(keys), IN_LIST_BATCH_SIZE):
+            rows = session.execute(
+                sql_query,
+                {"user_ids": keys[i:i + IN_LIST_BATCH_SIZE], "start_date": start_date, "end_date": end_date}
+            )
+            for row in rows:
+                found[row.UserID] = (row.CreateDate, row.NameC)
+        return found
+
+    finally:
+        session.close()
+
+
+# 預設記憶體上限（MB），超過時用戶資料寫入暫存檔
+MEMORY_BUDGET_MB = float(os.getenv("HIREME_MEMORY_BUDGET_MB", "256"))
+
+
+def user_sort_key(user: Dict) -> date:
+    """
+    用戶依 CreateDate 排序的鍵，沒有日期的用戶排在最前面
+
+    Args:
+        user: 用戶資料字典
+
+    Returns:
+        排序用的日期
+    """
+    return parse_create_date(user['CreateDate']) or date.min
+
+
+def buffer_users(users: Iterable[Dict], memory_budget_mb: float = MEMORY_BUDGET_MB) -> SpillingBuffer:
+    """
+    將用戶串流收集到有記憶體上限的緩衝區，依 CreateDate 排序
+
+    超過上限的部分排序後寫入暫存檔，迭代時合併所有暫存檔，
+    記憶體用量不超過上限；用完後需呼叫 close() 刪除暫存檔
+
+    Args:
+        users: 用戶串流
+        memory_budget_mb: 記憶體上限（MB）
+
+    Returns:
+        依 CreateDate 排序的用戶緩衝區
+    """
+    buffer = SpillingBuffer(int(memory_budget_mb * 1024 * 1024), key=user_sort_key)
+    try:
+        buffer.extend(users)
+    except BaseException:
+        buffer.close()
+        raise
+    if buffer.spilled_runs:
+        logger.info(f"{len(buffer):,} 位用戶超過記憶體上限 {memory_budget_mb} MB，已分成 {buffer.spilled_runs} 個暫存檔")
+    return buffer
+
+
+def query_registered_users(engine: Engine, memory_budget_mb: Optional[float] = None) -> Union[List[Dict], SpillingBuffer]:
+    """
+    查詢註冊用戶資料並全部載入記憶體
+
+    只在需要完整列表時使用，統計報告請改用 iter_registered_users
+
+    Args:
+        engine: 資料庫引擎
+        memory_budget_mb: 記憶體上限（MB），指定時改為返回依 CreateDate 排序、超過上限會寫入暫存檔的緩衝區
+
+    Returns:
+        用戶資料列表（或緩衝區）
+    """
+    try:
+        if memory_budget_mb is not None:
+            users = buffer_users(iter_registered_users(engine), memory_budget_mb)
+        else:
+            users = list(iter_registered_users(engine))
+        logger.info(f"查詢到 {len(users)} 位註冊用戶（email 格式）")
+        return users
 
     except Exception as e:
         logger.error(f"查詢註冊用戶失敗: {e}", exc_info=True)
         return []
 
 
-def query_exported_finished_users(engine: Engine) -> List[Dict]:
+def query_exported_finished_users(engine: Engine,
+                                  memory_budget_mb: Optional[float] = None) -> Union[List[Dict], SpillingBuffer]:
+    """
+    查詢已匯出且已完成的用戶資料（hasExport = 1 and hasFin = 1）並全部載入記憶體
+
+    只在需要完整列表時使用，統計報告請改用 iter_exported_finished_users
+
+    Args:
+        engine: 資料庫引擎
+        memory_budget_mb: 記憶體上限（MB），指定時改為返回依 CreateDate 排序、超過上限會寫入暫存檔的緩衝區
+
+    Returns:
+        用戶資料列表（或緩衝區）
+    """
+    try:
+        if memory_budget_mb is not None:
+            users = buffer_users(iter_exported_finished_users(engine), memory_budget_mb)
+        else:
+            users = list(iter_exported_finished_users(engine))
+        logger.info(f"查詢到 {len(users)} 位已匯出且已完成的用戶（email 格式）")
+        return users
+
+    except Exception as e:
+        logger.error(f"查詢已匯出且已完成的用戶失敗: {e}", exc_info=True)
+        return []
+
+
+def _build_weekly_aggregate_sql(weeks: List[Tuple[str, date, date, str]],
+                                aggregate_columns: List[str], extra_filter: str = "") -> Tuple[str, Dict]:
+    """
+    建立在資料庫端完成 email 過濾與週分組的彙總查詢
+
+    週範圍以 VALUES 資料表傳入並 LEFT JOIN，GROUPING SETS 同時回傳
+    每週一列與總計一列；週範圍不可重疊，否則總計會重複計算。
+
+    Args:
+        weeks: 週的列表，格式同 get_week_ranges()
+        aggregate_columns: SELECT 中的彙總欄位
+        extra_filter: 額外的 WHERE 條件
+
+    Returns:
+        (SQL 語句, 查詢參數)
+    """
+    values = []
+    params = {}
+    for index, (week_desc, week_start, week_end, week_label) in enumerate(weeks):
+        values.append(f"({index}, CAST(:week_start_{index} AS date), CAST(:week_end_{index} AS date))")
+        params[f"week_start_{index}"] = week_start
+        params[f"week_end_{index}"] = week_end
+
+    columns = ",\n        ".join(["GROUPING(w.week_index) AS is_total", "w.week_index"] + aggregate_columns)
+    sql = (
+        f"""
+    SELECT
+        {columns}
+"""
+        + USERS_FROM_SQL
+        + f"""
+    LEFT JOIN (VALUES {", ".join(values)}) AS w(week_index, week_start, week_end)
+        ON CAST(ru.CreateDate AS date) BETWEEN w.week_start AND w.week_end
+"""
+        + USERS_WHERE_SQL
+        + EMAIL_FORMAT_FILTER_SQL
+        + extra_filter
+        + """
+    GROUP BY GROUPING SETS ((w.week_index), ())
+"""
+    )
+    return sql, params
+
+
+def build_weekly_count_sql(weeks: List[Tuple[str, date, date, str]],
+                           exported_finished: bool = False) -> Tuple[str, Dict]:
+    """
+    建立在資料庫端統計每週人數與總人數的查詢
+
+    Args:
+        weeks: 週的列表，格式同 get_week_ranges()
+        exported_finished: 是否只統計已匯出且已完成的用戶
+
+    Returns:
+        (SQL 語句, 查詢參數)
     """
-    查詢已匯出且已完成的用戶資料（hasExport = 1 and hasFin = 1）
+    return _build_weekly_aggregate_sql(
+        weeks,
+        ["COUNT(*) AS user_count"],
+        EXPORTED_FINISHED_FILTER_SQL if exported_finished else ""
+    )
+
+
+def query_weekly_counts(engine: Engine, exported_finished: bool = False) -> Optional[Tuple[int, List[Dict]]]:
+    """
+    在資料庫端統計總人數與各週人數，只傳回每週一列加上總計
 
     Args:
         engine: 資料庫引擎
+        exported_finished: 是否只統計已匯出且已完成的用戶
 
     Returns:
-        用戶資料列表
+        (總人數, 各週統計列表)，如果失敗則返回 None
     """
     try:
-        # 建立 Session
         SessionLocal = sessionmaker(bind=engine)
         session = SessionLocal()
 
         try:
-            from sqlalchemy import text
-
-            sql_query = text("""
-                SELECT
-                    u.Id,
-                    u.LoginName,
-                    ru.CreateDate,
-                    ru.NameC
-                FROM HireMePlz.dbo.[User] u
-                LEFT JOIN HireMePlz.dbo.userResumeTempStatus urts ON u.Id = urts.userId
-                LEFT JOIN JBHRIS_DISPATCH.dbo.REC_User ru ON ru.UserID = urts.backId
-                WHERE ru.CreateDate BETWEEN :start_date AND :end_date
-                AND u.lineUid IS NOT NULL
-                AND urts.hasExport = 1
-                AND urts.hasFin = 1
-            """)
-
-            # 執行查詢
+            weeks = get_week_ranges()
+            sql, params = build_weekly_count_sql(weeks, exported_finished)
             start_date, end_date = get_total_date_range()
-            result = session.execute(
-                sql_query,
-                {"start_date": start_date, "end_date": end_date}
-            )
-            results = result.fetchall()
+            params.update({"start_date": start_date, "end_date": end_date})
 
-            users = []
-            for row in results:
-                login_name = row.LoginName if row.LoginName else ""
-                # 只保留 email 格式的 LoginName
-                if is_email_format(login_name):
-                    users.append({
-                        'Id': row.Id,
-                        'LoginName': login_name,
-                        'CreateDate': row.CreateDate,
-                        'NameC': row.NameC if row.NameC else ''
-                    })
+            total_count = 0
+            counts = [0] * len(weeks)
+            for row in session.execute(text(sql), params).fetchall():
+                if row.is_total:
+                    total_count = row.user_count
+                elif row.week_index is not None:
+                    counts[row.week_index] = row.user_count
+
+            week_counts = []
+            for (week_desc, week_start, week_end, week_label), count in zip(weeks, counts):
+                week_counts.append({
+                    'period': week_desc,
+                    'count': count
+                })
 
-            logger.info(f"查詢到 {len(users)} 位已匯出且已完成的用戶（email 格式）")
-            return users
+            return total_count, week_counts
 
         finally:
             session.close()
 
     except Exception as e:
-        logger.error(f"查詢已匯出且已完成的用戶失敗: {e}", exc_info=True)
+        logger.error(f"資料庫端週統計查詢失敗: {e}", exc_info=True)
+        return None
+
+
+def build_funnel_sql(weeks: List[Tuple[str, date, date, str]],
+                     stages: List[Tuple[str, str, str]] = None) -> Tuple[str, Dict]:
+    """
+    建立以條件彙總一次掃描統計所有漏斗階段的查詢
+
+    Args:
+        weeks: 週的列表，格式同 get_week_ranges()
+        stages: 漏斗階段列表（預設為 FUNNEL_STAGES）
+
+    Returns:
+        (SQL 語句, 查詢參數)
+    """
+    stages = stages or FUNNEL_STAGES
+    columns = [
+        f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END) AS stage_{key}"
+        for key, name, condition in stages
+    ]
+    return _build_weekly_aggregate_sql(weeks, columns)
+
+
+def query_funnel(engine: Engine, stages: List[Tuple[str, str, str]] = None) -> Optional[List[Dict]]:
+    """
+    以單一查詢統計各週與總計的漏斗階段人數
+
+    Args:
+        engine: 資料庫引擎
+        stages: 漏斗階段列表（預設為 FUNNEL_STAGES）
+
+    Returns:
+        每週一列加上最後一列總計，每列包含 period 與各階段人數 counts，如果失敗則返回 None
+    """
+    stages = stages or FUNNEL_STAGES
+    try:
+        SessionLocal = sessionmaker(bind=engine)
+        session = SessionLocal()
+
+        try:
+            weeks = get_week_ranges()
+            sql, params = build_funnel_sql(weeks, stages)
+            start_date, end_date = get_total_date_range()
+            params.update({"start_date": start_date, "end_date": end_date})
+
+            empty = {key: 0 for key, name, condition in stages}
+            week_rows = [dict(empty) for _ in weeks]
+            total_row = dict(empty)
+            for row in session.execute(text(sql), params).fetchall():
+                counts = {key: getattr(row, f"stage_{key}") or 0 for key, name, condition in stages}
+                if row.is_total:
+                    total_row = counts
+                elif row.week_index is not None:
+                    week_rows[row.week_index] = counts
+
+            funnel = [{'period': week[0], 'counts': counts} for week, counts in zip(weeks, week_rows)]
+            funnel.append({'period': f'總計（{format_total_period()}）', 'counts': total_row})
+            return funnel
+
+        finally:
+            session.close()
+
+    except Exception as e:
+        logger.error(f"漏斗統計查詢失敗: {e}", exc_info=True)
+        return None
+
+
+def conversion_rate(count: int, base: int) -> float:
+    """
+    計算轉換率（百分比，四捨五入到小數點後 2 位）
+
+    Args:
+        count: 轉換後人數
+        base: 基準人數
+
+    Returns:
+        轉換率，基準為 0 時返回 0.0
+    """
+    return round(count / base * 100, 2) if base else 0.0
+
+
+def write_funnel_csv_report(funnel: List[Dict], stages: List[Tuple[str, str, str]] = None,
+                            output_file: str = "hireme_funnel_report.csv"):
+    """
+    產生漏斗 CSV 報告，每個階段附上相對前一階段的轉換率
+
+    Args:
+        funnel: query_funnel 的結果
+        stages: 漏斗階段列表（預設為 FUNNEL_STAGES）
+        output_file: 輸出檔案名稱
+    """
+    stages = stages or FUNNEL_STAGES
+    try:
+        header = ['期間']
+        for i, (key, name, condition) in enumerate(stages):
+            header.append(f'{name}人數')
+            if i > 0:
+                header.append(f'{name}轉換率(%)')
+        header.append('整體轉換率(%)')
+
+        with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+
+            for row in funnel:
+                counts = [row['counts'][key] for key, name, condition in stages]
+                values = [row['period']]
+                for i, count in enumerate(counts):
+                    values.append(count)
+                    if i > 0:
+                        values.append(conversion_rate(count, counts[i - 1]))
+                values.append(conversion_rate(counts[-1], counts[0]))
+                writer.writerow(values)
+
+        logger.info(f"漏斗 CSV 報告已產生: {output_file}")
+
+        # 輸出到控制台
+        total = funnel[-1]['counts']
+        print(f"\n{'='*60}")
+        print("HireMe 註冊轉換漏斗報告")
+        print(f"{'='*60}")
+        previous = None
+        for key, name, condition in stages:
+            rate = f"（{conversion_rate(total[key], total[previous])}%）" if previous else ""
+            print(f"{name}：{total[key]:,}{rate}")
+            previous = key
+        print(f"{'='*60}\n")
+        print(f"報告已儲存至: {output_file}\n")
+
+    except Exception as e:
+        logger.error(f"產生漏斗 CSV 報告失敗: {e}", exc_info=True)
+
+
+# NumPy 統計時每批轉換的日期筆數
+NUMPY_CHUNK_SIZE = 100_000
+
+# 1970-01-01 的日序數，用於轉換 datetime64[D]
+_UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_create_date(create_date) -> Optional[date]:
+    """
+    將 CreateDate 欄位值轉換為 date
+
+    Args:
+        create_date: date、datetime 或 "YYYY-MM-DD" 字串
+
+    Returns:
+        轉換後的日期，空值返回 None
+    """
+    if not create_date:
+        return None
+    # datetime 是 date 的子類別，必須先判斷
+    if isinstance(create_date, datetime):
+        return create_date.date()
+    if isinstance(create_date, str):
+        return datetime.strptime(create_date, "%Y-%m-%d").date()
+    return create_date
+
+
+def build_week_finder(weeks: List[Tuple[str, date, date, str]]) -> Callable[[date], Optional[int]]:
+    """
+    建立以二分搜尋找出日期所屬週的函式
+
+    週的開始日期只排序一次，之後每次查詢為 O(log 週數)。
+    weeks 為報告期間的週列表（get_week_ranges() 的結果）時共用快取的索引，不重新建立
+
+    Args:
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        傳入日期、返回所屬週在 weeks 中索引的函式，不屬於任何週時返回 None
+    """
+    period = get_report_period()
+    if tuple(weeks) == build_calendar(*period):
+        return get_bucket_index(*period).find
+    return BucketIndex(weeks).find
+
+
+def _count_dates_python(create_dates: Iterable, weeks: List[Tuple[str, date, date, str]]) -> List[int]:
+    """
+    以純 Python 逐筆統計各週的日期數量
+
+    Args:
+        create_dates: CreateDate 欄位值
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        各週的數量，順序與 weeks 相同
+    """
+    find_week = build_week_finder(weeks)
+
+    counts = [0] * len(weeks)
+    for value in create_dates:
+        create_date = parse_create_date(value)
+        if create_date is None:
+            continue
+
+        week_index = find_week(create_date)
+        if week_index is not None:
+            counts[week_index] += 1
+
+    return counts
+
+
+def _date_ordinal(value) -> int:
+    """將 CreateDate 欄位值轉為日序數，空值返回 -1"""
+    create_date = parse_create_date(value)
+    return create_date.toordinal() if create_date else -1
+
+
+def to_datetime64(create_dates: Sequence) -> "np.ndarray":
+    """
+    將 CreateDate 欄位值一次轉換為 datetime64[D] 陣列
+
+    date 與 datetime 直接取日序數（比 NumPy 逐一解析 Python 物件快得多），
+    只有含字串或空值時才逐筆解析；空值轉為 NaT。
+
+    Args:
+        create_dates: CreateDate 欄位值
+
+    Returns:
+        datetime64[D] 陣列
+    """
+    try:
+        ordinals = np.fromiter(map(date.toordinal, create_dates), dtype=np.int64, count=len(create_dates))
+    except TypeError:
+        ordinals = np.fromiter(map(_date_ordinal, create_dates), dtype=np.int64, count=len(create_dates))
+
+    # datetime64[D] 以 1970-01-01 為 0
+    dates = (ordinals - _UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+    dates[ordinals < 0] = np.datetime64('NaT')
+    return dates
+
+
+def count_datetime64_by_weeks(dates: "np.ndarray", weeks: List[Tuple[str, date, date, str]]) -> List[int]:
+    """
+    以 NumPy 的 searchsorted 與 bincount 統計 datetime64[D] 陣列中各週的日期數量
+
+    Args:
+        dates: datetime64[D] 陣列（NaT 不計入）
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        各週的數量，順序與 weeks 相同
+    """
+    if not weeks:
         return []
 
+    # 依開始日期排序，並記錄原本的位置
+    order = np.argsort(np.array([week[1] for week in weeks], dtype='datetime64[D]'), kind='stable')
+    starts = np.array([weeks[i][1] for i in order], dtype='datetime64[D]')
+    ends = np.array([weeks[i][2] for i in order], dtype='datetime64[D]')
+
+    # 找到開始日期 <= 日期的最後一週，再確認日期沒有超過該週結束日期
+    pos = np.searchsorted(starts, dates, side='right') - 1
+    valid = (pos >= 0) & ~np.isnat(dates)
+    valid[valid] = dates[valid] <= ends[pos[valid]]
+
+    return np.bincount(order[pos[valid]], minlength=len(weeks)).tolist()
+
+
+def _count_dates_numpy(create_dates: Sequence, weeks: List[Tuple[str, date, date, str]]) -> List[int]:
+    """
+    將 CreateDate 欄位值轉為 datetime64[D] 後以 NumPy 統計各週的日期數量
+
+    Args:
+        create_dates: CreateDate 欄位值
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        各週的數量，順序與 weeks 相同
+    """
+    return count_datetime64_by_weeks(to_datetime64(create_dates), weeks)
+
+
+def count_dates_by_weeks(create_dates: Sequence, weeks: List[Tuple[str, date, date, str]],
+                         use_numpy: Optional[bool] = None) -> List[int]:
+    """
+    統計各週的日期數量，已安裝 NumPy 時使用向量化計算
+
+    Args:
+        create_dates: CreateDate 欄位值
+        weeks: 週的列表，格式同 get_week_ranges()
+        use_numpy: 是否使用 NumPy（預設為已安裝時使用；未安裝時一律改用純 Python）
+
+    Returns:
+        各週的數量，順序與 weeks 相同
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+
+    if use_numpy and np is not None:
+        return _count_dates_numpy(create_dates, weeks)
+    return _count_dates_python(create_dates, weeks)
+
+
+def count_users_by_weeks(users: Iterable[Dict], weeks: List[Tuple[str, date, date, str]]) -> List[int]:
+    """
+    單次掃描統計所有週的註冊人數
+
+    每位用戶以二分搜尋找到所屬的週，總成本為 O(用戶數 × log 週數)，
+    不會隨週數線性放大。已安裝 NumPy 時每 NUMPY_CHUNK_SIZE 筆一批向量化計算，
+    記憶體用量只與批次大小有關。
+
+    Args:
+        users: 用戶列表或串流
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        各週的註冊人數，順序與 weeks 相同
+    """
+    create_dates = (user['CreateDate'] for user in users)
+    if np is None:
+        return _count_dates_python(create_dates, weeks)
+
+    counts = [0] * len(weeks)
+    while True:
+        chunk = list(islice(create_dates, NUMPY_CHUNK_SIZE))
+        if not chunk:
+            break
+        for i, count in enumerate(_count_dates_numpy(chunk, weeks)):
+            counts[i] += count
+
+    return counts
+
 
 def count_users_by_week(users: List[Dict], week_start: date, week_end: date) -> int:
     """
@@ -259,44 +921,49 @@ def count_users_by_week(users: List[Dict], week_start: date, week_end: date) ->
     Returns:
         該週的註冊人數
     """
-    count = 0
-    for user in users:
-        if user['CreateDate']:
-            create_date = user['CreateDate']
-            # 如果是 datetime 物件，轉換為 date
-            if isinstance(create_date, datetime):
-                create_date = create_date.date()
-            elif isinstance(create_date, str):
-                create_date = datetime.strptime(create_date, "%Y-%m-%d").date()
+    return count_users_by_weeks(users, [("", week_start, week_end, "")])[0]
 
-            if week_start <= create_date <= week_end:
-                count += 1
 
-    return count
+def summarize_users_by_week(users: Iterable[Dict]) -> Tuple[int, List[Dict]]:
+    """
+    單次掃描計算總人數與各週人數，可直接處理串流資料
 
+    Args:
+        users: 用戶列表或串流
 
-def generate_csv_report(users: List[Dict], output_file: str = "hireme_registration_report.csv"):
+    Returns:
+        (總人數, 各週統計列表)
     """
-    產生 CSV 報告
+    total_count = 0
+
+    def counted() -> Iterator[Dict]:
+        nonlocal total_count
+        for user in users:
+            total_count += 1
+            yield user
+
+    weeks = get_week_ranges()
+    counts = count_users_by_weeks(counted(), weeks)
+    week_counts = []
+    for (week_desc, week_start, week_end, week_label), count in zip(weeks, counts):
+        week_counts.append({
+            'period': week_desc,
+            'count': count
+        })
+
+    return total_count, week_counts
+
+
+def write_csv_report(total_count: int, week_counts: List[Dict], output_file: str = "hireme_registration_report.csv"):
+    """
+    將註冊人數統計寫入 CSV 報告
 
     Args:
-        users: 用戶列表
+        total_count: 總註冊人數
+        week_counts: 各週統計列表
         output_file: 輸出檔案名稱
     """
     try:
-        # 計算總註冊人數
-        total_count = len(users)
-
-        # 取得各週的統計
-        weeks = get_week_ranges()
-        week_counts = []
-        for week_desc, week_start, week_end, week_label in weeks:
-            count = count_users_by_week(users, week_start, week_end)
-            week_counts.append({
-                'period': week_desc,
-                'count': count
-            })
-
         # 寫入 CSV
         with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
             writer = csv.writer(f)
@@ -305,7 +972,7 @@ def generate_csv_report(users: List[Dict], output_file: str = "hireme_registrati
             writer.writerow(['期間', '註冊人數'])
 
             # 寫入總註冊人數
-            writer.writerow([f'總註冊人數（11/17~1/11）', total_count])
+            writer.writerow([f'總註冊人數（{format_total_period()}）', total_count])
 
             # 寫入各週統計
             for week_data in week_counts:
@@ -317,7 +984,7 @@ def generate_csv_report(users: List[Dict], output_file: str = "hireme_registrati
         print(f"\n{'='*60}")
         print("HireMe 註冊人數統計報告")
         print(f"{'='*60}")
-        print(f"總註冊人數（11/17~1/11）：{total_count:,}")
+        print(f"總註冊人數（{format_total_period()}）：{total_count:,}")
         for week_data in week_counts:
             print(f"{week_data['period']}：{week_data['count']:,}")
         print(f"{'='*60}\n")
@@ -327,28 +994,17 @@ def generate_csv_report(users: List[Dict], output_file: str = "hireme_registrati
         logger.error(f"產生 CSV 報告失敗: {e}", exc_info=True)
 
 
-def generate_exported_finished_csv_report(users: List[Dict], output_file: str = "hireme_exported_finished_report.csv"):
+def write_exported_finished_csv_report(total_count: int, week_counts: List[Dict],
+                                       output_file: str = "hireme_exported_finished_report.csv"):
     """
-    產生已匯出且已完成的用戶 CSV 報告
+    將已匯出且已完成的用戶統計寫入 CSV 報告
 
     Args:
-        users: 用戶列表
+        total_count: 總人數
+        week_counts: 各週統計列表
         output_file: 輸出檔案名稱
     """
     try:
-        # 計算總人數
-        total_count = len(users)
-
-        # 取得各週的統計
-        weeks = get_week_ranges()
-        week_counts = []
-        for week_desc, week_start, week_end, week_label in weeks:
-            count = count_users_by_week(users, week_start, week_end)
-            week_counts.append({
-                'period': week_desc,
-                'count': count
-            })
-
         # 寫入 CSV
         with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
             writer = csv.writer(f)
@@ -357,7 +1013,7 @@ def generate_exported_finished_csv_report(users: List[Dict], output_file: str =
             writer.writerow(['期間', '已匯出且已完成人數'])
 
             # 寫入總人數
-            writer.writerow([f'總人數（11/17~1/11）', total_count])
+            writer.writerow([f'總人數（{format_total_period()}）', total_count])
 
             # 寫入各週統計
             for week_data in week_counts:
@@ -369,7 +1025,7 @@ def generate_exported_finished_csv_report(users: List[Dict], output_file: str =
         print(f"\n{'='*60}")
         print("HireMe 已匯出且已完成用戶統計報告")
         print(f"{'='*60}")
-        print(f"總人數（11/17~1/11）：{total_count:,}")
+        print(f"總人數（{format_total_period()}）：{total_count:,}")
         for week_data in week_counts:
             print(f"{week_data['period']}：{week_data['count']:,}")
         print(f"{'='*60}\n")
@@ -379,11 +1035,314 @@ def generate_exported_finished_csv_report(users: List[Dict], output_file: str =
         logger.error(f"產生已匯出且已完成用戶 CSV 報告失敗: {e}", exc_info=True)
 
 
-def main():
+def generate_csv_report(users: Iterable[Dict], output_file: str = "hireme_registration_report.csv"):
+    """
+    產生 CSV 報告
+
+    Args:
+        users: 用戶列表或串流
+        output_file: 輸出檔案名稱
+    """
+    try:
+        total_count, week_counts = summarize_users_by_week(users)
+    except Exception as e:
+        logger.error(f"產生 CSV 報告失敗: {e}", exc_info=True)
+        return
+
+    write_csv_report(total_count, week_counts, output_file)
+
+
+def generate_exported_finished_csv_report(users: Iterable[Dict], output_file: str = "hireme_exported_finished_report.csv"):
+    """
+    產生已匯出且已完成的用戶 CSV 報告
+
+    Args:
+        users: 用戶列表或串流
+        output_file: 輸出檔案名稱
+    """
+    try:
+        total_count, week_counts = summarize_users_by_week(users)
+    except Exception as e:
+        logger.error(f"產生已匯出且已完成用戶 CSV 報告失敗: {e}", exc_info=True)
+        return
+
+    write_exported_finished_csv_report(total_count, week_counts, output_file)
+
+
+def stream_week_summary(users: Iterable[Dict], description: str) -> Optional[Tuple[int, List[Dict]]]:
+    """
+    邊讀取邊統計用戶串流，不保留任何用戶資料
+
+    Args:
+        users: 用戶串流
+        description: 用於日誌的查詢描述
+
+    Returns:
+        (總人數, 各週統計列表)，如果查詢失敗則返回 None
+    """
+    try:
+        total_count, week_counts = summarize_users_by_week(users)
+    except Exception as e:
+        logger.error(f"查詢{description}失敗: {e}", exc_info=True)
+        return None
+
+    logger.info(f"查詢到 {total_count} 位{description}（email 格式）")
+    return total_count, week_counts
+
+
+# 匯出用戶明細的欄位、寫入緩衝大小與進度回報間隔
+EXPORT_FIELDS = ['Id', 'LoginName', 'CreateDate', 'NameC']
+EXPORT_BUFFER_SIZE = 1024 * 1024
+EXPORT_PROGRESS_INTERVAL = 100_000
+# 分週匯出時同時開啟的檔案數上限（每個檔案各有 EXPORT_BUFFER_SIZE 的緩衝區）
+EXPORT_MAX_OPEN_FILES = 4
+
+
+def shard_output_file(output_file: str, week_label: str) -> str:
+    """
+    取得分週匯出時某一週的檔案名稱
+
+    Args:
+        output_file: 匯出檔案名稱
+        week_label: 週標籤，例如 "2025-11-第3週"
+
+    Returns:
+        例如 hireme_users_2025-11-第3週.csv
+    """
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{week_label}{ext or '.csv'}"
+
+
+def export_users_csv(users: Iterable[Dict], output_file: str = "hireme_users.csv",
+                     shard_by_week: bool = False,
+                     progress_interval: int = EXPORT_PROGRESS_INTERVAL,
+                     max_open_files: int = EXPORT_MAX_OPEN_FILES) -> Optional[Dict[str, int]]:
+    """
+    將用戶串流逐列寫入 CSV 明細，不保留任何用戶資料
+
+    分週匯出時最多同時開啟 max_open_files 個檔案，超過時關閉最久沒有寫入的檔案，
+    之後再寫入同一週時以附加模式重新開啟；用戶依 CreateDate 排序時每個檔案只會開啟一次
+
+    Args:
+        users: 用戶串流（需要 Id、LoginName、CreateDate、NameC）
+        output_file: 匯出檔案名稱，分週匯出時作為檔名前綴
+        shard_by_week: 是否依 CreateDate 所屬週分檔
+        progress_interval: 每匯出多少位用戶回報一次進度
+        max_open_files: 分週匯出時同時開啟的檔案數上限
+
+    Returns:
+        各檔案名稱對應匯出的用戶數，如果失敗則返回 None
+    """
+    if progress_interval <= 0:
+        raise ValueError("進度回報間隔必須大於 0")
+    if max_open_files <= 0:
+        raise ValueError("同時開啟的檔案數必須大於 0")
+
+    weeks = get_week_ranges()
+    find_week = build_week_finder(weeks)
+    # 不屬於任何週的用戶寫入獨立檔案，避免遺漏
+    unassigned_file = shard_output_file(output_file, "未分週")
+
+    # 依最近寫入的順序保存開啟中的檔案，最前面的是最久沒有寫入的
+    open_files: "OrderedDict[str, Tuple]" = OrderedDict()
+    written: Dict[str, int] = {}
+
+    def get_writer(path: str):
+        entry = open_files.get(path)
+        if entry is not None:
+            open_files.move_to_end(path)
+            return entry[1]
+
+        if len(open_files) >= max_open_files:
+            _, (oldest, _) = open_files.popitem(last=False)
+            oldest.close()
+
+        if path in written:
+            # 之前因為上限關閉的檔案，附加寫入且不重複標題與 BOM
+            f = open(path, 'a', newline='', encoding='utf-8', buffering=EXPORT_BUFFER_SIZE)
+            writer = csv.writer(f)
+        else:
+            # 分週檔案在第一次寫入時才建立
+            f = open(path, 'w', newline='', encoding='utf-8-sig', buffering=EXPORT_BUFFER_SIZE)
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_FIELDS)
+            written[path] = 0
+        open_files[path] = (f, writer)
+        return writer
+
+    try:
+        try:
+            if not shard_by_week:
+                get_writer(output_file)
+
+            total = 0
+            started = time.monotonic()
+            for user in users:
+                path = output_file
+                if shard_by_week:
+                    create_date = parse_create_date(user['CreateDate'])
+                    week_index = find_week(create_date) if create_date else None
+                    path = shard_output_file(output_file, weeks[week_index][3]) if week_index is not None else unassigned_file
+
+                get_writer(path).writerow([user[field] for field in EXPORT_FIELDS])
+                written[path] += 1
+                total += 1
+
+                if total % progress_interval == 0:
+                    elapsed = time.monotonic() - started
+                    logger.info(f"已匯出 {total:,} 位用戶（{total / elapsed if elapsed else 0:,.0f} 筆/秒）")
+        finally:
+            for f, _ in open_files.values():
+                f.close()
+
+        logger.info(f"用戶明細匯出完成，共 {total:,} 位用戶，{len(written)} 個檔案")
+        return written
+
+    except Exception as e:
+        logger.error(f"匯出用戶明細失敗: {e}", exc_info=True)
+        return None
+
+
+def report_summary(engine: Engine, mode: str, exported_finished: bool = False,
+                   lookup: Optional[Callable] = None,
+                   batch_size: int = FETCH_BATCH_SIZE,
+                   memory_budget_mb: Optional[float] = None) -> Optional[Tuple[int, List[Dict]]]:
+    """
+    依執行模式取得報告的總人數與各週人數
+
+    stream、snapshot、federated 模式逐批統計，記憶體中最多只有一批用戶；
+    arrow 模式需要完整的資料表，超過記憶體上限的部分寫入暫存檔後以 memory map 統計
+
+    Args:
+        engine: HireMePlz 資料庫引擎
+        mode: 執行模式（aggregate、stream、arrow、snapshot、federated）
+        exported_finished: 是否只統計已匯出且已完成的用戶
+        lookup: snapshot 與 federated 模式使用的 REC_User 查詢函式
+        batch_size: 每批讀取的筆數
+        memory_budget_mb: arrow 模式的記憶體上限（MB，None 表示不限制）
+
+    Returns:
+        (總人數, 各週統計列表)，如果失敗則返回 None
+    """
+    if mode == "aggregate":
+        return query_weekly_counts(engine, exported_finished)
+
+    description = "已匯出且已完成的用戶" if exported_finished else "註冊用戶"
+    if mode == "arrow":
+        # 避免與 hireme_arrow 互相匯入
+        from hireme_arrow import fetch_users_arrow, count_table_by_weeks
+
+        budget = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb is not None else None
+        try:
+            with tempfile.TemporaryDirectory(prefix="hireme_arrow_") as spill_dir:
+                table = fetch_users_arrow(engine, exported_finished, batch_size, budget, spill_dir)
+                total_count, week_counts = count_table_by_weeks(table, get_week_ranges())
+                # 先釋放 memory map 才能刪除暫存檔
+                del table
+        except Exception as e:
+            logger.error(f"查詢{description}失敗: {e}", exc_info=True)
+            return None
+
+        logger.info(f"查詢到 {total_count} 位{description}（email 格式）")
+        return total_count, week_counts
+
+    if lookup is not None:
+        users = iter_users_with_rec_lookup(engine, lookup, exported_finished, batch_size)
+    elif exported_finished:
+        users = iter_exported_finished_users(engine, batch_size)
+    else:
+        users = iter_registered_users(engine, batch_size)
+
+    return stream_week_summary(users, description)
+
+
+def positive_int(value: str) -> int:
+    """
+    argparse 使用的正整數型別
+
+    Args:
+        value: 命令列參數值
+
+    Returns:
+        大於 0 的整數
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必須是整數: {value}")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"必須大於 0: {value}")
+    return number
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    解析命令列參數
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
+
+    Returns:
+        解析後的參數
+    """
+    parser = argparse.ArgumentParser(description="HireMe 註冊人數統計報告")
+    parser.add_argument(
+        "--mode",
+        choices=["aggregate", "stream", "arrow", "snapshot", "federated"],
+        default="aggregate",
+        help=(
+            "aggregate: 在資料庫端完成週統計（預設）；stream: 逐列串流後在本機統計；"
+            "arrow: 以 Arrow 欄式緩衝區讀取後在欄位上統計與匯出（需要 pyarrow）；"
+            "snapshot: 使用本機 REC_User 快照 JOIN（先執行 rec_user_snapshot.py 同步）；"
+            "federated: 分別查詢 HireMePlz 與 JBHRIS_DISPATCH 後在本機 JOIN"
+        )
+    )
+    parser.add_argument("--snapshot-db", default=None, help="snapshot 模式使用的快照檔案路徑")
+    parser.add_argument("--funnel", action="store_true", help="另外產生註冊→匯出→完成的漏斗報告（單一查詢）")
+    parser.add_argument(
+        "--batch-size",
+        type=positive_int,
+        default=FETCH_BATCH_SIZE,
+        help="串流模式每批讀取的筆數，也是本機 JOIN 時同時保留在記憶體中的最大用戶數"
+    )
+
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=float,
+        default=MEMORY_BUDGET_MB,
+        help="需要保留用戶資料時（arrow 模式與 --sort-by-date）的記憶體上限（MB），超過時寫入暫存檔（預設讀取 HIREME_MEMORY_BUDGET_MB）"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    export_parser = subparsers.add_parser("export-users", help="串流匯出週統計背後的用戶明細 CSV")
+    export_parser.add_argument("--output", default="hireme_users.csv", help="匯出檔案名稱（分週匯出時為檔名前綴）")
+    export_parser.add_argument("--exported-finished", action="store_true", help="只匯出已匯出且已完成的用戶")
+    export_parser.add_argument("--shard-by-week", action="store_true", help="依註冊週分成多個檔案")
+    export_parser.add_argument(
+        "--sort-by-date",
+        action="store_true",
+        help="依 CreateDate 排序後匯出（超過 --memory-budget-mb 的部分會暫存到磁碟）"
+    )
+    export_parser.add_argument(
+        "--progress-interval",
+        type=positive_int,
+        default=EXPORT_PROGRESS_INTERVAL,
+        help="每匯出多少位用戶回報一次進度"
+    )
+    args = parser.parse_args(argv)
+    if args.command == "export-users" and args.mode == "arrow" and args.shard_by_week:
+        parser.error("arrow 模式不支援 --shard-by-week")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
     """
     主函數
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
     """
-    logger.info("開始產生 HireMe 註冊人數統計報告")
+    args = parse_args(argv)
 
     # 創建資料庫引擎
     engine = get_db_engine("HireMePlz")
@@ -391,30 +1350,98 @@ def main():
         logger.error("無法創建資料庫引擎，程式結束")
         return
 
-    try:
-        # 查詢註冊用戶
-        users = query_registered_users(engine)
+    if args.command == "export-users":
+        try:
+            logger.info(f"開始匯出 HireMe 用戶明細: {args.output}")
+            if args.mode == "arrow":
+                # 避免與 hireme_arrow 互相匯入
+                from hireme_arrow import export_users_arrow
+
+                written = export_users_arrow(engine, args.output, args.exported_finished,
+                                             args.sort_by_date, args.batch_size,
+                                             int(args.memory_budget_mb * 1024 * 1024))
+            else:
+                if args.exported_finished:
+                    users = iter_exported_finished_users(engine, args.batch_size)
+                else:
+                    users = iter_registered_users(engine, args.batch_size)
+
+                with ExitStack() as stack:
+                    if args.sort_by_date:
+                        # 排序需要保留所有用戶，以記憶體上限內的緩衝區做外部排序
+                        users = stack.enter_context(buffer_users(users, args.memory_budget_mb))
+                    written = export_users_csv(users, args.output, args.shard_by_week, args.progress_interval)
+            if written is not None:
+                print(f"\n已匯出 {sum(written.values()):,} 位用戶（email 格式）")
+                for path, count in written.items():
+                    print(f"{path}：{count:,}")
+                print()
 
-        if not users:
+        finally:
+            engine.dispose()
+            logger.info("資料庫引擎已關閉")
+        return
+
+    logger.info(f"開始產生 HireMe 註冊人數統計報告（模式: {args.mode}）")
+
+    snapshot_engine = None
+    dispatch_engine = None
+    lookup = None
+
+    try:
+        if args.mode == "snapshot":
+            from rec_user_snapshot import get_snapshot_engine, get_snapshot_age, lookup_rec_users, format_age
+
+            snapshot_engine = get_snapshot_engine(args.snapshot_db)
+            age = get_snapshot_age(snapshot_engine)
+            if age is None:
+                logger.warning("REC_User 快照從未同步，請先執行 rec_user_snapshot.py")
+            else:
+                logger.info(f"使用 REC_User 快照，快照年齡: {format_age(age)}")
+            lookup = partial(lookup_rec_users, snapshot_engine)
+
+        elif args.mode == "federated":
+            dispatch_engine = get_db_engine("JBHRIS_DISPATCH")
+            if not dispatch_engine:
+                logger.error("無法創建 JBHRIS_DISPATCH 資料庫引擎，程式結束")
+                return
+            lookup = partial(lookup_dispatch_rec_users, dispatch_engine)
+
+        # 統計註冊用戶，不將用戶列表載入記憶體
+        summary = report_summary(engine, args.mode, lookup=lookup, batch_size=args.batch_size,
+                                 memory_budget_mb=args.memory_budget_mb)
+
+        if not summary or summary[0] == 0:
             logger.warning("未查詢到任何註冊用戶")
             print("\n未查詢到任何註冊用戶（email 格式）\n")
         else:
             # 產生 CSV 報告
-            generate_csv_report(users)
+            write_csv_report(*summary)
 
-        # 查詢已匯出且已完成的用戶
-        exported_finished_users = query_exported_finished_users(engine)
+        # 統計已匯出且已完成的用戶
+        summary = report_summary(engine, args.mode, exported_finished=True, lookup=lookup,
+                                 batch_size=args.batch_size, memory_budget_mb=args.memory_budget_mb)
 
-        if not exported_finished_users:
+        if not summary or summary[0] == 0:
             logger.warning("未查詢到任何已匯出且已完成的用戶")
             print("\n未查詢到任何已匯出且已完成的用戶（email 格式）\n")
         else:
             # 產生已匯出且已完成的用戶 CSV 報告
-            generate_exported_finished_csv_report(exported_finished_users)
+            write_exported_finished_csv_report(*summary)
+
+        if args.funnel:
+            # 以單一條件彙總查詢統計所有漏斗階段
+            funnel = query_funnel(engine)
+            if funnel:
+                write_funnel_csv_report(funnel)
 
     finally:
         # 關閉資料庫引擎
         engine.dispose()
+        if snapshot_engine is not None:
+            snapshot_engine.dispose()
+        if dispatch_engine is not None:
+            dispatch_engine.dispose()
         logger.info("資料庫引擎已關閉")
 
 
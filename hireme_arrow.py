@@ -0,0 +1,339 @@
+"""
+HireMe 用戶資料的 Arrow 欄式讀取
+查詢結果直接寫入欄式緩衝區，不為每位用戶建立 Python dict：
+Id 以 16 bytes 固定長度二進位儲存、CreateDate 為 timestamp、名稱為字串欄位，
+統計與 CSV 輸出都直接在欄位上進行
+
+需要安裝 pyarrow（選用套件）
+"""
+
+import os
+import codecs
+import logging
+import uuid
+import tempfile
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from hireme import (
+    REGISTERED_USERS_SQL,
+    EXPORTED_FINISHED_USERS_SQL,
+    EMAIL_PATTERN,
+    FETCH_BATCH_SIZE,
+    count_datetime64_by_weeks,
+    np
+)
+from week_range import get_total_date_range
+
+# pyarrow 為選用套件
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+except ImportError:
+    pa = None
+
+logger = logging.getLogger("hireme_arrow")
+
+# HireMe 的 Id 為 GUID，以 16 bytes 儲存
+ID_BYTES = 16
+
+# 32 字元十六進位，或以連字號分隔的 8-4-4-4-12 GUID
+GUID_PATTERN = (r'^(?:[0-9A-Fa-f]{32}'
+                r'|[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12})$')
+
+
+def user_schema() -> "pa.Schema":
+    """
+    用戶資料的欄式結構
+
+    Returns:
+        Arrow schema
+    """
+    return pa.schema([
+        ('Id', pa.binary(ID_BYTES)),
+        ('LoginName', pa.string()),
+        ('CreateDate', pa.timestamp('us')),
+        ('NameC', pa.string()),
+    ])
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Arrow 欄式讀取需要安裝 pyarrow：pip install pyarrow")
+
+
+def _id_strings(ids: Tuple) -> "pa.StringArray":
+    """
+    將一批 Id 轉為字串欄位
+
+    驅動程式通常回傳 GUID 字串，直接建立欄位；回傳 uuid.UUID 時才逐筆轉換，
+    其他型別視為 NULL
+
+    Args:
+        ids: 資料庫回傳的 Id
+
+    Returns:
+        字串欄位
+    """
+    try:
+        return pa.array(ids, pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        return pa.array([value.hex if isinstance(value, uuid.UUID) else value if isinstance(value, str) else None
+                         for value in ids], pa.string())
+
+
+def encode_ids(ids: Tuple[str, ...]) -> "pa.FixedSizeBinaryArray":
+    """
+    將一批 GUID 字串轉為固定長度二進位欄位
+
+    整批串接後一次解碼為連續緩衝區，不逐筆建立 bytes 物件
+
+    Args:
+        ids: 32 字元十六進位或含連字號的 GUID 字串
+
+    Returns:
+        每筆 16 bytes 的二進位欄位
+
+    Raises:
+        ValueError: 任一 Id 不是 GUID 格式
+    """
+    hex_ids = [value.replace('-', '') for value in ids]
+    # 逐筆檢查長度，避免長短不一的 Id 合計剛好是 16 bytes 的倍數而錯位
+    for value, hex_id in zip(ids, hex_ids):
+        if len(hex_id) != ID_BYTES * 2:
+            raise ValueError(f"Id 必須是 GUID 格式才能以固定長度二進位儲存: {value!r}")
+    return _ids_from_hex(''.join(hex_ids), len(ids))
+
+
+def _ids_from_hex(joined: str, count: int) -> "pa.FixedSizeBinaryArray":
+    """將串接的十六進位字串一次解碼為 count 筆 16 bytes 的二進位欄位"""
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(ID_BYTES), count, [None, pa.py_buffer(bytes.fromhex(joined))])
+
+
+def decode_ids(ids: "pa.Array") -> "pa.LargeStringArray":
+    """
+    將固定長度二進位 Id 欄位轉回 32 字元小寫十六進位字串欄位
+
+    直接由資料緩衝區產生字串欄位的資料與位移，不逐筆建立字串物件
+
+    Args:
+        ids: 固定長度二進位欄位（不可含 null）
+
+    Returns:
+        字串欄位
+    """
+    if isinstance(ids, pa.ChunkedArray):
+        ids = ids.combine_chunks()
+    count = len(ids)
+    raw = ids.buffers()[1][ids.offset * ID_BYTES:(ids.offset + count) * ID_BYTES].to_pybytes()
+
+    # 每個 Id 固定 32 個字元，位移為等差數列
+    width = ID_BYTES * 2
+    if np is not None:
+        offsets = pa.py_buffer(np.arange(0, (count + 1) * width, width, dtype=np.int64))
+    else:
+        offsets = pa.array(range(0, (count + 1) * width, width), pa.int64()).buffers()[1]
+
+    return pa.LargeStringArray.from_buffers(count, offsets, pa.py_buffer(raw.hex().encode('ascii')))
+
+
+def _record_batch(rows) -> Optional["pa.RecordBatch"]:
+    """
+    將一批查詢結果轉置為欄位並過濾 email 格式
+
+    email 格式與 Id 格式都以欄位運算檢查後一次過濾；
+    Id 為 NULL 或不是 GUID 格式的用戶略過並記錄，不中斷整份報告
+
+    Args:
+        rows: 查詢結果列（Id, LoginName, CreateDate, NameC）
+
+    Returns:
+        過濾後的 RecordBatch，沒有資料時返回 None
+    """
+    ids, login_names, create_dates, names = zip(*rows)
+
+    login_names = pa.array(login_names, pa.string())
+    id_strings = _id_strings(ids)
+    is_email = pc.fill_null(pc.match_substring_regex(login_names, EMAIL_PATTERN), False)
+    # 先以長度排除大部分不符的 Id，再檢查十六進位與連字號位置
+    is_guid = pc.fill_null(pc.and_(
+        pc.is_in(pc.utf8_length(id_strings), pa.array([ID_BYTES * 2, ID_BYTES * 2 + 4], pa.int32())),
+        pc.match_substring_regex(id_strings, GUID_PATTERN)
+    ), False)
+
+    invalid = pc.sum(pc.and_(is_email, pc.invert(is_guid))).as_py() or 0
+    if invalid:
+        logger.warning(f"略過 {invalid} 位 Id 不是 GUID 格式的用戶")
+
+    mask = pc.and_(is_email, is_guid)
+    count = pc.sum(mask).as_py() or 0
+    if not count:
+        return None
+
+    hex_ids = pc.replace_substring(id_strings.filter(mask), '-', '')
+    # 串接成一個字串後一次解碼為連續緩衝區
+    joined = pc.binary_join(pa.ListArray.from_arrays(pa.array([0, count], pa.int32()), hex_ids), '')[0].as_py()
+    return pa.RecordBatch.from_arrays(
+        [
+            _ids_from_hex(joined, count),
+            login_names.filter(mask),
+            pa.array(create_dates, pa.timestamp('us')).filter(mask),
+            pc.fill_null(pa.array(names, pa.string()).filter(mask), ''),
+        ],
+        schema=user_schema()
+    )
+
+
+def fetch_users_arrow(engine: Engine, exported_finished: bool = False,
+                      batch_size: int = FETCH_BATCH_SIZE, memory_budget_bytes: Optional[int] = None,
+                      spill_dir: Optional[str] = None) -> "pa.Table":
+    """
+    以伺服器端游標分批讀取用戶，直接組成 Arrow 資料表
+
+    指定記憶體上限時，已讀取的資料超過上限後改為逐批寫入 spill_dir 的 Arrow IPC 檔案，
+    最後以 memory map 開啟，資料表不佔用額外的記憶體；呼叫端需在資料表用完後才刪除 spill_dir
+
+    Args:
+        engine: 資料庫引擎
+        exported_finished: 是否只查詢已匯出且已完成的用戶
+        batch_size: 每批讀取的筆數
+        memory_budget_bytes: 記憶體中資料的上限（bytes，None 表示不限制）
+        spill_dir: 超過上限時寫入暫存檔的目錄（指定記憶體上限時必須提供）
+
+    Returns:
+        欄位為 Id、LoginName、CreateDate、NameC 的 Arrow 資料表
+    """
+    _require_pyarrow()
+    if memory_budget_bytes is not None and spill_dir is None:
+        raise ValueError("指定記憶體上限時必須提供暫存目錄")
+    sql = EXPORTED_FINISHED_USERS_SQL if exported_finished else REGISTERED_USERS_SQL
+
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+
+    spill_path = None
+    writer = None
+    try:
+        start_date, end_date = get_total_date_range()
+        result = session.execute(
+            text(sql),
+            {"start_date": start_date, "end_date": end_date},
+            execution_options={"stream_results": True}
+        )
+
+        batches = []
+        size = 0
+        for rows in result.partitions(batch_size):
+            batch = _record_batch(rows)
+            if batch is None:
+                continue
+            if writer is not None:
+                writer.write_batch(batch)
+                continue
+            batches.append(batch)
+            size += batch.nbytes
+            if memory_budget_bytes is not None and size > memory_budget_bytes:
+                spill_path = os.path.join(spill_dir, "users.arrow")
+                writer = pa_ipc.new_file(spill_path, user_schema())
+                for spilled in batches:
+                    writer.write_batch(spilled)
+                logger.info(f"用戶資料超過記憶體上限 {memory_budget_bytes:,} bytes，改為寫入暫存檔 {spill_path}")
+                batches = []
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            table = pa_ipc.open_file(pa.memory_map(spill_path)).read_all()
+        else:
+            table = pa.Table.from_batches(batches, schema=user_schema())
+        logger.info(f"以欄式格式讀取 {table.num_rows} 位用戶，共 {table.nbytes:,} bytes")
+        return table
+
+    finally:
+        if writer is not None:
+            writer.close()
+        session.close()
+
+
+def count_table_by_weeks(table: "pa.Table", weeks: List[Tuple[str, date, date, str]]) -> Tuple[int, List[Dict]]:
+    """
+    直接在 CreateDate 欄位上統計總人數與各週人數
+
+    Args:
+        table: fetch_users_arrow 的結果
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        (總人數, 各週統計列表)
+    """
+    create_dates = table.column('CreateDate').cast(pa.date32())
+
+    if np is not None:
+        counts = count_datetime64_by_weeks(create_dates.to_numpy(), weeks)
+    else:
+        counts = [
+            pc.sum(pc.and_(pc.greater_equal(create_dates, pa.scalar(start, pa.date32())),
+                           pc.less_equal(create_dates, pa.scalar(end, pa.date32())))).as_py() or 0
+            for _, start, end, _ in weeks
+        ]
+
+    week_counts = []
+    for (week_desc, week_start, week_end, week_label), count in zip(weeks, counts):
+        week_counts.append({
+            'period': week_desc,
+            'count': count
+        })
+    return table.num_rows, week_counts
+
+
+def write_users_csv_arrow(table: "pa.Table", output_file: str):
+    """
+    直接由欄位寫出用戶明細 CSV（Id 轉回十六進位字串）
+
+    Args:
+        table: fetch_users_arrow 的結果
+        output_file: 輸出檔案名稱
+    """
+    output = table.set_column(0, 'Id', decode_ids(table.column('Id')))
+    with open(output_file, 'wb') as f:
+        # 與其他報告相同，加上 BOM 讓 Excel 正確辨識 UTF-8
+        f.write(codecs.BOM_UTF8)
+        pa_csv.write_csv(output, f)
+    logger.info(f"用戶明細 CSV 已產生: {output_file}")
+
+
+def export_users_arrow(engine: Engine, output_file: str = "hireme_users.csv", exported_finished: bool = False,
+                       sort_by_date: bool = False, batch_size: int = FETCH_BATCH_SIZE,
+                       memory_budget_bytes: Optional[int] = None) -> Optional[Dict[str, int]]:
+    """
+    以欄式格式讀取用戶並匯出明細 CSV
+
+    Args:
+        engine: 資料庫引擎
+        output_file: 匯出檔案名稱
+        exported_finished: 是否只匯出已匯出且已完成的用戶
+        sort_by_date: 是否依 CreateDate 排序後匯出（排序後的資料表在記憶體中建立，不受記憶體上限限制）
+        batch_size: 每批讀取的筆數
+        memory_budget_bytes: 讀取時記憶體中資料的上限（bytes，None 表示不限制）
+
+    Returns:
+        檔案名稱對應匯出的用戶數，如果失敗則返回 None
+    """
+    try:
+        with tempfile.TemporaryDirectory(prefix="hireme_arrow_") as spill_dir:
+            table = fetch_users_arrow(engine, exported_finished, batch_size, memory_budget_bytes, spill_dir)
+            if sort_by_date:
+                table = table.sort_by('CreateDate')
+            write_users_csv_arrow(table, output_file)
+            count = table.num_rows
+            # 先釋放 memory map 才能刪除暫存檔
+            del table
+        return {output_file: count}
+
+    except Exception as e:
+        logger.error(f"匯出用戶明細失敗: {e}", exc_info=True)
+        return None
@@ -0,0 +1,344 @@
+"""
+HireMe 註冊用戶登入追蹤報告
+統計每週註冊的用戶之後各週實際登入的人數，產生留存（retention）格式的 CSV 報告
+
+用戶 ID 先對應為連續整數，每週與每份報告各以一個點陣圖表示，
+交集、聯集與差集都以點陣圖運算完成，不需比對 32 字元的 ID 字串集合
+"""
+
+import csv
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from hireme import get_db_engine, iter_registered_users, build_week_finder, parse_create_date
+from membership_DB_for_login import AbpAuditLogs, get_db_engine as get_membership_db_engine
+from week_range import get_week_ranges
+
+logger = logging.getLogger("hireme_cohort")
+
+
+def normalize_user_id(user_id) -> str:
+    """
+    統一用戶 ID 格式
+
+    HireMe 的 Id 為 32 字元小寫十六進位，AbpAuditLogs.UserId 為含連字號的 GUID，
+    兩者去掉連字號並轉小寫後即可比對
+
+    Args:
+        user_id: 原始用戶 ID
+
+    Returns:
+        正規化後的用戶 ID
+    """
+    return str(user_id).replace('-', '').lower()
+
+
+class UserIdIndex:
+    """將用戶 ID 對應為從 0 開始的連續整數"""
+
+    def __init__(self):
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, user_id) -> int:
+        """
+        取得用戶 ID 的整數位置，第一次出現時配置新位置
+
+        Args:
+            user_id: 用戶 ID
+
+        Returns:
+            整數位置
+        """
+        key = normalize_user_id(user_id)
+        position = self._positions.get(key)
+        if position is None:
+            position = len(self._positions)
+            self._positions[key] = position
+        return position
+
+    def get(self, user_id) -> Optional[int]:
+        """
+        查詢用戶 ID 的整數位置，不配置新位置
+
+        Args:
+            user_id: 用戶 ID
+
+        Returns:
+            整數位置，沒有配置過時返回 None
+        """
+        return self._positions.get(normalize_user_id(user_id))
+
+
+class UserBitmap:
+    """
+    以位元表示用戶集合的點陣圖
+
+    建立時寫入可變的 bytearray（每位用戶 1 bit），集合運算時轉為 Python 整數
+    以 C 實作的位元運算一次處理整個集合
+    """
+
+    __slots__ = ('_buffer',)
+
+    def __init__(self, buffer: bytes = b''):
+        self._buffer = bytearray(buffer)
+
+    @classmethod
+    def _from_int(cls, value: int) -> "UserBitmap":
+        return cls(value.to_bytes((value.bit_length() + 7) // 8, 'little'))
+
+    def _as_int(self) -> int:
+        return int.from_bytes(self._buffer, 'little')
+
+    def add(self, position: int) -> None:
+        """
+        加入一個整數位置
+
+        Args:
+            position: UserIdIndex 配置的整數位置
+        """
+        byte_index, bit = divmod(position, 8)
+        if byte_index >= len(self._buffer):
+            self._buffer.extend(bytes(byte_index - len(self._buffer) + 1))
+        self._buffer[byte_index] |= 1 << bit
+
+    def __contains__(self, position: int) -> bool:
+        byte_index, bit = divmod(position, 8)
+        return byte_index < len(self._buffer) and bool(self._buffer[byte_index] >> bit & 1)
+
+    def __len__(self) -> int:
+        return self._as_int().bit_count()
+
+    def __and__(self, other: "UserBitmap") -> "UserBitmap":
+        return UserBitmap._from_int(self._as_int() & other._as_int())
+
+    def __or__(self, other: "UserBitmap") -> "UserBitmap":
+        return UserBitmap._from_int(self._as_int() | other._as_int())
+
+    def __sub__(self, other: "UserBitmap") -> "UserBitmap":
+        return UserBitmap._from_int(self._as_int() & ~other._as_int())
+
+    def nbytes(self) -> int:
+        """點陣圖佔用的位元組數"""
+        return len(self._buffer)
+
+
+def build_registration_bitmaps(users: Iterable[Dict], index: UserIdIndex,
+                               weeks: List[Tuple[str, date, date, str]]) -> Tuple[UserBitmap, List[UserBitmap]]:
+    """
+    單次掃描建立註冊用戶的點陣圖
+
+    Args:
+        users: 用戶列表或串流（需要 Id 與 CreateDate）
+        index: 用戶 ID 索引
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        (所有註冊用戶點陣圖, 各週註冊用戶點陣圖)
+    """
+    find_week = build_week_finder(weeks)
+    total = UserBitmap()
+    by_week = [UserBitmap() for _ in weeks]
+
+    for user in users:
+        position = index.add(user['Id'])
+        total.add(position)
+
+        create_date = parse_create_date(user['CreateDate'])
+        week_index = find_week(create_date) if create_date else None
+        if week_index is not None:
+            by_week[week_index].add(position)
+
+    return total, by_week
+
+
+def build_login_bitmaps(weekly_user_ids: Iterable[Iterable[str]], index: UserIdIndex) -> List[UserBitmap]:
+    """
+    建立各週登入用戶的點陣圖
+
+    只記錄索引中已有的（註冊）用戶，其他登入用戶略過，點陣圖大小不超過註冊人數
+
+    Args:
+        weekly_user_ids: 每週一個登入用戶 ID 的串流，順序與週列表相同
+        index: 已建立註冊用戶位置的用戶 ID 索引
+
+    Returns:
+        各週登入用戶點陣圖
+    """
+    bitmaps = []
+    for user_ids in weekly_user_ids:
+        bitmap = UserBitmap()
+        for user_id in user_ids:
+            position = index.get(user_id)
+            if position is not None:
+                bitmap.add(position)
+        bitmaps.append(bitmap)
+    return bitmaps
+
+
+def compute_retention(registered: UserBitmap, registered_by_week: List[UserBitmap],
+                      logins_by_week: List[UserBitmap],
+                      weeks: List[Tuple[str, date, date, str]]) -> List[Dict]:
+    """
+    計算每個註冊週群組在各週的登入人數
+
+    Args:
+        registered: 所有註冊用戶點陣圖
+        registered_by_week: 各週註冊用戶點陣圖
+        logins_by_week: 各週登入用戶點陣圖
+        weeks: 週的列表，格式同 get_week_ranges()
+
+    Returns:
+        每個群組一列的統計，最後一列為所有註冊用戶
+    """
+    ever_logged_in = UserBitmap()
+    for bitmap in logins_by_week:
+        ever_logged_in = ever_logged_in | bitmap
+
+    cohorts = [(week[0], bitmap) for week, bitmap in zip(weeks, registered_by_week)]
+    cohorts.append(("全部註冊用戶", registered))
+
+    rows = []
+    for period, cohort in cohorts:
+        size = len(cohort)
+        logged_in = len(cohort & ever_logged_in)
+        rows.append({
+            'period': period,
+            'registered': size,
+            'logged_in': logged_in,
+            'never_logged_in': len(cohort - ever_logged_in),
+            'login_rate': round(logged_in / size * 100, 2) if size else 0.0,
+            'weekly': [len(cohort & logins) for logins in logins_by_week]
+        })
+    return rows
+
+
+def iter_weekly_login_user_ids(engine: Engine, week_start: date, week_end: date) -> Iterator[str]:
+    """
+    串流查詢指定週內成功登入的不重複用戶 ID
+
+    Args:
+        engine: JbJobMembership 資料庫引擎
+        week_start: 週開始日期
+        week_end: 週結束日期
+
+    Yields:
+        用戶 ID
+    """
+    start_datetime = datetime.combine(week_start, datetime.min.time())
+    end_datetime = datetime.combine(week_end, datetime.max.time())
+
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+
+    try:
+        query = (
+            session.query(AbpAuditLogs.UserId)
+            .filter(
+                AbpAuditLogs.ApplicationName == 'Public.JbJobMembership.HttpApi.Host',
+                (AbpAuditLogs.Url.like('%/connect/token%') | AbpAuditLogs.Url.like('%/api/app/line-login/token%')),
+                AbpAuditLogs.HttpStatusCode == 200,
+                AbpAuditLogs.ExecutionTime >= start_datetime,
+                AbpAuditLogs.ExecutionTime <= end_datetime,
+                AbpAuditLogs.UserId.isnot(None)
+            )
+            .distinct()
+            .execution_options(stream_results=True)
+        )
+        for (user_id,) in query.yield_per(5000):
+            yield user_id
+
+    finally:
+        session.close()
+
+
+def write_cohort_csv_report(rows: List[Dict], weeks: List[Tuple[str, date, date, str]],
+                            output_file: str = "hireme_login_cohort_report.csv"):
+    """
+    產生留存格式的 CSV 報告
+
+    Args:
+        rows: compute_retention 的結果
+        weeks: 週的列表，格式同 get_week_ranges()
+        output_file: 輸出檔案名稱
+    """
+    try:
+        with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+
+            # 寫入標題：群組資訊 + 每個登入週
+            writer.writerow(
+                ['註冊期間', '註冊人數', '曾登入人數', '未登入人數', '登入比例(%)']
+                + [f'{week[3]} 登入人數' for week in weeks]
+            )
+
+            for row in rows:
+                writer.writerow(
+                    [row['period'], row['registered'], row['logged_in'], row['never_logged_in'], row['login_rate']]
+                    + row['weekly']
+                )
+
+        logger.info(f"登入追蹤 CSV 報告已產生: {output_file}")
+
+        # 輸出到控制台
+        print(f"\n{'='*60}")
+        print("HireMe 註冊用戶登入追蹤報告")
+        print(f"{'='*60}")
+        for row in rows:
+            print(f"{row['period']}：註冊 {row['registered']:,}，曾登入 {row['logged_in']:,}（{row['login_rate']}%）")
+        print(f"{'='*60}\n")
+        print(f"報告已儲存至: {output_file}\n")
+
+    except Exception as e:
+        logger.error(f"產生登入追蹤 CSV 報告失敗: {e}", exc_info=True)
+
+
+def main():
+    """
+    主函數
+    """
+    logger.info("開始產生 HireMe 註冊用戶登入追蹤報告")
+
+    hireme_engine = get_db_engine("HireMePlz")
+    membership_engine = get_membership_db_engine()
+    if not hireme_engine or not membership_engine:
+        logger.error("無法創建資料庫引擎，程式結束")
+        for engine in (hireme_engine, membership_engine):
+            if engine:
+                engine.dispose()
+        return
+
+    try:
+        weeks = get_week_ranges()
+        index = UserIdIndex()
+
+        registered, registered_by_week = build_registration_bitmaps(
+            iter_registered_users(hireme_engine), index, weeks
+        )
+        logger.info(f"註冊用戶 {len(registered):,} 位")
+
+        logins_by_week = build_login_bitmaps(
+            (iter_weekly_login_user_ids(membership_engine, week_start, week_end)
+             for _, week_start, week_end, _ in weeks),
+            index
+        )
+        logger.info(f"共索引 {len(index):,} 位用戶，每個點陣圖約 {registered.nbytes():,} bytes")
+
+        rows = compute_retention(registered, registered_by_week, logins_by_week, weeks)
+        write_cohort_csv_report(rows, weeks)
+
+    except Exception as e:
+        logger.error(f"產生登入追蹤報告失敗: {e}", exc_info=True)
+
+    finally:
+        hireme_engine.dispose()
+        membership_engine.dispose()
+        logger.info("資料庫引擎已關閉")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,7 @@ from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
 import logging
-from week_range import get_week_ranges, get_total_date_range
+from week_range import get_week_ranges, get_total_date_range, format_total_period
 
 # 載入 .env 檔案
 load_dotenv()
@@ -43,6 +43,7 @@ class AbpAuditLogs(Base):
     Url = Column(String)
     HttpStatusCode = Column(Integer)
     ExecutionTime = Column(DateTime)
+    UserId = Column(String)
     # 其他欄位可以根據需要添加
 
 
@@ -138,7 +139,7 @@ def query_weekly_login_count(engine: Engine, week_start: date, week_end: date) -
 
 def query_total_login_count(engine: Engine) -> Optional[int]:
     """
-    查詢總登入次數（11/17~1/11）
+    查詢報告期間的總登入次數
 
     Args:
         engine: 資料庫引擎
@@ -202,7 +203,7 @@ def generate_csv_report(week_counts: List[Dict], total_count: int, output_file:
             writer.writerow(['期間', '登入次數'])
 
             # 寫入總登入次數
-            writer.writerow([f'總登入人數（11/17~1/11）', total_count])
+            writer.writerow([f'總登入人數（{format_total_period()}）', total_count])
 
             # 寫入各週統計
             for week_data in week_counts:
@@ -214,7 +215,7 @@ def generate_csv_report(week_counts: List[Dict], total_count: int, output_file:
         print(f"\n{'='*60}")
         print("前台登入次數統計報告")
         print(f"{'='*60}")
-        print(f"總登入人數（11/17~1/11）：{total_count:,}")
+        print(f"總登入人數（{format_total_period()}）：{total_count:,}")
         for week_data in week_counts:
             print(f"{week_data['period']}：{week_data['count']:,}")
         print(f"{'='*60}\n")
@@ -4,14 +4,61 @@
 """
 
 import os
-import time
 import csv
-import schedule
+import time
+import asyncio
+import argparse
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import speedtest
 from logger_config import setup_logger
 from dotenv import load_dotenv
+from speedtest_cache import SpeedtestCache, select_best_server
+from speedtest_store import SpeedtestStore, SPEEDTEST_DB
+from speedtest_anomaly import AnomalyDetector
+from speedtest_adaptive import (
+    AdaptivePolicy,
+    result_bytes,
+    ADAPTIVE_MAX_INTERVAL_SECONDS,
+    DAILY_BUDGET_MB,
+    BYTES_PER_MB
+)
+from speedtest_latency import measure_latency, LATENCY_FIELDS
+from speedtest_metrics import SpeedtestMetrics, MetricsServer, METRICS_HOST, METRICS_PORT
+from speedtest_collector import (
+    CollectorServer,
+    ResultForwarder,
+    read_csv_results,
+    COLLECTOR_URL,
+    COLLECTOR_HOST,
+    COLLECTOR_PORT,
+    COLLECTOR_DB,
+    SITE_NAME
+)
+from speedtest_tcp_monitor import (
+    monitor,
+    load_targets,
+    MONITOR_HOSTS,
+    MONITOR_HOSTS_FILE,
+    MONITOR_INTERVAL_SECONDS,
+    MONITOR_TIMEOUT_SECONDS,
+    MONITOR_CONCURRENCY
+)
+from speedtest_summary import (
+    summarize_csv,
+    write_summary_csv,
+    format_summary,
+    SUMMARY_CACHE_FILE,
+    SUMMARY_METRICS,
+    SUMMARY_PERIODS
+)
+from speedtest_scheduler import (
+    Scheduler,
+    SCHEDULE_INTERVAL_SECONDS,
+    SCHEDULE_JITTER_SECONDS,
+    SCHEDULE_TIMEOUT_SECONDS,
+    SCHEDULE_OVERLAP
+)
 
 # 載入 .env 檔案
 load_dotenv()
@@ -22,6 +69,36 @@ logger = setup_logger("speedtest")
 # CSV 檔案路徑
 CSV_FILE = "speedtest_results.csv"
 
+# CSV 欄位（新增的欄位接在最後，舊檔案的標題會自動補上）
+CSV_FIELDNAMES = [
+    'timestamp',
+    'download_mbps',
+    'upload_mbps',
+    'ping_ms',
+    'server_name',
+    'server_country',
+    'server_sponsor'
+] + LATENCY_FIELDS + ['bytes_received', 'bytes_sent']
+
+# 重複使用的 Speedtest 物件與伺服器選擇快取
+_server_cache = SpeedtestCache()
+
+# 下載、上傳與延遲的異常偵測（狀態保存在 JSON 檔案）
+_anomaly_detector = AnomalyDetector()
+
+# 記憶體中的 Prometheus 指標（由 --metrics-port 啟動的 HTTP 伺服器提供）
+_metrics = SpeedtestMetrics()
+
+# 轉送結果到收集伺服器（設定 SPEEDTEST_COLLECTOR_URL 時啟用）
+_forwarder = ResultForwarder(COLLECTOR_URL) if COLLECTOR_URL else None
+
+# 自適應間隔與每日流量預算（設定 SPEEDTEST_ADAPTIVE_MAX_INTERVAL 或 SPEEDTEST_DAILY_BUDGET_MB 時啟用）
+_adaptive_policy = (AdaptivePolicy(SCHEDULE_INTERVAL_SECONDS)
+                    if ADAPTIVE_MAX_INTERVAL_SECONDS or DAILY_BUDGET_MB else None)
+
+# 定時測試的排程器（由 main 建立，自適應策略用來變更下次執行時間）
+_scheduler: Optional[Scheduler] = None
+
 
 def test_speed() -> Optional[Dict[str, float]]:
     """
@@ -33,15 +110,17 @@ def test_speed() -> Optional[Dict[str, float]]:
     try:
         logger.info("開始測試網速...")
 
-        # 創建 Speedtest 物件
-        st = speedtest.Speedtest()
+        # 取得 Speedtest 物件（快取有效期間內不重新下載設定）
+        st = _server_cache.get_speedtest()
 
-        # 選擇最佳伺服器
-        logger.info("正在選擇最佳伺服器...")
-        st.get_best_server()
+        # 選擇伺服器（優先使用快取的最佳伺服器）
+        select_best_server(st, _server_cache)
         server_info = st.results.server
         logger.info(f"使用伺服器: {server_info['name']} ({server_info['country']})")
 
+        # 在下載、上傳之前（線路閒置時）多次取樣測量延遲與抖動
+        latency = measure_latency(server_info)
+
         # 測試下載速度
         logger.info("正在測試下載速度...")
         download_speed = st.download() / 1_000_000  # 轉換為 Mbps
@@ -60,20 +139,58 @@ def test_speed() -> Optional[Dict[str, float]]:
             "ping_ms": round(ping, 2),
             "server_name": server_info['name'],
             "server_country": server_info['country'],
-            "server_sponsor": server_info.get('sponsor', 'N/A')
+            "server_sponsor": server_info.get('sponsor', 'N/A'),
+            **latency,
+            # 本次測試的傳輸量（用於每日流量預算）
+            "bytes_received": st.results.bytes_received,
+            "bytes_sent": st.results.bytes_sent
         }
 
         logger.info(f"測試完成 - 下載: {result['download_mbps']} Mbps, "
                    f"上傳: {result['upload_mbps']} Mbps, "
                    f"延遲: {result['ping_ms']} ms")
 
+        # 結果明顯變差時，下次測試重新選擇伺服器
+        _server_cache.check_degradation(result['download_mbps'], result['ping_ms'])
+
         return result
 
     except Exception as e:
         logger.error(f"網速測試失敗: {e}", exc_info=True)
+        _server_cache.invalidate_best()
         return None
 
 
+def migrate_csv_header(csv_file: str, fieldnames: List[str]) -> None:
+    """
+    舊版 CSV 的標題與目前欄位不同時，改寫為目前的欄位（舊資料列缺少的欄位留空）
+
+    Args:
+        csv_file: CSV 檔案路徑
+        fieldnames: 目前的欄位
+
+    Raises:
+        ValueError: 檔案有目前欄位以外的欄位（避免改寫時遺失資料）
+    """
+    with open(csv_file, 'r', newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), None)
+    if header is None or header == fieldnames:
+        return
+    unknown = [field for field in header if field not in fieldnames]
+    if unknown:
+        raise ValueError(f"{csv_file} 有無法辨識的欄位: {', '.join(unknown)}")
+
+    logger.info(f"更新 {csv_file} 的欄位: {', '.join(field for field in fieldnames if field not in header)}")
+    # 逐列寫入暫存檔再取代，避免中斷時留下不完整的檔案
+    temp_path = f"{csv_file}.tmp"
+    with open(csv_file, 'r', newline='', encoding='utf-8-sig') as source, \
+            open(temp_path, 'w', newline='', encoding='utf-8-sig') as target:
+        writer = csv.DictWriter(target, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(csv.DictReader(source))
+    os.replace(temp_path, csv_file)
+
+
 def save_to_csv(result: Dict[str, float]) -> None:
     """
     將測試結果儲存到 CSV 檔案
@@ -84,17 +201,11 @@ def save_to_csv(result: Dict[str, float]) -> None:
     file_exists = os.path.isfile(CSV_FILE)
 
     try:
+        if file_exists:
+            migrate_csv_header(CSV_FILE, CSV_FIELDNAMES)
+
         with open(CSV_FILE, 'a', newline='', encoding='utf-8-sig') as f:
-            fieldnames = [
-                'timestamp',
-                'download_mbps',
-                'upload_mbps',
-                'ping_ms',
-                'server_name',
-                'server_country',
-                'server_sponsor'
-            ]
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
 
             # 如果檔案不存在，寫入標題行
             if not file_exists:
@@ -108,14 +219,98 @@ def save_to_csv(result: Dict[str, float]) -> None:
         logger.error(f"儲存結果到 CSV 失敗: {e}")
 
 
+def save_to_store(result: Dict[str, float]) -> None:
+    """
+    將測試結果存入時間序列資料庫（同時更新每小時與每日彙總）
+
+    Args:
+        result: 測試結果字典
+    """
+    try:
+        store = SpeedtestStore(SPEEDTEST_DB)
+        try:
+            store.add_result(result)
+        finally:
+            store.close()
+
+        logger.debug(f"結果已儲存到 {SPEEDTEST_DB}")
+
+    except Exception as e:
+        logger.error(f"儲存結果到資料庫失敗: {e}")
+
+
+def check_anomalies(result: Dict[str, float]) -> List[Dict]:
+    """
+    與 EWMA 基準比較測試結果，異常時由 logger 發出警告
+
+    Args:
+        result: 測試結果字典
+
+    Returns:
+        異常的欄位列表，偵測失敗時返回空列表
+    """
+    try:
+        return _anomaly_detector.observe(result)
+
+    except Exception as e:
+        logger.error(f"異常偵測失敗: {e}")
+        return []
+
+
+def adjust_schedule(result: Optional[Dict[str, float]], anomalies: List[Dict]) -> None:
+    """
+    依測試結果調整下一次測試的時間（未啟用自適應排程時不處理）
+
+    Args:
+        result: 測試結果字典（失敗為 None）
+        anomalies: 偵測到的異常
+    """
+    if _adaptive_policy is None:
+        return
+    try:
+        interval = _adaptive_policy.observe(result, anomalies)
+        if _scheduler is not None:
+            _scheduler.reschedule(interval)
+
+    except Exception as e:
+        logger.error(f"調整測試間隔失敗: {e}")
+
+
+def forward_result(result: Dict[str, float]) -> None:
+    """
+    將測試結果放進緩衝檔並送到收集伺服器（送不出去的結果留到下次再送）
+
+    Args:
+        result: 測試結果字典
+    """
+    if _forwarder is None:
+        return
+    try:
+        _forwarder.enqueue([result])
+        _forwarder.flush()
+
+    except Exception as e:
+        logger.error(f"轉送結果到收集伺服器失敗: {e}")
+
+
 def run_speedtest():
     """
     執行網速測試並儲存結果
     """
+    if _adaptive_policy is not None and not _adaptive_policy.allow_run():
+        return
+
+    start = time.perf_counter()
     result = test_speed()
+    duration = time.perf_counter() - start
 
     if result:
+        _metrics.record_success(result, duration)
         save_to_csv(result)
+        save_to_store(result)
+        anomalies = check_anomalies(result)
+        forward_result(result)
+        adjust_schedule(result, anomalies)
 
         # 輸出到控制台
         print(f"\n{'='*60}")
@@ -124,43 +319,237 @@ def run_speedtest():
         print(f"下載速度: {result['download_mbps']} Mbps")
         print(f"上傳速度: {result['upload_mbps']} Mbps")
         print(f"延遲 (Ping): {result['ping_ms']} ms")
+        if result.get('jitter_ms') is not None:
+            print(f"延遲取樣: 中位數 {result['ping_median_ms']} ms, p95 {result['ping_p95_ms']} ms, "
+                  f"抖動 {result['jitter_ms']} ms, 失敗比例 {result['ping_loss_ratio']:.0%}")
         print(f"伺服器: {result['server_name']} ({result['server_country']})")
+        print(f"傳輸量: {result_bytes(result) / BYTES_PER_MB:.1f} MB")
         print(f"{'='*60}\n")
     else:
+        _metrics.record_failure(duration)
         logger.warning("網速測試失敗，結果未儲存")
+        adjust_schedule(None, [])
 
 
-def main():
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """
-    主函數 - 設定定時任務並執行
+    解析命令列參數
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
+
+    Returns:
+        解析後的參數
     """
-    # 立即執行一次測試
-    logger.info("啟動網速測試工具")
-    print("網速測試工具已啟動")
-    print("將每小時自動測試一次網速")
-    print(f"結果會儲存到: {CSV_FILE}")
+    parser = argparse.ArgumentParser(description="網速測試工具（未指定指令時定時測試網速）", allow_abbrev=False)
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=METRICS_PORT,
+        help="在此埠提供 Prometheus 指標 /metrics（預設讀取 SPEEDTEST_METRICS_PORT，0 表示不啟動）"
+    )
+    parser.add_argument("--metrics-host", default=METRICS_HOST, help="指標伺服器的監聽位址")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    summary_parser = subparsers.add_parser("summary", help="串流讀取測試結果 CSV，輸出每日、每週或每月的百分位摘要")
+    summary_parser.add_argument("--csv", default=CSV_FILE, help="測試結果 CSV 檔案")
+    summary_parser.add_argument("--period", choices=SUMMARY_PERIODS, default="month", help="彙總週期（預設 month）")
+    summary_parser.add_argument("--metric", choices=SUMMARY_METRICS, nargs="+", default=None,
+                                help="要輸出的欄位（預設全部）")
+    summary_parser.add_argument("--output", default=None, help="另外將摘要寫入 CSV 檔案")
+    summary_parser.add_argument("--cache", default=SUMMARY_CACHE_FILE, help="摘要快取檔案")
+    summary_parser.add_argument("--no-cache", action="store_true", help="不使用快取，重新讀取整個檔案")
+
+    monitor_parser = subparsers.add_parser("monitor", help="以 asyncio 持續測量多個主機的 TCP 連線延遲並存入資料庫")
+    monitor_parser.add_argument("--hosts", default=MONITOR_HOSTS,
+                                help="以逗號分隔的 host:port（預設讀取 SPEEDTEST_MONITOR_HOSTS，沒有埠時使用 443）")
+    monitor_parser.add_argument("--hosts-file", default=MONITOR_HOSTS_FILE, help="每行一個 host:port 的檔案")
+    monitor_parser.add_argument("--interval", type=float, default=MONITOR_INTERVAL_SECONDS, help="每輪的間隔（秒）")
+    monitor_parser.add_argument("--timeout", type=float, default=MONITOR_TIMEOUT_SECONDS, help="每次連線的逾時（秒）")
+    monitor_parser.add_argument("--concurrency", type=int, default=MONITOR_CONCURRENCY, help="同時連線數上限")
+    monitor_parser.add_argument("--rounds", type=int, default=None, help="執行幾輪後結束（預設持續執行）")
+
+    collector_parser = subparsers.add_parser("collector", help="啟動收集各站點測試結果的 HTTP 伺服器")
+    collector_parser.add_argument("--host", default=COLLECTOR_HOST, help="監聽位址（讓其他主機連線時設為 0.0.0.0）")
+    collector_parser.add_argument("--port", type=int, default=COLLECTOR_PORT, help="監聽埠")
+    collector_parser.add_argument("--db", default=COLLECTOR_DB, help="收集結果的資料庫")
+
+    push_parser = subparsers.add_parser("push", help="將本機 CSV 中的測試結果送到收集伺服器（重複送出不會重複寫入）")
+    push_parser.add_argument("--csv", default=CSV_FILE, help="測試結果 CSV 檔案")
+    push_parser.add_argument("--url", default=COLLECTOR_URL, help="收集伺服器網址（預設讀取 SPEEDTEST_COLLECTOR_URL）")
+    push_parser.add_argument("--site", default=SITE_NAME, help="站點名稱（預設讀取 SPEEDTEST_SITE 或主機名稱）")
+    return parser.parse_args(argv)
+
+
+def run_summary(args: argparse.Namespace) -> None:
+    """
+    輸出測試結果的百分位摘要
+
+    Args:
+        args: summary 指令的參數
+    """
+    if not os.path.isfile(args.csv):
+        logger.error(f"找不到測試結果檔案: {args.csv}")
+        return
+
+    rows = summarize_csv(args.csv, args.period, args.metric, None if args.no_cache else args.cache)
+    if rows is None:
+        return
+
+    print(f"\n{format_summary(rows)}\n")
+    if args.output:
+        write_summary_csv(rows, args.output)
+        logger.info(f"摘要已儲存至: {args.output}")
+        print(f"摘要已儲存至: {args.output}\n")
+
+
+def run_monitor(args: argparse.Namespace) -> None:
+    """
+    持續測量多個主機的 TCP 連線延遲，每輪的結果批次存入時間序列資料庫
+
+    Args:
+        args: monitor 指令的參數
+    """
+    try:
+        targets = load_targets(args.hosts, args.hosts_file)
+    except (OSError, ValueError) as e:
+        logger.error(f"讀取監控目標失敗: {e}")
+        return
+    if not targets:
+        logger.error("沒有監控目標，請設定 --hosts、--hosts-file 或 SPEEDTEST_MONITOR_HOSTS")
+        return
+
+    logger.info(f"開始 TCP 連線延遲監控，共 {len(targets)} 個目標，每 {args.interval:g} 秒一輪")
+    print(f"TCP 連線延遲監控: {len(targets)} 個目標，結果會儲存到: {SPEEDTEST_DB}")
     print("按 Ctrl+C 停止程式\n")
 
-    run_speedtest()
+    store = SpeedtestStore(SPEEDTEST_DB)
+    try:
+        asyncio.run(monitor(targets, store, args.interval, args.timeout, args.concurrency, args.rounds))
+    except KeyboardInterrupt:
+        print("\n監控已停止")
+    finally:
+        store.close()
+        logger.info("TCP 連線延遲監控已停止")
 
-    # 設定每小時執行一次
-    schedule.every().hour.do(run_speedtest)
 
-    # 顯示下次執行時間
-    next_run = schedule.next_run()
-    if next_run:
-        logger.info(f"下次測試時間: {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"下次測試時間: {next_run.strftime('%Y-%m-%d %H:%M:%S')}\n")
+def run_collector(args: argparse.Namespace) -> None:
+    """
+    啟動收集伺服器，直到按下 Ctrl+C
 
-    # 持續執行
+    Args:
+        args: collector 指令的參數
+    """
+    store = SpeedtestStore(args.db)
+    server = CollectorServer(store, args.host, args.port)
     try:
+        server.start()
+        print(f"網速結果收集伺服器: {server.url}，結果會儲存到: {args.db}")
+        print("按 Ctrl+C 停止程式\n")
         while True:
-            schedule.run_pending()
-            time.sleep(60)  # 每分鐘檢查一次是否有待執行的任務
-
+            time.sleep(1)
     except KeyboardInterrupt:
-        logger.info("程式已停止")
-        print("\n程式已停止")
+        print("\n收集伺服器已停止")
+    finally:
+        server.stop()
+        store.close()
+        logger.info("網速結果收集伺服器已停止")
+
+
+def run_push(args: argparse.Namespace) -> None:
+    """
+    將本機 CSV 中的測試結果送到收集伺服器
+
+    Args:
+        args: push 指令的參數
+    """
+    if not args.url:
+        logger.error("沒有收集伺服器網址，請設定 --url 或 SPEEDTEST_COLLECTOR_URL")
+        return
+    if not os.path.isfile(args.csv):
+        logger.error(f"找不到測試結果檔案: {args.csv}")
+        return
+
+    # 直接送出，不經過定時測試使用的緩衝檔；重複送出不會重複寫入，失敗時再次執行即可
+    forwarder = ResultForwarder(args.url, args.site)
+    read = 0
+
+    def results():
+        nonlocal read
+        for result in read_csv_results(args.csv):
+            read += 1
+            yield result
+
+    counts = forwarder.send(results())
+    sent = counts['sent']
+    # 已存在的結果不會重複寫入，早於收集伺服器保留期限的結果不會寫入
+    detail = (f"新增 {counts['inserted']} 筆，已存在 {sent - counts['inserted'] - counts['dropped']} 筆，"
+              f"早於保留期限略過 {counts['dropped']} 筆")
+    if counts['rejected']:
+        detail += f"，被拒收 {counts['rejected']} 筆（見 {forwarder.rejected_file}）"
+    if sent + counts['rejected'] < read:
+        logger.warning(f"送出 {sent} 筆結果到 {args.url} 後失敗（{detail}）")
+        print(f"送出 {sent} 筆結果後失敗（{detail}），請稍後再次執行 push（已送出的不會重複寫入）")
+    else:
+        logger.info(f"已送出 {sent} 筆結果到 {args.url}（{detail}）")
+        print(f"已送出 {sent} 筆結果（{detail}）")
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    主函數 - 設定定時任務並執行
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
+    """
+    args = parse_args(argv)
+    if args.command == "summary":
+        run_summary(args)
+        return
+    if args.command == "monitor":
+        run_monitor(args)
+        return
+    if args.command == "collector":
+        run_collector(args)
+        return
+    if args.command == "push":
+        run_push(args)
+        return
+
+    logger.info("啟動網速測試工具")
+    print("網速測試工具已啟動")
+    print(f"將每 {SCHEDULE_INTERVAL_SECONDS / 60:g} 分鐘自動測試一次網速")
+    print(f"結果會儲存到: {CSV_FILE}、{SPEEDTEST_DB}")
+    print("按 Ctrl+C 停止程式\n")
+
+    # 立即執行一次測試，之後等到下次預定時間再執行（不輪詢）
+    global _scheduler
+    scheduler = _scheduler = Scheduler(
+        run_speedtest,
+        interval=SCHEDULE_INTERVAL_SECONDS,
+        jitter=SCHEDULE_JITTER_SECONDS,
+        timeout=SCHEDULE_TIMEOUT_SECONDS,
+        overlap=SCHEDULE_OVERLAP,
+        on_timeout=_metrics.record_timeout
+    )
+    if _adaptive_policy is not None:
+        # 從上次結束時的間隔繼續
+        scheduler.interval = _adaptive_policy.interval
+        print(f"自適應排程: 間隔 {_adaptive_policy.min_interval / 60:g}~{_adaptive_policy.max_interval / 60:g} 分鐘"
+              + (f"，每日流量預算 {DAILY_BUDGET_MB:g} MB" if DAILY_BUDGET_MB else "") + "\n")
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(_metrics, args.metrics_host, args.metrics_port).start()
+        print(f"Prometheus 指標: {metrics_server.url}\n")
+
+    try:
+        scheduler.run_forever()
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+
+    logger.info("程式已停止")
+    print("\n程式已停止")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+"""
+JBHRIS_DISPATCH.REC_User 本機快照
+將報告需要的 REC_User 欄位（UserID、CreateDate、NameC）同步到本機 SQLite，
+依 CreateDate 增量更新，讓 HireMe 報告不必每次跨資料庫 JOIN
+
+增量同步只看 CreateDate，已同步的資料列之後在來源被修改（例如 NameC）不會更新到快照，
+需要定期以 --full 完整重新同步
+"""
+
+import os
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import create_engine, Column, String, DateTime, func, select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+from logger_config import setup_logger
+
+# 載入 .env 檔案
+load_dotenv()
+
+# 設定 logger
+logger = setup_logger("rec_user_snapshot")
+
+# 快照檔案路徑
+SNAPSHOT_DB = os.getenv("REC_USER_SNAPSHOT_DB", "rec_user_snapshot.db")
+
+# 同步時每批讀取與寫入的筆數（寫入以 executemany 逐列綁定參數，不受 SQLite 參數上限限制）
+SYNC_BATCH_SIZE = 5000
+
+# SQLite 單一語句的參數上限為 999（舊版），IN 清單每批不超過此數量
+LOOKUP_BATCH_SIZE = 900
+
+# 建立 Base 類別（來源與快照分開，避免 create_all 建到來源資料庫）
+SourceBase = declarative_base()
+SnapshotBase = declarative_base()
+
+
+# 定義來源 REC_User 模型
+class RecUser(SourceBase):
+    """JBHRIS_DISPATCH REC_User 資料表模型（只定義快照需要的欄位）"""
+    __tablename__ = 'REC_User'
+    __table_args__ = {'schema': 'dbo'}
+
+    UserID = Column(String, primary_key=True)
+    CreateDate = Column(DateTime)
+    NameC = Column(String)
+
+
+# 定義快照 REC_User 模型
+class RecUserSnapshot(SnapshotBase):
+    """本機快照 REC_User 資料表模型"""
+    __tablename__ = 'REC_User'
+
+    UserID = Column(String, primary_key=True)
+    CreateDate = Column(DateTime, index=True)
+    NameC = Column(String)
+
+
+# 定義快照中繼資料模型
+class SnapshotMeta(SnapshotBase):
+    """快照中繼資料（例如最後同步時間）"""
+    __tablename__ = 'snapshot_meta'
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+
+def get_snapshot_engine(path: str = None) -> Engine:
+    """
+    創建快照資料庫引擎，並確保資料表存在
+
+    Args:
+        path: 快照檔案路徑（預設為 SNAPSHOT_DB）
+
+    Returns:
+        快照資料庫引擎
+    """
+    engine = create_engine(f"sqlite:///{path or SNAPSHOT_DB}")
+    SnapshotBase.metadata.create_all(engine)
+    return engine
+
+
+def get_snapshot_age(snapshot_engine: Engine) -> Optional[timedelta]:
+    """
+    取得快照距離上次同步的時間
+
+    Args:
+        snapshot_engine: 快照資料庫引擎
+
+    Returns:
+        快照年齡，如果從未同步則返回 None
+    """
+    SessionLocal = sessionmaker(bind=snapshot_engine)
+    session = SessionLocal()
+
+    try:
+        meta = session.get(SnapshotMeta, "last_synced_at")
+        if meta is None:
+            return None
+        return datetime.now() - datetime.fromisoformat(meta.value)
+
+    finally:
+        session.close()
+
+
+def sync_rec_user_snapshot(source_engine: Engine, snapshot_engine: Engine,
+                           full: bool = False, batch_size: int = SYNC_BATCH_SIZE) -> Optional[int]:
+    """
+    同步 REC_User 到本機快照
+
+    增量模式只讀取 CreateDate 不早於快照最新 CreateDate 的資料列，
+    重複的 UserID 以 upsert 覆寫；CreateDate 較早但之後被修改的資料列不會重新讀取，
+    需要以 full 模式清空快照後重新同步。
+
+    Args:
+        source_engine: JBHRIS_DISPATCH 資料庫引擎
+        snapshot_engine: 快照資料庫引擎
+        full: 是否完整重新同步
+        batch_size: 每批讀取與寫入的筆數
+
+    Returns:
+        同步的資料列數，如果失敗則返回 None
+    """
+    try:
+        SourceSession = sessionmaker(bind=source_engine)
+        SnapshotSession = sessionmaker(bind=snapshot_engine)
+        source = SourceSession()
+        snapshot = SnapshotSession()
+
+        try:
+            if full:
+                snapshot.execute(delete(RecUserSnapshot))
+                watermark = None
+            else:
+                watermark = snapshot.execute(select(func.max(RecUserSnapshot.CreateDate))).scalar()
+
+            query = select(RecUser.UserID, RecUser.CreateDate, RecUser.NameC)
+            if watermark is not None:
+                # 同一時間點可能還有未同步的資料列，因此使用 >= 並以 upsert 去重
+                query = query.where(RecUser.CreateDate >= watermark)
+
+            logger.info(f"開始同步 REC_User 快照（{'完整' if full else '增量'}，起點: {watermark}）")
+            result = source.execute(query, execution_options={"stream_results": True})
+
+            # 每列各自綁定 3 個參數以 executemany 執行，不會像多列 VALUES 超過 SQLite 999 個參數的上限
+            stmt = sqlite_insert(RecUserSnapshot)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['UserID'],
+                set_={'CreateDate': stmt.excluded.CreateDate, 'NameC': stmt.excluded.NameC}
+            )
+
+            synced = 0
+            for rows in result.partitions(batch_size):
+                values = [
+                    {'UserID': row.UserID, 'CreateDate': row.CreateDate, 'NameC': row.NameC}
+                    for row in rows
+                ]
+                snapshot.execute(stmt, values)
+                synced += len(values)
+
+            snapshot.merge(SnapshotMeta(key="last_synced_at", value=datetime.now().isoformat()))
+            snapshot.commit()
+
+            logger.info(f"REC_User 快照同步完成，共 {synced} 筆")
+            return synced
+
+        finally:
+            source.close()
+            snapshot.close()
+
+    except Exception as e:
+        logger.error(f"同步 REC_User 快照失敗: {e}", exc_info=True)
+        return None
+
+
+def lookup_rec_users(snapshot_engine: Engine, user_ids: Iterable[str],
+                     start_date: date, end_date: date) -> Dict[str, Tuple[datetime, str]]:
+    """
+    從快照查詢指定 UserID 且 CreateDate 在區間內的資料
+
+    日期區間與原本 SQL 的 BETWEEN 語意相同：結束日期視為當天 00:00。
+
+    Args:
+        snapshot_engine: 快照資料庫引擎
+        user_ids: 要查詢的 UserID
+        start_date: 開始日期
+        end_date: 結束日期
+
+    Returns:
+        UserID 對應 (CreateDate, NameC) 的字典
+    """
+    start_datetime = datetime.combine(start_date, datetime.min.time())
+    end_datetime = datetime.combine(end_date, datetime.min.time())
+    keys: List[str] = list(user_ids)
+
+    SessionLocal = sessionmaker(bind=snapshot_engine)
+    session = SessionLocal()
+
+    try:
+        found = {}
+        for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            rows = session.execute(
+                select(RecUserSnapshot.UserID, RecUserSnapshot.CreateDate, RecUserSnapshot.NameC)
+                .where(
+                    RecUserSnapshot.UserID.in_(keys[i:i + LOOKUP_BATCH_SIZE]),
+                    RecUserSnapshot.CreateDate.between(start_datetime, end_datetime)
+                )
+            )
+            for row in rows:
+                found[row.UserID] = (row.CreateDate, row.NameC)
+        return found
+
+    finally:
+        session.close()
+
+
+def format_age(age: Optional[timedelta]) -> str:
+    """
+    將快照年齡轉為易讀字串
+
+    Args:
+        age: 快照年齡
+
+    Returns:
+        例如 "2 天 3 小時"，從未同步則為 "從未同步"
+    """
+    if age is None:
+        return "從未同步"
+    hours = int(age.total_seconds() // 3600)
+    return f"{hours // 24} 天 {hours % 24} 小時"
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    主函數
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
+    """
+    parser = argparse.ArgumentParser(description="同步 JBHRIS_DISPATCH.REC_User 本機快照")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="清空快照後完整重新同步（增量同步不會更新已同步後才在來源修改的資料列）"
+    )
+    parser.add_argument("--snapshot-db", default=SNAPSHOT_DB, help="快照檔案路徑")
+    args = parser.parse_args(argv)
+
+    # 避免與 hireme 互相匯入
+    from hireme import get_db_engine
+
+    source_engine = get_db_engine("JBHRIS_DISPATCH")
+    if not source_engine:
+        logger.error("無法創建資料庫引擎，程式結束")
+        return
+
+    snapshot_engine = get_snapshot_engine(args.snapshot_db)
+
+    try:
+        logger.info(f"同步前快照年齡: {format_age(get_snapshot_age(snapshot_engine))}")
+        synced = sync_rec_user_snapshot(source_engine, snapshot_engine, full=args.full)
+        if synced is not None:
+            print(f"\n已同步 {synced:,} 筆 REC_User 資料到 {args.snapshot_db}")
+            print(f"快照年齡: {format_age(get_snapshot_age(snapshot_engine))}\n")
+
+    finally:
+        source_engine.dispose()
+        snapshot_engine.dispose()
+        logger.info("資料庫引擎已關閉")
+
+
+if __name__ == "__main__":
+    main()
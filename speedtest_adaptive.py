@@ -0,0 +1,203 @@
+"""
+自適應網速測試排程與每日流量預算
+結果維持在參考值的範圍內時逐步拉長測試間隔，偵測到變差（或測試失敗）時縮短到最短間隔，
+並保留變差前的參考值，直到結果回到範圍內才再拉長；結果明顯變好時以新結果為參考值並回到基本間隔；每次測試的傳輸量計入當日用量，
+預估會超過每日預算時略過測試，狀態存在 JSON 檔案，重新啟動後延續
+"""
+
+import os
+import json
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+from speedtest_anomaly import METRIC_DIRECTIONS
+from speedtest_atomic import write_json_atomic
+
+logger = logging.getLogger("speedtest")
+
+# 狀態檔案路徑
+ADAPTIVE_STATE_FILE = os.getenv("SPEEDTEST_ADAPTIVE_STATE", "speedtest_adaptive.json")
+
+# 最短與最長間隔（秒，最長間隔為 0 表示不拉長間隔）
+ADAPTIVE_MIN_INTERVAL_SECONDS = float(os.getenv("SPEEDTEST_ADAPTIVE_MIN_INTERVAL", "900"))
+ADAPTIVE_MAX_INTERVAL_SECONDS = float(os.getenv("SPEEDTEST_ADAPTIVE_MAX_INTERVAL", "0"))
+
+# 結果穩定時每次間隔乘上的倍數
+ADAPTIVE_BACKOFF_FACTOR = float(os.getenv("SPEEDTEST_ADAPTIVE_BACKOFF", "2"))
+
+# 與參考值相差在此比例內視為穩定
+ADAPTIVE_BAND_RATIO = float(os.getenv("SPEEDTEST_ADAPTIVE_BAND", "0.2"))
+
+# 每日流量預算（MB，0 表示不限制）
+DAILY_BUDGET_MB = float(os.getenv("SPEEDTEST_DAILY_BUDGET_MB", "0"))
+
+# 差距小於此值時一律視為穩定，避免延遲只差幾毫秒就被視為改變
+BAND_FLOORS = {'ping_ms': 5.0}
+
+BYTES_PER_MB = 1_000_000
+
+
+def result_bytes(result: Dict) -> int:
+    """
+    取得一次測試的傳輸量
+
+    Args:
+        result: network_speedtest.test_speed 的結果
+
+    Returns:
+        下載與上傳的 byte 數合計
+    """
+    return int(result.get('bytes_received') or 0) + int(result.get('bytes_sent') or 0)
+
+
+class AdaptivePolicy:
+    """依測試結果調整間隔並控制每日流量"""
+
+    def __init__(self, base_interval: float, min_interval: float = ADAPTIVE_MIN_INTERVAL_SECONDS,
+                 max_interval: float = ADAPTIVE_MAX_INTERVAL_SECONDS, backoff: float = ADAPTIVE_BACKOFF_FACTOR,
+                 band: float = ADAPTIVE_BAND_RATIO, daily_budget_mb: float = DAILY_BUDGET_MB,
+                 path: str = ADAPTIVE_STATE_FILE):
+        """
+        Args:
+            base_interval: 基本間隔（秒）
+            min_interval: 偵測到變差後的間隔（秒，不超過基本間隔）
+            max_interval: 結果穩定時最長的間隔（秒，0 表示維持基本間隔）
+            backoff: 結果穩定時每次間隔乘上的倍數
+            band: 與參考值相差在此比例內視為穩定
+            daily_budget_mb: 每日流量預算（MB，0 表示不限制）
+            path: JSON 狀態檔案路徑
+        """
+        if base_interval <= 0:
+            raise ValueError("執行間隔必須大於 0")
+        if backoff < 1:
+            raise ValueError("間隔倍數不能小於 1")
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval) if min_interval > 0 else base_interval
+        self.max_interval = max(max_interval, base_interval)
+        self.backoff = backoff
+        self.band = band
+        self.daily_budget = int(daily_budget_mb * BYTES_PER_MB)
+        self.path = path
+        self._state: Optional[Dict] = None
+
+    @property
+    def state(self) -> Dict:
+        """目前的間隔、參考值與當日用量"""
+        if self._state is None:
+            self._state = {'interval': self.base_interval, 'reference': None, 'day': None,
+                           'bytes_today': 0, 'last_run_bytes': 0}
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._state.update(json.load(f))
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"讀取自適應排程狀態失敗，將重新開始: {e}")
+            # 設定變更後，間隔仍要在新的範圍內
+            self._state['interval'] = min(max(self._state['interval'], self.min_interval), self.max_interval)
+        return self._state
+
+    def _save(self) -> None:
+        try:
+            write_json_atomic(self.path, self.state, indent=2)
+        except OSError as e:
+            logger.warning(f"寫入自適應排程狀態失敗: {e}")
+
+    def _roll_day(self, today: date) -> None:
+        if self.state['day'] != today.isoformat():
+            self.state['day'] = today.isoformat()
+            self.state['bytes_today'] = 0
+
+    @property
+    def interval(self) -> float:
+        """目前的測試間隔（秒）"""
+        return self.state['interval']
+
+    def bytes_today(self, today: Optional[date] = None) -> int:
+        """
+        取得當日已使用的流量
+
+        Args:
+            today: 日期（預設今天）
+
+        Returns:
+            byte 數
+        """
+        self._roll_day(today or date.today())
+        return self.state['bytes_today']
+
+    def allow_run(self, today: Optional[date] = None) -> bool:
+        """
+        依上一次測試的傳輸量預估，判斷這次測試是否會超過每日預算
+
+        Args:
+            today: 日期（預設今天）
+
+        Returns:
+            是否可以執行
+        """
+        if not self.daily_budget:
+            return True
+        used = self.bytes_today(today)
+        if used + self.state['last_run_bytes'] > self.daily_budget:
+            logger.warning(f"今日已使用 {used / BYTES_PER_MB:.1f} MB，預估本次 "
+                           f"{self.state['last_run_bytes'] / BYTES_PER_MB:.1f} MB 會超過每日預算 "
+                           f"{self.daily_budget / BYTES_PER_MB:g} MB，略過本次測試")
+            return False
+        return True
+
+    def _compare(self, result: Dict, reference: Dict) -> str:
+        """與參考值比較，返回 stable、degraded 或 changed"""
+        changed = False
+        for metric, direction in METRIC_DIRECTIONS.items():
+            value, ref = result.get(metric), reference.get(metric)
+            if value is None or ref is None:
+                continue
+            diff = value - ref
+            if abs(diff) <= max(abs(ref) * self.band, BAND_FLOORS.get(metric, 0.0)):
+                continue
+            if diff * direction > 0:
+                return 'degraded'
+            changed = True
+        return 'changed' if changed else 'stable'
+
+    def observe(self, result: Optional[Dict], anomalies: Optional[List[Dict]] = None,
+                today: Optional[date] = None) -> float:
+        """
+        記錄測試結果與傳輸量，決定下一次的間隔
+
+        Args:
+            result: network_speedtest.test_speed 的結果（失敗為 None）
+            anomalies: speedtest_anomaly 偵測到的異常
+            today: 日期（預設今天）
+
+        Returns:
+            下一次的間隔（秒）
+        """
+        state = self.state
+        self._roll_day(today or date.today())
+
+        if result is None:
+            outcome = 'degraded'
+        else:
+            run_bytes = result_bytes(result)
+            state['bytes_today'] += run_bytes
+            if run_bytes:
+                state['last_run_bytes'] = run_bytes
+            reference = state['reference']
+            outcome = 'degraded' if anomalies else 'changed' if reference is None else self._compare(result, reference)
+
+        if outcome == 'stable':
+            state['interval'] = min(state['interval'] * self.backoff, self.max_interval)
+        elif outcome == 'degraded':
+            # 保留變差前的參考值，結果回到範圍內之前維持最短間隔
+            state['interval'] = self.min_interval
+        else:
+            # 以新的網路狀況作為之後比較的參考值
+            state['interval'] = self.base_interval
+            state['reference'] = {metric: result.get(metric) for metric in METRIC_DIRECTIONS}
+        self._save()
+
+        logger.info(f"網速結果{'穩定' if outcome == 'stable' else '變差' if outcome == 'degraded' else '改變'}，"
+                    f"下次測試間隔 {state['interval'] / 60:g} 分鐘，今日已使用 {state['bytes_today'] / BYTES_PER_MB:.1f} MB")
+        return state['interval']
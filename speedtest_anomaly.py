@@ -0,0 +1,161 @@
+"""
+網速測試結果異常偵測
+對下載速度、上傳速度與延遲各自維護指數加權移動平均（EWMA）與變異數，
+每筆結果只更新固定大小的狀態，不需要重新讀取歷史資料；
+偏離基準超過設定的 z 分數時以 logger 發出警告，狀態存在 JSON 檔案，重新啟動後延續
+"""
+
+import os
+import json
+import math
+import logging
+from typing import Dict, List, Optional
+from speedtest_atomic import write_json_atomic
+
+logger = logging.getLogger("speedtest")
+
+# 狀態檔案路徑
+ANOMALY_STATE_FILE = os.getenv("SPEEDTEST_ANOMALY_STATE", "speedtest_anomaly.json")
+
+# EWMA 的權重（越大越快適應新的網路狀況）
+ANOMALY_ALPHA = float(os.getenv("SPEEDTEST_ANOMALY_ALPHA", "0.1"))
+
+# 偏離基準超過幾個標準差視為異常
+ANOMALY_Z_THRESHOLD = float(os.getenv("SPEEDTEST_ANOMALY_Z", "3.0"))
+
+# 累積幾筆結果後才開始判斷（基準還不穩定時不發警告）
+ANOMALY_WARMUP = int(os.getenv("SPEEDTEST_ANOMALY_WARMUP", "5"))
+
+# 標準差的下限（基準平均值的比例），避免結果幾乎不變時微小差異就被判斷為異常
+MIN_STD_RATIO = 0.05
+
+# 各欄位變差的方向：-1 表示數值變小是變差，1 表示數值變大是變差
+METRIC_DIRECTIONS = {
+    'download_mbps': -1,
+    'upload_mbps': -1,
+    'ping_ms': 1,
+}
+
+
+class EwmaStat:
+    """單一欄位的 EWMA 平均值與變異數"""
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+
+    @property
+    def std(self) -> float:
+        """標準差（不低於平均值的 MIN_STD_RATIO）"""
+        return max(math.sqrt(self.var), abs(self.mean) * MIN_STD_RATIO)
+
+    def z_score(self, value: float) -> Optional[float]:
+        """
+        計算數值相對於目前基準的 z 分數
+
+        Args:
+            value: 數值
+
+        Returns:
+            z 分數，尚未有基準或標準差為 0 時返回 None
+        """
+        if self.count == 0 or self.std == 0:
+            return None
+        return (value - self.mean) / self.std
+
+    def update(self, value: float, alpha: float) -> None:
+        """
+        以新數值更新平均值與變異數
+
+        Args:
+            value: 數值
+            alpha: EWMA 權重
+        """
+        if self.count == 0:
+            self.mean = value
+            self.var = 0.0
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+    def to_dict(self) -> Dict:
+        return {'mean': self.mean, 'var': self.var, 'count': self.count}
+
+
+class AnomalyDetector:
+    """網速測試結果的線上異常偵測"""
+
+    def __init__(self, path: str = ANOMALY_STATE_FILE, alpha: float = ANOMALY_ALPHA,
+                 z_threshold: float = ANOMALY_Z_THRESHOLD, warmup: int = ANOMALY_WARMUP):
+        """
+        Args:
+            path: JSON 狀態檔案路徑
+            alpha: EWMA 權重（0~1）
+            z_threshold: 判斷為異常的 z 分數
+            warmup: 累積幾筆結果後才開始判斷
+        """
+        if not 0 < alpha <= 1:
+            raise ValueError("EWMA 權重必須介於 0 與 1 之間")
+        self.path = path
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self._stats: Optional[Dict[str, EwmaStat]] = None
+
+    @property
+    def stats(self) -> Dict[str, EwmaStat]:
+        """各欄位目前的基準"""
+        if self._stats is None:
+            self._stats = {metric: EwmaStat() for metric in METRIC_DIRECTIONS}
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for metric, values in json.load(f).items():
+                        if metric in self._stats:
+                            self._stats[metric] = EwmaStat(**values)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"讀取異常偵測狀態失敗，將重新建立基準: {e}")
+        return self._stats
+
+    def _save(self) -> None:
+        try:
+            write_json_atomic(self.path, {metric: stat.to_dict() for metric, stat in self.stats.items()}, indent=2)
+        except OSError as e:
+            logger.warning(f"寫入異常偵測狀態失敗: {e}")
+
+    def observe(self, result: Dict) -> List[Dict]:
+        """
+        與基準比較並更新基準
+
+        Args:
+            result: network_speedtest.test_speed 的結果
+
+        Returns:
+            異常的欄位列表，每筆包含 metric、value、mean、std、z
+        """
+        anomalies = []
+        for metric, direction in METRIC_DIRECTIONS.items():
+            value = result.get(metric)
+            if value is None:
+                continue
+
+            stat = self.stats[metric]
+            z = stat.z_score(value)
+            if z is not None and stat.count >= self.warmup and z * direction > self.z_threshold:
+                anomalies.append({'metric': metric, 'value': value, 'mean': round(stat.mean, 2),
+                                  'std': round(stat.std, 2), 'z': round(z, 2)})
+            stat.update(value, self.alpha)
+
+        self._save()
+
+        for anomaly in anomalies:
+            logger.warning(
+                f"網速異常 - {anomaly['metric']}: {anomaly['value']}（基準 {anomaly['mean']} ± {anomaly['std']}，"
+                f"z = {anomaly['z']}），時間: {result.get('timestamp')}"
+            )
+        return anomalies
@@ -0,0 +1,33 @@
+"""
+網速測試狀態檔案的原子寫入
+先寫入同目錄的暫存檔再以 os.replace 取代，中斷時不會留下不完整的檔案
+"""
+
+import os
+import json
+from typing import Any
+
+
+def write_json_atomic(path: str, data: Any, **dump_kwargs) -> None:
+    """
+    將資料寫成 JSON 檔案，先寫入暫存檔再取代原本的檔案
+
+    Args:
+        path: 檔案路徑
+        data: 要寫入的資料
+        **dump_kwargs: 傳給 json.dump 的參數（例如 indent、ensure_ascii）
+
+    Raises:
+        OSError: 寫入或取代失敗（暫存檔會被刪除）
+    """
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,366 @@
+"""
+網速測試伺服器快取
+重複使用同一個 Speedtest 物件（設定與伺服器列表不必每次重新下載），
+並將候選伺服器與最佳伺服器記錄在 JSON 檔案，重新啟動後仍然有效；
+只在快取過期或測量結果變差時，才同時對所有候選伺服器測延遲重新選擇
+
+設定 SPEEDTEST_BASE_URL 時，原本送往 speedtest.net 的請求改送到指定的相容伺服器
+（例如 speedtest_stub.py），可在沒有網路的環境測試
+"""
+
+import os
+import json
+import time
+import logging
+import http.client
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse, urlunparse
+import speedtest
+from speedtest_atomic import write_json_atomic
+
+logger = logging.getLogger("speedtest")
+
+# 伺服器快取檔案路徑
+SERVER_CACHE_FILE = os.getenv("SPEEDTEST_CACHE_FILE", "speedtest_servers.json")
+
+# 改用相容 speedtest 協定的伺服器（例如 http://127.0.0.1:8080），未設定時使用 speedtest.net
+SPEEDTEST_BASE_URL = os.getenv("SPEEDTEST_BASE_URL", "")
+
+# 設定、伺服器列表與最佳伺服器的有效時間（秒）
+CACHE_TTL_SECONDS = int(os.getenv("SPEEDTEST_CACHE_TTL", str(6 * 3600)))
+
+# 下載速度低於基準值的比例，或延遲高於基準值的倍數時視為變差
+DEGRADED_DOWNLOAD_RATIO = 0.5
+DEGRADED_PING_FACTOR = 2.0
+
+# 每個伺服器測延遲的次數與逾時秒數
+LATENCY_SAMPLES = 3
+LATENCY_TIMEOUT = 3.0
+
+
+def latency_url(server: Dict) -> str:
+    """
+    取得伺服器的 latency.txt 網址
+
+    Args:
+        server: speedtest 伺服器資訊（需要 url）
+
+    Returns:
+        latency.txt 網址
+    """
+    return os.path.dirname(server['url']) + '/latency.txt'
+
+
+def request_latency(url: str, timeout: float = LATENCY_TIMEOUT, tag: str = '0') -> Optional[float]:
+    """
+    以一次 latency.txt 請求測量往返時間（每次使用新的連線，與 speedtest 相同）
+
+    Args:
+        url: latency.txt 網址
+        timeout: 逾時秒數
+        tag: 加在網址後避免快取的標記
+
+    Returns:
+        往返時間（秒），失敗時返回 None
+    """
+    parsed = urlparse(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parsed.netloc, timeout=timeout)
+    try:
+        start = time.perf_counter()
+        connection.request("GET", f"{parsed.path}?x={int(time.time() * 1000)}.{tag}")
+        response = connection.getresponse()
+        body = response.read(9)
+        elapsed = time.perf_counter() - start
+    except (OSError, http.client.HTTPException):
+        return None
+    finally:
+        connection.close()
+
+    if response.status != 200 or body != b'test=test':
+        return None
+    return elapsed
+
+
+def probe_latency(server: Dict, samples: int = LATENCY_SAMPLES, timeout: float = LATENCY_TIMEOUT) -> Optional[float]:
+    """
+    以與 speedtest 相同的 latency.txt 請求測量伺服器延遲
+
+    Args:
+        server: speedtest 伺服器資訊（需要 url）
+        samples: 測量次數
+        timeout: 每次請求的逾時秒數
+
+    Returns:
+        平均往返時間（毫秒），任一次失敗則返回 None
+    """
+    url = latency_url(server)
+    total = 0.0
+
+    for i in range(samples):
+        elapsed = request_latency(url, timeout, str(i))
+        if elapsed is None:
+            return None
+        total += elapsed
+
+    return total / samples * 1000
+
+
+def probe_servers(servers: List[Dict], samples: int = LATENCY_SAMPLES,
+                  timeout: float = LATENCY_TIMEOUT) -> Dict[str, float]:
+    """
+    同時測量多個伺服器的延遲
+
+    Args:
+        servers: 候選伺服器列表
+        samples: 每個伺服器的測量次數
+        timeout: 每次請求的逾時秒數
+
+    Returns:
+        伺服器 id 對應平均延遲（毫秒），無法連線的伺服器不列入
+    """
+    if not servers:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+        latencies = executor.map(lambda s: probe_latency(s, samples, timeout), servers)
+        return {str(server['id']): latency for server, latency in zip(servers, latencies) if latency is not None}
+
+
+class BaseUrlHandler(urllib.request.BaseHandler):
+    """將送往 speedtest.net 的請求改送到指定伺服器的 urllib handler"""
+
+    # 在加上 Host 標頭的 handler 之前執行
+    handler_order = 100
+
+    def __init__(self, base_url: str):
+        """
+        Args:
+            base_url: 相容伺服器的網址
+        """
+        self.base = urlparse(base_url.rstrip('/'))
+
+    def _rewrite(self, request: urllib.request.Request) -> urllib.request.Request:
+        url = urlparse(request.full_url)
+        host = url.hostname or ''
+        if host == 'speedtest.net' or host.endswith('.speedtest.net'):
+            request.full_url = urlunparse(url._replace(
+                scheme=self.base.scheme, netloc=self.base.netloc, path=self.base.path + url.path
+            ))
+        return request
+
+    http_request = _rewrite
+    https_request = _rewrite
+
+
+class RedirectedSpeedtest(speedtest.Speedtest):
+    """設定、伺服器列表等請求改送到指定伺服器的 Speedtest"""
+
+    def __init__(self, base_url: str, **kwargs):
+        """
+        Args:
+            base_url: 相容伺服器的網址
+            **kwargs: speedtest.Speedtest 的參數
+        """
+        self._base_url_handler = BaseUrlHandler(base_url)
+        super().__init__(**kwargs)
+
+    def get_config(self):
+        # speedtest.Speedtest 在建構時建立 opener 後立即下載設定，因此在這裡加上 handler
+        if self._base_url_handler not in self._opener.handlers:
+            self._opener.add_handler(self._base_url_handler)
+        return super().get_config()
+
+
+def create_speedtest(base_url: str = SPEEDTEST_BASE_URL) -> speedtest.Speedtest:
+    """
+    建立 Speedtest 物件
+
+    Args:
+        base_url: 相容伺服器的網址，空字串表示使用 speedtest.net
+
+    Returns:
+        Speedtest 物件
+    """
+    if base_url:
+        return RedirectedSpeedtest(base_url)
+    return speedtest.Speedtest()
+
+
+class SpeedtestCache:
+    """Speedtest 物件與伺服器選擇的快取"""
+
+    def __init__(self, path: str = SERVER_CACHE_FILE, ttl: float = CACHE_TTL_SECONDS,
+                 base_url: str = SPEEDTEST_BASE_URL):
+        """
+        Args:
+            path: JSON 快取檔案路徑
+            ttl: 快取有效時間（秒）
+            base_url: 相容伺服器的網址，空字串表示使用 speedtest.net
+        """
+        self.path = path
+        self.ttl = ttl
+        self.base_url = base_url
+        self._speedtest = None
+        self._speedtest_created_at = 0.0
+        self._state: Optional[Dict] = None
+
+    def _load(self) -> Dict:
+        if self._state is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._state = json.load(f)
+            except FileNotFoundError:
+                self._state = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"讀取伺服器快取失敗，將重新選擇伺服器: {e}")
+                self._state = {}
+            # 切換 speedtest.net 與相容伺服器時，原本的伺服器選擇不再適用
+            if self._state.get('base_url', '') != self.base_url:
+                self._state = {'base_url': self.base_url} if self.base_url else {}
+        return self._state
+
+    def _save(self) -> None:
+        try:
+            write_json_atomic(self.path, self._state, ensure_ascii=False, indent=2)
+        except OSError as e:
+            logger.warning(f"寫入伺服器快取失敗: {e}")
+
+    def _fresh(self, key: str) -> bool:
+        return time.time() - self._load().get(key, 0) < self.ttl
+
+    def get_speedtest(self) -> speedtest.Speedtest:
+        """
+        取得 Speedtest 物件，有效期間內重複使用（不重新下載設定與伺服器列表）
+
+        Returns:
+            Speedtest 物件
+        """
+        if self._speedtest is None or time.time() - self._speedtest_created_at >= self.ttl:
+            logger.info("下載 speedtest 設定...")
+            self._speedtest = create_speedtest(self.base_url)
+            self._speedtest_created_at = time.time()
+        return self._speedtest
+
+    def best_server(self) -> Optional[Dict]:
+        """
+        取得仍在有效期間內的最佳伺服器
+
+        Returns:
+            伺服器資訊，過期或尚未選擇時返回 None
+        """
+        return self._load().get('best') if self._fresh('best_at') else None
+
+    def candidate_servers(self, st: speedtest.Speedtest) -> List[Dict]:
+        """
+        取得候選伺服器（距離最近的幾個），過期時重新下載伺服器列表
+
+        Args:
+            st: Speedtest 物件
+
+        Returns:
+            候選伺服器列表
+        """
+        state = self._load()
+        if not self._fresh('servers_at') or not state.get('servers'):
+            st.closest = []
+            state['servers'] = [dict(server) for server in st.get_closest_servers()]
+            state['servers_at'] = time.time()
+            self._save()
+        return state['servers']
+
+    def remember_best(self, server: Dict) -> None:
+        """
+        記錄最佳伺服器並清除舊的基準值
+
+        Args:
+            server: 伺服器資訊
+        """
+        state = self._load()
+        state['best'] = dict(server)
+        state['best_at'] = time.time()
+        state.pop('baseline', None)
+        self._save()
+
+    def invalidate_best(self) -> None:
+        """讓下一次測試重新選擇伺服器"""
+        state = self._load()
+        state.pop('best', None)
+        state.pop('best_at', None)
+        state.pop('baseline', None)
+        self._save()
+
+    def check_degradation(self, download_mbps: float, ping_ms: float) -> bool:
+        """
+        與目前伺服器的基準值比較，變差時讓下一次測試重新選擇伺服器
+
+        第一次測量作為基準值；之後下載速度低於基準的 DEGRADED_DOWNLOAD_RATIO，
+        或延遲高於基準的 DEGRADED_PING_FACTOR 倍時視為變差
+
+        Args:
+            download_mbps: 下載速度（Mbps）
+            ping_ms: 延遲（毫秒）
+
+        Returns:
+            是否變差
+        """
+        state = self._load()
+        if 'best' not in state:
+            return False
+
+        baseline = state.get('baseline')
+        if baseline is None:
+            state['baseline'] = {'download_mbps': download_mbps, 'ping_ms': ping_ms}
+            self._save()
+            return False
+
+        degraded = (download_mbps < baseline['download_mbps'] * DEGRADED_DOWNLOAD_RATIO
+                    or ping_ms > baseline['ping_ms'] * DEGRADED_PING_FACTOR)
+        if degraded:
+            logger.warning(f"測量結果變差（基準: 下載 {baseline['download_mbps']} Mbps、延遲 {baseline['ping_ms']} ms），"
+                           f"下次測試將重新選擇伺服器")
+            self.invalidate_best()
+        return degraded
+
+
+def select_best_server(st: speedtest.Speedtest, cache: SpeedtestCache) -> Dict:
+    """
+    選擇測試用的伺服器並測量本次延遲
+
+    快取中有最佳伺服器時只對它測延遲；否則同時對所有候選伺服器測延遲選出最快的，
+    候選伺服器都無法測量時改用 speedtest 內建的選擇方式
+
+    Args:
+        st: Speedtest 物件
+        cache: 伺服器快取
+
+    Returns:
+        選擇的伺服器資訊
+    """
+    best = cache.best_server()
+    if best is None:
+        logger.info("正在選擇最佳伺服器...")
+        try:
+            candidates = cache.candidate_servers(st)
+            latencies = probe_servers(candidates)
+        except Exception as e:
+            logger.warning(f"同時測量候選伺服器延遲失敗: {e}")
+            latencies = {}
+
+        if latencies:
+            fastest = min(latencies, key=latencies.get)
+            best = next(server for server in candidates if str(server['id']) == fastest)
+        else:
+            st.get_best_server()
+            best = st.results.server
+            cache.remember_best(best)
+            return best
+
+        cache.remember_best(best)
+    else:
+        logger.info(f"使用快取的伺服器: {best.get('name')}")
+
+    # 只對選定的伺服器測延遲，設定本次測試的伺服器與 ping
+    st.get_best_server([best])
+    return best
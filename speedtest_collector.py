@@ -0,0 +1,538 @@
+"""
+網速測試結果集中收集
+各辦公室的測試機將結果先附加到本機的緩衝檔（JSON Lines），再分批以 HTTP POST 送到收集伺服器，
+送不出去時以指數退避重試，沒送出的結果留在緩衝檔等下次再送（以 byte 位置記錄送到哪裡）；
+收集伺服器以批次寫入同一個有索引的資料庫（同一站點、同一時間的結果只保留一筆，重送不會重複），
+並提供各站點的查詢
+"""
+
+import os
+import csv
+import hmac
+import json
+import time
+import socket
+import logging
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from sqlalchemy import Float, Integer
+from speedtest_atomic import write_json_atomic
+from speedtest_store import SpeedtestResult, PERIODS, TIMESTAMP_FORMAT
+
+logger = logging.getLogger("speedtest")
+
+# 收集伺服器網址（例如 http://collector.internal:8765），未設定時不轉送
+COLLECTOR_URL = os.getenv("SPEEDTEST_COLLECTOR_URL", "")
+
+# 收集伺服器的監聽位址、埠與資料庫
+COLLECTOR_HOST = os.getenv("SPEEDTEST_COLLECTOR_HOST", "127.0.0.1")
+COLLECTOR_PORT = int(os.getenv("SPEEDTEST_COLLECTOR_PORT", "8765"))
+COLLECTOR_DB = os.getenv("SPEEDTEST_COLLECTOR_DB", "speedtest_collector.db")
+
+# 共用的存取權杖（以 Authorization: Bearer 傳送），未設定時不檢查
+COLLECTOR_TOKEN = os.getenv("SPEEDTEST_COLLECTOR_TOKEN", "")
+
+# 本機的站點名稱（預設為主機名稱）
+SITE_NAME = os.getenv("SPEEDTEST_SITE", "") or socket.gethostname()
+
+# 尚未送出的結果緩衝檔、每批筆數、重試次數與第一次重試前的等待秒數（之後每次加倍）
+FORWARD_BUFFER_FILE = os.getenv("SPEEDTEST_FORWARD_BUFFER", "speedtest_forward_buffer.jsonl")
+FORWARD_BATCH_SIZE = int(os.getenv("SPEEDTEST_FORWARD_BATCH", "100"))
+FORWARD_RETRIES = int(os.getenv("SPEEDTEST_FORWARD_RETRIES", "3"))
+FORWARD_BACKOFF_SECONDS = float(os.getenv("SPEEDTEST_FORWARD_BACKOFF", "1.0"))
+FORWARD_TIMEOUT_SECONDS = 10.0
+
+# 收集伺服器接受的單批筆數與請求大小上限
+MAX_BATCH_SIZE = 5000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# 容許測試機的時鐘比收集伺服器快多少（超過時視為未來的時間而拒絕）
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# 未指定時間範圍時查詢最近幾天
+DEFAULT_QUERY_DAYS = 7
+
+# 由測試機送來的欄位（站點由請求指定）
+RESULT_COLUMNS = [column.name for column in SpeedtestResult.__table__.columns if column.name not in ('id', 'site')]
+FLOAT_COLUMNS = {column.name for column in SpeedtestResult.__table__.columns if isinstance(column.type, Float)}
+INTEGER_COLUMNS = {column.name for column in SpeedtestResult.__table__.columns
+                   if isinstance(column.type, Integer) and column.name != 'id'}
+
+# SQLite INTEGER 欄位的範圍
+MAX_INTEGER = 2 ** 63 - 1
+
+# 4xx 中重試可能成功的狀態碼
+RETRYABLE_STATUS = {408, 429}
+# 權杖錯誤，修正設定前送出其他批次也不會成功
+AUTH_STATUS = {401, 403}
+
+# 送出一批結果的結果：已送出、被收集伺服器拒絕（改存到拒收檔）、失敗（留在緩衝檔）
+SEND_OK = 'sent'
+SEND_REJECTED = 'rejected'
+SEND_FAILED = 'failed'
+
+
+def normalize_result(result: Dict, site: str) -> Dict:
+    """
+    檢查並轉換送來的測試結果（CSV 讀出的字串轉為數值，空字串視為沒有值）
+
+    Args:
+        result: 測試結果
+        site: 站點名稱
+
+    Returns:
+        可寫入資料庫的結果
+
+    Raises:
+        ValueError: 缺少時間、時間在未來或欄位格式不正確
+        OverflowError: 整數欄位的值太大（例如 1e400）
+    """
+    if not isinstance(result, dict):
+        raise ValueError("測試結果必須是物件")
+    timestamp = result.get('timestamp')
+    if not isinstance(timestamp, str):
+        raise ValueError("測試結果缺少 timestamp")
+    if datetime.strptime(timestamp, TIMESTAMP_FORMAT) > datetime.now() + MAX_CLOCK_SKEW:
+        raise ValueError(f"測試結果的時間在未來: {timestamp}")
+
+    row = {'timestamp': timestamp, 'site': site}
+    for name in RESULT_COLUMNS:
+        if name == 'timestamp':
+            continue
+        value = result.get(name)
+        if value is None or value == '':
+            row[name] = None
+        elif name in FLOAT_COLUMNS:
+            row[name] = float(value)
+        elif name in INTEGER_COLUMNS:
+            row[name] = int(float(value))
+            if abs(row[name]) > MAX_INTEGER:
+                raise OverflowError(f"{name} 超出範圍: {value}")
+        else:
+            row[name] = str(value)
+    return row
+
+
+def _parse_time(value: Optional[str], default: datetime) -> datetime:
+    if not value:
+        return default
+    for fmt in (TIMESTAMP_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"不正確的時間: {value}")
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug(f"collector {self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        # 以固定時間比對，避免由回應時間推測權杖
+        if token and not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'),
+                                             f"Bearer {token}".encode('utf-8')):
+            self._send_json(401, {'error': 'unauthorized'})
+            return False
+        return True
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/results':
+            self._send_json(404, {'error': 'not found'})
+            return
+        if not self._authorized():
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {'error': 'request too large'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            site = payload.get('site')
+            results = payload.get('results')
+            if not isinstance(site, str) or not site.strip():
+                raise ValueError("缺少 site")
+            if not isinstance(results, list):
+                raise ValueError("results 必須是列表")
+            if len(results) > MAX_BATCH_SIZE:
+                raise ValueError(f"每批最多 {MAX_BATCH_SIZE} 筆")
+            rows = [normalize_result(result, site.strip()) for result in results]
+        except (ValueError, TypeError, AttributeError, OverflowError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        try:
+            # SQLite 同時只能有一個寫入者，批次依序寫入
+            with self.server.write_lock:
+                # 保留期限以收集伺服器的時間為準，不採用測試機送來的時間
+                counts = self.server.store.add_results(rows, now=datetime.now())
+        except Exception as e:
+            logger.error(f"寫入收集的結果失敗: {e}")
+            self._send_json(500, {'error': 'store failure'})
+            return
+
+        logger.info(f"收到站點 {site.strip()} 的 {counts['received']} 筆結果，新增 {counts['inserted']} 筆，"
+                    f"早於保留期限略過 {counts['dropped']} 筆")
+        self._send_json(200, counts)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path not in ('/sites', '/results', '/rollups'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        if not self._authorized():
+            return
+
+        if parsed.path == '/sites':
+            self._send_json(200, {'sites': self.server.store.sites()})
+            return
+
+        params = {name: values[-1] for name, values in parse_qs(parsed.query).items()}
+        try:
+            end = _parse_time(params.get('end'), datetime.now() + timedelta(seconds=1))
+            start = _parse_time(params.get('start'), end - timedelta(days=DEFAULT_QUERY_DAYS))
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+
+        if parsed.path == '/results':
+            self._send_json(200, {'results': self.server.store.query_raw(start, end, params.get('site'))})
+            return
+
+        period = params.get('period', 'day')
+        if period not in PERIODS:
+            self._send_json(400, {'error': f"不支援的彙總週期: {period}"})
+            return
+        rollups = self.server.store.query_rollups(period, start, end, params.get('metric'), params.get('site', ''))
+        for rollup in rollups:
+            rollup['bucket_start'] = rollup['bucket_start'].strftime(TIMESTAMP_FORMAT)
+        self._send_json(200, {'rollups': rollups})
+
+
+class CollectorServer:
+    """
+    在背景執行緒執行的收集伺服器
+
+    POST /results   {"site": "...", "results": [...]}，回應 received 與 inserted 筆數
+    GET  /sites     各站點的結果筆數與時間範圍
+    GET  /results   ?site=&start=&end=（YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS，預設最近 7 天）
+    GET  /rollups   ?site=&period=hour|day&metric=&start=&end=（超過原始資料保留期限後仍可查詢）
+    """
+
+    def __init__(self, store, host: str = COLLECTOR_HOST, port: int = COLLECTOR_PORT,
+                 token: str = COLLECTOR_TOKEN):
+        """
+        Args:
+            store: 寫入與查詢用的 SpeedtestStore
+            host: 監聽位址
+            port: 監聽埠（0 表示自動選擇）
+            token: 存取權杖（空字串表示不檢查）
+        """
+        self.store = store
+        self.host = host
+        self.port = port
+        self.token = token
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "CollectorServer":
+        """在背景執行緒啟動伺服器"""
+        self._server = ThreadingHTTPServer((self.host, self.port), _CollectorHandler)
+        self._server.daemon_threads = True
+        self._server.store = self.store
+        self._server.token = self.token
+        self._server.write_lock = threading.Lock()
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="speedtest-collector", daemon=True)
+        self._thread.start()
+        logger.info(f"網速結果收集伺服器已啟動: {self.url}")
+        return self
+
+    def stop(self) -> None:
+        """停止伺服器"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> "CollectorServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class ResultForwarder:
+    """
+    將測試結果緩衝在本機檔案，分批送到收集伺服器
+
+    緩衝檔只附加不改寫，每行記錄站點與結果；已送出的位置（byte offset）另存在 .offset 檔，
+    送出一批只需要更新位置，全部送出後才清空緩衝檔。收集伺服器拒收的批次（例如資料格式錯誤）
+    移到 .rejected 拒收檔，不會卡住後面的結果。緩衝檔只給同一個行程使用
+    （定時測試），push 指令直接送出 CSV，不經過緩衝檔
+    """
+
+    def __init__(self, url: str = COLLECTOR_URL, site: str = SITE_NAME, buffer_file: str = FORWARD_BUFFER_FILE,
+                 batch_size: int = FORWARD_BATCH_SIZE, retries: int = FORWARD_RETRIES,
+                 backoff: float = FORWARD_BACKOFF_SECONDS, token: str = COLLECTOR_TOKEN,
+                 timeout: float = FORWARD_TIMEOUT_SECONDS):
+        """
+        Args:
+            url: 收集伺服器網址
+            site: 本機的站點名稱
+            buffer_file: 尚未送出的結果緩衝檔
+            batch_size: 每批筆數（不超過 MAX_BATCH_SIZE）
+            retries: 每批失敗後的重試次數
+            backoff: 第一次重試前的等待秒數（之後每次加倍）
+            token: 存取權杖
+            timeout: 每次請求的逾時秒數
+        """
+        self.url = url.rstrip('/') + '/results'
+        self.site = site
+        self.buffer_file = buffer_file
+        self.offset_file = f"{buffer_file}.offset"
+        self.rejected_file = f"{buffer_file}.rejected"
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.retries = retries
+        self.backoff = backoff
+        self.token = token
+        self.timeout = timeout
+        # 緩衝檔的附加與清空，以及同時只有一個 flush
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def enqueue(self, results: Iterable[Dict]) -> int:
+        """
+        將結果連同站點附加到緩衝檔
+
+        Args:
+            results: 測試結果
+
+        Returns:
+            附加的筆數
+        """
+        lines = [json.dumps({'site': self.site, 'result': result}, ensure_ascii=False) + '\n' for result in results]
+        with self._buffer_lock:
+            with open(self.buffer_file, 'a', encoding='utf-8') as f:
+                f.writelines(lines)
+        return len(lines)
+
+    def _read_offset(self) -> int:
+        try:
+            with open(self.offset_file, 'r', encoding='utf-8') as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+        # 緩衝檔被刪除或換掉時從頭開始
+        size = os.path.getsize(self.buffer_file) if os.path.exists(self.buffer_file) else 0
+        return offset if offset <= size else 0
+
+    def _write_offset(self, offset: int) -> None:
+        write_json_atomic(self.offset_file, offset)
+
+    def _iter_buffer(self, offset: int) -> Iterator[Tuple[Optional[str], Optional[Dict], int]]:
+        """
+        從指定位置讀取緩衝檔（只讀完整的行）
+
+        Yields:
+            (站點, 結果, 該行結尾的 byte 位置)，無法解析的行站點與結果為 None
+        """
+        if not os.path.exists(self.buffer_file):
+            return
+        with open(self.buffer_file, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                offset += len(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    entry = json.loads(raw.decode('utf-8'))
+                except ValueError:
+                    logger.warning(f"略過緩衝檔中無法解析的一行: {raw[:80]!r}")
+                    yield None, None, offset
+                    continue
+                if isinstance(entry, dict) and 'result' in entry and 'site' in entry:
+                    yield entry['site'], entry['result'], offset
+                else:
+                    # 舊版緩衝檔沒有記錄站點
+                    yield self.site, entry, offset
+
+    def pending(self) -> List[Dict]:
+        """
+        讀取緩衝檔中尚未送出的結果（無法解析的行會略過）
+
+        Returns:
+            依寫入順序的結果列表
+        """
+        return [result for site, result, _ in self._iter_buffer(self._read_offset()) if result is not None]
+
+    def _next_batch(self, offset: int) -> Tuple[Optional[str], List[Dict], int]:
+        """從指定位置取出同一站點的下一批結果，返回 (站點, 結果, 結束位置)"""
+        batch_site, batch, end = None, [], offset
+        for site, result, line_end in self._iter_buffer(offset):
+            if result is not None:
+                if batch and site != batch_site:
+                    break
+                batch_site = site
+                batch.append(result)
+            end = line_end
+            if len(batch) >= self.batch_size:
+                break
+        return batch_site, batch, end
+
+    def _compact(self, offset: int) -> None:
+        # 全部送出後才清空緩衝檔，期間附加的結果會留下
+        with self._buffer_lock:
+            if offset and os.path.getsize(self.buffer_file) == offset:
+                open(self.buffer_file, 'w').close()
+                self._write_offset(0)
+
+    def _post(self, batch: List[Dict], site: str) -> Dict:
+        body = json.dumps({'site': site, 'results': batch}, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def _send(self, batch: List[Dict], site: str) -> Tuple[str, Dict]:
+        """
+        送出一批結果，暫時性的錯誤以指數退避重試
+
+        Returns:
+            (SEND_OK、SEND_REJECTED（收集伺服器拒收，已移到拒收檔）或 SEND_FAILED（暫時性錯誤或權杖錯誤），
+             收集伺服器的回覆（只有 SEND_OK 時有內容）)
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                reply = self._post(batch, site)
+                logger.debug(f"已送出 {len(batch)} 筆結果，新增 {reply.get('inserted')} 筆，"
+                             f"早於保留期限略過 {reply.get('dropped')} 筆")
+                return SEND_OK, reply
+            except urllib.error.HTTPError as e:
+                if e.code in AUTH_STATUS:
+                    # 權杖錯誤時重試也不會成功
+                    logger.error(f"收集伺服器拒絕存取（HTTP {e.code}），請檢查權杖設定")
+                    return SEND_FAILED, {}
+                if 400 <= e.code < 500 and e.code not in RETRYABLE_STATUS:
+                    # 這批資料本身有問題，重送也不會成功，移開以免擋住後面的結果
+                    self._reject(batch, site, e.code)
+                    return SEND_REJECTED, {}
+                error = f"HTTP {e.code}"
+            except (OSError, ValueError) as e:
+                error = str(e)
+
+            if attempt < self.retries:
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"送出結果失敗: {error}，{delay:g} 秒後重試")
+                time.sleep(delay)
+            else:
+                logger.warning(f"送出結果失敗: {error}")
+        return SEND_FAILED, {}
+
+    def _reject(self, batch: List[Dict], site: str, status: int) -> None:
+        """將收集伺服器拒收的一批結果附加到拒收檔"""
+        lines = [json.dumps({'site': site, 'status': status, 'result': result}, ensure_ascii=False) + '\n'
+                 for result in batch]
+        with open(self.rejected_file, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        logger.error(f"收集伺服器拒收 {len(batch)} 筆結果（HTTP {status}），已移到 {self.rejected_file}")
+
+    def flush(self) -> int:
+        """
+        分批送出緩衝檔中的結果，某一批重試後仍失敗或權杖錯誤時停止（剩下的留在緩衝檔等下次），
+        被拒收的批次移到拒收檔後繼續送出後面的結果
+
+        Returns:
+            送出的筆數
+        """
+        with self._flush_lock:
+            offset = self._read_offset()
+            sent = 0
+            while True:
+                site, batch, end = self._next_batch(offset)
+                if end == offset:
+                    break
+                status = self._send(batch, site)[0] if batch else SEND_OK
+                if status == SEND_FAILED:
+                    logger.warning(f"尚未送出的結果保留在 {self.buffer_file}")
+                    break
+                offset = end
+                self._write_offset(offset)
+                if status == SEND_OK:
+                    sent += len(batch)
+            self._compact(offset)
+            return sent
+
+    def send(self, results: Iterable[Dict]) -> Dict[str, int]:
+        """
+        不經過緩衝檔，直接分批送出結果，某一批重試後仍失敗或權杖錯誤時停止（被拒收的批次移到拒收檔）
+
+        Args:
+            results: 測試結果
+
+        Returns:
+            {'sent': 送出的筆數, 'inserted': 收集伺服器新增的筆數,
+             'dropped': 早於保留期限而略過的筆數, 'rejected': 被拒收的筆數}
+        """
+        counts = {'sent': 0, 'inserted': 0, 'dropped': 0, 'rejected': 0}
+        batch = []
+        for result in results:
+            batch.append(result)
+            if len(batch) >= self.batch_size:
+                if not self._send_counted(batch, counts):
+                    return counts
+                batch = []
+        if batch:
+            self._send_counted(batch, counts)
+        return counts
+
+    def _send_counted(self, batch: List[Dict], counts: Dict[str, int]) -> bool:
+        """送出一批結果並累加到 counts，失敗時返回 False"""
+        status, reply = self._send(batch, self.site)
+        if status == SEND_OK:
+            counts['sent'] += len(batch)
+            counts['inserted'] += reply.get('inserted') or 0
+            counts['dropped'] += reply.get('dropped') or 0
+        elif status == SEND_REJECTED:
+            counts['rejected'] += len(batch)
+        return status != SEND_FAILED
+
+
+def read_csv_results(csv_file: str) -> Iterator[Dict]:
+    """
+    逐列讀取本機的 speedtest_results.csv（轉送過去累積的結果）
+
+    Args:
+        csv_file: CSV 檔案路徑
+
+    Yields:
+        測試結果（數值仍為字串，由收集伺服器轉換）
+    """
+    with open(csv_file, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {name: value for name, value in row.items() if name in RESULT_COLUMNS}
@@ -0,0 +1,119 @@
+"""
+多次取樣的延遲與抖動測量
+對選定的伺服器送出多次 latency.txt 請求（同時或以固定間隔），
+計算最小值、中位數、p95、標準差（抖動）與失敗比例；整個測量有時間上限，
+逾時未回應的請求視為失敗
+"""
+
+import os
+import time
+import logging
+import statistics
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from speedtest_cache import latency_url, request_latency
+from speedtest_store import percentile
+
+logger = logging.getLogger("speedtest")
+
+# 取樣次數
+LATENCY_SAMPLE_COUNT = int(os.getenv("SPEEDTEST_LATENCY_SAMPLES", "10"))
+
+# 每次取樣開始的間隔（秒），0 表示同時送出
+LATENCY_SAMPLE_INTERVAL = float(os.getenv("SPEEDTEST_LATENCY_INTERVAL", "0.05"))
+
+# 整個測量的時間上限（秒）
+LATENCY_BUDGET_SECONDS = float(os.getenv("SPEEDTEST_LATENCY_BUDGET", "1.0"))
+
+# 測量結果的欄位
+LATENCY_FIELDS = ['ping_min_ms', 'ping_median_ms', 'ping_p95_ms', 'jitter_ms', 'ping_loss_ratio']
+
+
+def summarize_latency(samples: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    """
+    計算延遲統計
+
+    Args:
+        samples: 每次取樣的往返時間（毫秒），失敗為 None
+
+    Returns:
+        LATENCY_FIELDS 對應的數值（毫秒），沒有成功的取樣時延遲欄位為 None
+    """
+    succeeded = sorted(sample for sample in samples if sample is not None)
+    loss_ratio = round(1 - len(succeeded) / len(samples), 3) if samples else None
+    if not succeeded:
+        return {'ping_min_ms': None, 'ping_median_ms': None, 'ping_p95_ms': None,
+                'jitter_ms': None, 'ping_loss_ratio': loss_ratio}
+
+    return {
+        'ping_min_ms': round(succeeded[0], 2),
+        'ping_median_ms': round(statistics.median(succeeded), 2),
+        'ping_p95_ms': round(percentile(succeeded, 0.95), 2),
+        'jitter_ms': round(statistics.pstdev(succeeded), 2),
+        'ping_loss_ratio': loss_ratio,
+    }
+
+
+def sample_latency(url: str, samples: int = LATENCY_SAMPLE_COUNT, interval: float = LATENCY_SAMPLE_INTERVAL,
+                   budget: float = LATENCY_BUDGET_SECONDS) -> List[Optional[float]]:
+    """
+    在時間上限內對 latency.txt 取樣
+
+    每次取樣在各自的執行緒依排定的時間送出，回應慢的請求不會延後後續的取樣
+
+    Args:
+        url: latency.txt 網址
+        samples: 取樣次數
+        interval: 每次取樣開始的間隔（秒），0 表示同時送出
+        budget: 整個測量的時間上限（秒）
+
+    Returns:
+        每次取樣的往返時間（毫秒），失敗或逾時為 None
+    """
+    if samples <= 0:
+        return []
+    started = time.monotonic()
+    deadline = started + budget
+
+    def take(i: int) -> Optional[float]:
+        delay = started + i * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        elapsed = request_latency(url, remaining, f"j{i}")
+        return None if elapsed is None else elapsed * 1000
+
+    executor = ThreadPoolExecutor(max_workers=samples, thread_name_prefix="latency")
+    try:
+        futures = [executor.submit(take, i) for i in range(samples)]
+        wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        return [future.result() if future.done() and not future.exception() else None for future in futures]
+    finally:
+        # 不等待逾時的請求，它們會在各自的逾時後結束
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def measure_latency(server: Dict, samples: int = LATENCY_SAMPLE_COUNT, interval: float = LATENCY_SAMPLE_INTERVAL,
+                    budget: float = LATENCY_BUDGET_SECONDS) -> Dict[str, Optional[float]]:
+    """
+    測量伺服器的延遲與抖動
+
+    Args:
+        server: speedtest 伺服器資訊（需要 url）
+        samples: 取樣次數
+        interval: 每次取樣開始的間隔（秒），0 表示同時送出
+        budget: 整個測量的時間上限（秒）
+
+    Returns:
+        LATENCY_FIELDS 對應的數值
+    """
+    if not isinstance(server, dict) or not server.get('url'):
+        logger.warning("伺服器資訊沒有網址，略過延遲取樣")
+        return {field: None for field in LATENCY_FIELDS}
+
+    stats = summarize_latency(sample_latency(latency_url(server), samples, interval, budget))
+    logger.info(f"延遲取樣 {samples} 次 - 最小: {stats['ping_min_ms']} ms, 中位數: {stats['ping_median_ms']} ms, "
+                f"p95: {stats['ping_p95_ms']} ms, 抖動: {stats['jitter_ms']} ms, 失敗比例: {stats['ping_loss_ratio']}")
+    return stats
@@ -0,0 +1,235 @@
+"""
+網速測試 Prometheus 指標
+在記憶體中保存最近一次的下載速度、上傳速度、延遲（以該次的伺服器為標籤）、執行時間與失敗次數，
+由內建的 HTTP 伺服器以 Prometheus 文字格式提供 /metrics，抓取時不讀寫磁碟
+"""
+
+import os
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("speedtest")
+
+# 指標伺服器的監聽位址與埠（埠為 0 表示不啟動）
+METRICS_HOST = os.getenv("SPEEDTEST_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("SPEEDTEST_METRICS_PORT", "0"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 依伺服器區分的指標：(指標名稱, 測試結果欄位, 說明)
+SERVER_GAUGES = [
+    ('speedtest_download_mbps', 'download_mbps', '最近一次的下載速度（Mbps）'),
+    ('speedtest_upload_mbps', 'upload_mbps', '最近一次的上傳速度（Mbps）'),
+    ('speedtest_ping_ms', 'ping_ms', '最近一次的延遲（毫秒）'),
+    ('speedtest_ping_median_ms', 'ping_median_ms', '最近一次延遲取樣的中位數（毫秒）'),
+    ('speedtest_ping_p95_ms', 'ping_p95_ms', '最近一次延遲取樣的 p95（毫秒）'),
+    ('speedtest_jitter_ms', 'jitter_ms', '最近一次延遲取樣的標準差（毫秒）'),
+    ('speedtest_ping_loss_ratio', 'ping_loss_ratio', '最近一次延遲取樣的失敗比例'),
+    ('speedtest_bytes_received', 'bytes_received', '最近一次測試下載的 byte 數'),
+    ('speedtest_bytes_sent', 'bytes_sent', '最近一次測試上傳的 byte 數'),
+]
+
+# 伺服器標籤：(標籤名稱, 測試結果欄位)
+SERVER_LABELS = [
+    ('server_name', 'server_name'),
+    ('server_country', 'server_country'),
+    ('server_sponsor', 'server_sponsor'),
+]
+
+
+def escape_label_value(value) -> str:
+    """
+    依 Prometheus 文字格式跳脫標籤值
+
+    Args:
+        value: 標籤值
+
+    Returns:
+        跳脫後的字串
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+class SpeedtestMetrics:
+    """記憶體中的網速測試指標"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 只保留最近一次成功測試的伺服器，換伺服器後舊伺服器的序列不再輸出
+        self._latest: Dict[Tuple[Tuple[str, str], ...], Dict[str, float]] = {}
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        # 逾時的那次測試之後才結束時，已計入失敗，不再重複計算次數
+        self._timed_out_pending = False
+        self.duration_sum = 0.0
+        self.last_duration: Optional[float] = None
+        self.last_success: Optional[float] = None
+
+    def _record_run(self, duration: float) -> None:
+        self.runs += 1
+        self.duration_sum += duration
+        self.last_duration = duration
+
+    def record_success(self, result: Dict, duration: float) -> None:
+        """
+        記錄成功的測試結果
+
+        Args:
+            result: network_speedtest.test_speed 的結果
+            duration: 測試耗時（秒）
+        """
+        labels = tuple((name, result.get(field) or '') for name, field in SERVER_LABELS)
+        with self._lock:
+            if self._timed_out_pending:
+                self._timed_out_pending = False
+            else:
+                self._record_run(duration)
+            self._latest = {labels: {field: result[field] for _, field, _ in SERVER_GAUGES if result.get(field) is not None}}
+            self.last_success = time.time()
+
+    def record_failure(self, duration: float) -> None:
+        """
+        記錄失敗的測試
+
+        Args:
+            duration: 測試耗時（秒）
+        """
+        with self._lock:
+            if self._timed_out_pending:
+                self._timed_out_pending = False
+                return
+            self._record_run(duration)
+            self.failures += 1
+
+    def record_timeout(self, duration: float) -> None:
+        """
+        記錄超過排程逾時仍未完成的測試（計為失敗）
+
+        該次測試之後才結束時，record_success 只更新最近一次的數值，record_failure 不再重複計算
+
+        Args:
+            duration: 逾時前已執行的時間（秒）
+        """
+        with self._lock:
+            self._record_run(duration)
+            self.failures += 1
+            self.timeouts += 1
+            self._timed_out_pending = True
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文字格式輸出所有指標
+
+        Returns:
+            指標文字
+        """
+        with self._lock:
+            latest = dict(self._latest)
+            runs, failures, timeouts = self.runs, self.failures, self.timeouts
+            duration_sum, last_duration, last_success = self.duration_sum, self.last_duration, self.last_success
+
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, Tuple, float]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, field, help_text in SERVER_GAUGES:
+            metric(name, 'gauge', help_text, [
+                (name, labels, values[field]) for labels, values in latest.items() if field in values
+            ])
+
+        metric('speedtest_runs_total', 'counter', '測試執行次數', [('speedtest_runs_total', (), runs)])
+        metric('speedtest_failures_total', 'counter', '測試失敗次數（包含逾時）', [('speedtest_failures_total', (), failures)])
+        metric('speedtest_timeouts_total', 'counter', '測試超過排程逾時的次數', [('speedtest_timeouts_total', (), timeouts)])
+        metric('speedtest_run_duration_seconds', 'summary', '測試執行時間（秒）', [
+            ('speedtest_run_duration_seconds_sum', (), duration_sum),
+            ('speedtest_run_duration_seconds_count', (), runs),
+        ])
+        if last_duration is not None:
+            metric('speedtest_last_run_duration_seconds', 'gauge', '最近一次測試的執行時間（秒）',
+                   [('speedtest_last_run_duration_seconds', (), last_duration)])
+        if last_success is not None:
+            metric('speedtest_last_success_timestamp_seconds', 'gauge', '最近一次成功測試的時間（Unix 時間）',
+                   [('speedtest_last_success_timestamp_seconds', (), last_success)])
+
+        return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug(f"metrics {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """在背景執行緒提供 /metrics 的 HTTP 伺服器"""
+
+    def __init__(self, metrics: SpeedtestMetrics, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        """
+        Args:
+            metrics: 要輸出的指標
+            host: 監聽位址
+            port: 監聽埠（0 表示自動選擇）
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def start(self) -> "MetricsServer":
+        """在背景執行緒啟動伺服器"""
+        self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics = self.metrics
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="speedtest-metrics", daemon=True)
+        self._thread.start()
+        logger.info(f"Prometheus 指標伺服器已啟動: {self.url}")
+        return self
+
+    def stop(self) -> None:
+        """停止伺服器"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> "MetricsServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
@@ -0,0 +1,238 @@
+"""
+事件驅動的定時排程
+主執行緒等待到下一次預定時間（不輪詢），到期時交給背景工作執行緒執行，
+支援隨機延遲（jitter）、單次執行逾時、重疊時略過或排隊、執行中變更間隔，以及 Ctrl+C 立即停止
+"""
+
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+logger = logging.getLogger("speedtest")
+
+# 上一次執行還沒結束時的處理方式
+OVERLAP_POLICIES = ("skip", "queue")
+
+# 執行間隔、隨機延遲與單次逾時（秒，逾時設為 0 表示不限制）
+SCHEDULE_INTERVAL_SECONDS = float(os.getenv("SPEEDTEST_INTERVAL", "3600"))
+SCHEDULE_JITTER_SECONDS = float(os.getenv("SPEEDTEST_JITTER", "0"))
+SCHEDULE_TIMEOUT_SECONDS = float(os.getenv("SPEEDTEST_TIMEOUT", "600")) or None
+SCHEDULE_OVERLAP = os.getenv("SPEEDTEST_OVERLAP", "skip")
+
+_STOP = object()
+
+
+class Scheduler:
+    """固定間隔執行工作的排程器"""
+
+    def __init__(self, job: Callable[[], None], interval: float, jitter: float = 0.0,
+                 timeout: Optional[float] = None, overlap: str = "skip",
+                 rng: Optional[random.Random] = None,
+                 on_timeout: Optional[Callable[[float], None]] = None):
+        """
+        Args:
+            job: 要執行的工作
+            interval: 執行間隔（秒），以開始時間為基準固定間隔，不會因為執行時間而漂移
+            jitter: 每次在預定時間後隨機延遲 0~jitter 秒，避免多台機器同時執行
+            timeout: 單次執行的逾時秒數，逾時時記錄錯誤，該次結束前之後的排程依 overlap 處理（None 表示不限制）
+            overlap: skip 表示上一次還在執行時略過本次；queue 表示排隊等上一次結束後執行（最多排一次）
+            rng: 產生隨機延遲的亂數產生器
+            on_timeout: 單次執行逾時時呼叫，參數為已執行的秒數（例如記錄為失敗）
+        """
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"不支援的重疊處理方式: {overlap}（可用: {', '.join(OVERLAP_POLICIES)}）")
+        if interval <= 0:
+            raise ValueError("執行間隔必須大於 0")
+
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.overlap = overlap
+        self.on_timeout = on_timeout
+        self._rng = rng or random.Random()
+        self._stop = threading.Event()
+        # stop() 或 reschedule() 時喚醒等待中的主執行緒
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._rescheduled = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=1)
+        self._busy = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.runs = 0
+        self.skipped = 0
+        self.timed_out = 0
+        self.next_run: Optional[datetime] = None
+
+    def _run_job(self) -> None:
+        """
+        在獨立的執行緒執行工作
+
+        逾時的執行緒無法強制結束，逾時後記錄錯誤並繼續等到它真正結束才返回，
+        期間維持執行中的狀態，之後的排程依重疊策略略過或排隊，不會同時執行兩次
+        """
+        done = threading.Event()
+
+        def target():
+            try:
+                self.job()
+            except Exception as e:
+                logger.error(f"排程工作執行失敗: {e}", exc_info=True)
+            finally:
+                done.set()
+
+        started = time.monotonic()
+        threading.Thread(target=target, name="scheduled-job", daemon=True).start()
+        if not done.wait(self.timeout):
+            self.timed_out += 1
+            logger.error(f"排程工作超過 {self.timeout} 秒仍未完成，結束前之後的排程將略過或排隊")
+            if self.on_timeout is not None:
+                try:
+                    self.on_timeout(time.monotonic() - started)
+                except Exception as e:
+                    logger.error(f"排程逾時處理失敗: {e}", exc_info=True)
+            while not done.wait(1.0):
+                if self._stop.is_set():
+                    logger.warning("排程已停止，不再等待逾時的排程工作")
+                    break
+            else:
+                logger.warning(f"逾時的排程工作已結束，共耗時 {time.monotonic() - started:.1f} 秒")
+        else:
+            logger.debug(f"排程工作完成，耗時 {time.monotonic() - started:.1f} 秒")
+        self.runs += 1
+
+    def _work(self) -> None:
+        """背景工作執行緒：依序執行佇列中的工作"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            self._busy.set()
+            try:
+                self._run_job()
+            finally:
+                self._busy.clear()
+
+    def trigger(self) -> bool:
+        """
+        立即送出一次執行
+
+        Returns:
+            是否已送出（上一次還在執行且策略為 skip，或佇列已滿時返回 False）
+        """
+        if self.overlap == "skip" and self._busy.is_set():
+            self.skipped += 1
+            logger.warning(f"上一次排程工作還在執行，略過本次（累計略過 {self.skipped} 次）")
+            return False
+        try:
+            self._queue.put_nowait(None)
+            return True
+        except queue.Full:
+            self.skipped += 1
+            logger.warning(f"已有排程工作在等待執行，略過本次（累計略過 {self.skipped} 次）")
+            return False
+
+    def reschedule(self, interval: float) -> None:
+        """
+        變更執行間隔，下一次執行改為上一次開始的時間加上新的間隔（可以在工作中呼叫）
+
+        Args:
+            interval: 新的執行間隔（秒）
+        """
+        if interval <= 0:
+            raise ValueError("執行間隔必須大於 0")
+        with self._lock:
+            self.interval = interval
+            self._rescheduled = True
+        self._wake.set()
+
+    def _delay(self) -> float:
+        return self._rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0
+
+    def start(self) -> None:
+        """啟動背景工作執行緒"""
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name="scheduler-worker", daemon=True)
+            self._worker.start()
+
+    def stop(self, wait: float = 5.0, cancel_pending: bool = True) -> None:
+        """
+        停止排程並等待背景工作執行緒結束
+
+        Args:
+            wait: 等待目前工作結束的最長秒數
+            cancel_pending: 是否取消已送出但尚未開始的工作
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            if cancel_pending:
+                try:
+                    while True:
+                        self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+            try:
+                self._queue.put(_STOP, timeout=wait)
+                self._worker.join(wait)
+            except queue.Full:
+                logger.warning("排程工作仍在執行，不再等待")
+            self._worker = None
+
+    def run_forever(self, run_immediately: bool = True, max_runs: Optional[int] = None) -> None:
+        """
+        執行排程直到 stop() 或 Ctrl+C
+
+        Args:
+            run_immediately: 是否在啟動時立即執行一次
+            max_runs: 成功送出幾次後結束（略過的不計，None 表示不限制）
+        """
+        self.start()
+        scheduled = 0
+        finished = False
+        base = time.monotonic()
+        last_start = None
+        if not run_immediately:
+            base += self.interval
+
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    if self._rescheduled and last_start is not None:
+                        # 間隔變更後以上一次開始的時間重新計算；已經超過時立即執行
+                        base = max(last_start + self.interval, time.monotonic())
+                    self._rescheduled = False
+                    self._wake.clear()
+
+                due = base + self._delay()
+                self.next_run = datetime.now() + timedelta(seconds=max(0.0, due - time.monotonic()))
+                logger.info(f"下次執行時間: {self.next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+
+                # 等到預定時間；stop() 會立刻喚醒，reschedule() 喚醒後重新計算時間
+                if self._wake.wait(max(0.0, due - time.monotonic())):
+                    continue
+
+                last_start = time.monotonic()
+                if self.trigger():
+                    scheduled += 1
+                if max_runs is not None and scheduled >= max_runs:
+                    finished = True
+                    break
+
+                # 下一次以固定間隔計算；如果錯過多次（例如電腦休眠），直接跳到下一個未來的時間點
+                base += self.interval
+                now = time.monotonic()
+                if base <= now:
+                    base += ((now - base) // self.interval + 1) * self.interval
+
+        except KeyboardInterrupt:
+            logger.info("收到中斷訊號，停止排程")
+
+        finally:
+            # 正常結束時等已送出的工作執行完；中斷時取消尚未開始的工作
+            self.stop(cancel_pending=not finished)
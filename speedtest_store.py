@@ -0,0 +1,451 @@
+"""
+網速測試結果時間序列儲存
+原始結果存入 SQLite 並以時間建立索引，每次寫入時重新計算受影響的每小時與每日彙總
+（最小值、平均值、最大值、p95），原始資料依保留天數自動刪除；
+查詢只讀取指定時間範圍，不需要掃描全部歷史；
+集中收集多個站點的結果時以 site 區分，同一站點、同一時間的結果只保留一筆
+"""
+
+import os
+import math
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import create_engine, inspect, text, Column, Index, Integer, String, Float, DateTime, select, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("speedtest")
+
+# 資料庫檔案路徑
+SPEEDTEST_DB = os.getenv("SPEEDTEST_DB", "speedtest_results.db")
+
+# 原始資料與每小時彙總的保留天數（每日彙總永久保留）
+RAW_RETENTION_DAYS = int(os.getenv("SPEEDTEST_RAW_RETENTION_DAYS", "90"))
+HOURLY_RETENTION_DAYS = int(os.getenv("SPEEDTEST_HOURLY_RETENTION_DAYS", "400"))
+
+# 需要彙總的數值欄位
+METRICS = ['download_mbps', 'upload_mbps', 'ping_ms', 'jitter_ms']
+
+# 彙總週期
+PERIODS = ('hour', 'day')
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+Base = declarative_base()
+
+
+class SpeedtestResult(Base):
+    """原始測試結果"""
+    __tablename__ = 'speedtest_results'
+    # 站點為 NULL（本機結果）時不受唯一限制
+    __table_args__ = (Index('ux_speedtest_results_site_timestamp', 'site', 'timestamp', unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    download_mbps = Column(Float)
+    upload_mbps = Column(Float)
+    ping_ms = Column(Float)
+    server_name = Column(String)
+    server_country = Column(String)
+    server_sponsor = Column(String)
+    ping_min_ms = Column(Float)
+    ping_median_ms = Column(Float)
+    ping_p95_ms = Column(Float)
+    jitter_ms = Column(Float)
+    ping_loss_ratio = Column(Float)
+    site = Column(String)
+    bytes_received = Column(Integer)
+    bytes_sent = Column(Integer)
+
+
+class TcpProbeResult(Base):
+    """TCP 連線延遲監控結果"""
+    __tablename__ = 'tcp_probe_results'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    target = Column(String, nullable=False, index=True)
+    latency_ms = Column(Float)
+    error = Column(String)
+
+
+class SpeedtestRollup(Base):
+    """每小時與每日彙總（依站點區分，本機結果的站點為空字串）"""
+    __tablename__ = 'speedtest_rollups'
+
+    period = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    metric = Column(String, primary_key=True)
+    site = Column(String, primary_key=True, default='')
+    count = Column(Integer)
+    min = Column(Float)
+    avg = Column(Float)
+    max = Column(Float)
+    p95 = Column(Float)
+
+
+def bucket_start(timestamp: datetime, period: str) -> datetime:
+    """
+    取得時間所在週期的開始時間
+
+    Args:
+        timestamp: 時間
+        period: hour 或 day
+
+    Returns:
+        週期開始時間
+    """
+    if period == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_end(start: datetime, period: str) -> datetime:
+    return start + (timedelta(hours=1) if period == 'hour' else timedelta(days=1))
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    以最近排名法（nearest-rank）計算百分位數
+
+    Args:
+        sorted_values: 已排序的數值
+        fraction: 百分位（0~1）
+
+    Returns:
+        百分位數
+    """
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _parse_timestamp(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class SpeedtestStore:
+    """網速測試結果時間序列儲存"""
+
+    def __init__(self, path: str = None, raw_retention_days: int = RAW_RETENTION_DAYS,
+                 hourly_retention_days: int = HOURLY_RETENTION_DAYS, engine: Optional[Engine] = None):
+        """
+        Args:
+            path: SQLite 檔案路徑（預設為 SPEEDTEST_DB）
+            raw_retention_days: 原始資料保留天數
+            hourly_retention_days: 每小時彙總保留天數
+            engine: 直接指定資料庫引擎（測試用）
+        """
+        self.engine = engine or create_engine(f"sqlite:///{path or SPEEDTEST_DB}")
+        self.raw_retention_days = raw_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        Base.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self._migrate_rollups()
+        self._Session = sessionmaker(bind=self.engine)
+
+    def _add_missing_columns(self) -> None:
+        """舊版資料庫缺少後來新增的欄位時補上（舊資料為 NULL）"""
+        existing = {column['name'] for column in inspect(self.engine).get_columns(SpeedtestResult.__tablename__)}
+        missing = [column for column in SpeedtestResult.__table__.columns if column.name not in existing]
+        if not missing:
+            return
+        with self.engine.begin() as connection:
+            for column in missing:
+                column_type = column.type.compile(dialect=self.engine.dialect)
+                connection.execute(text(
+                    f"ALTER TABLE {SpeedtestResult.__tablename__} ADD COLUMN {column.name} {column_type}"
+                ))
+            # 新欄位的索引在資料表已存在時不會由 create_all 建立
+            for index in SpeedtestResult.__table__.indexes:
+                index.create(connection, checkfirst=True)
+
+    def _migrate_rollups(self) -> None:
+        """舊版彙總資料表沒有站點欄位時重建（主鍵改變無法以 ALTER TABLE 補上，舊彙總歸入本機站點）"""
+        table = SpeedtestRollup.__tablename__
+        existing = {column['name'] for column in inspect(self.engine).get_columns(table)}
+        if 'site' in existing:
+            return
+        columns = ', '.join(sorted(existing))
+        with self.engine.begin() as connection:
+            connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+            SpeedtestRollup.__table__.create(connection)
+            connection.execute(text(
+                f"INSERT INTO {table} ({columns}, site) SELECT {columns}, '' FROM {table}_old"
+            ))
+            connection.execute(text(f"DROP TABLE {table}_old"))
+
+    def close(self) -> None:
+        """關閉資料庫引擎"""
+        self.engine.dispose()
+
+    def add_result(self, result: Dict) -> None:
+        """
+        新增一筆測試結果並更新彙總
+
+        Args:
+            result: network_speedtest.test_speed 的結果
+        """
+        self.add_results([result])
+
+    def add_results(self, results: Iterable[Dict], now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        批次新增測試結果，在同一個交易中更新受影響的彙總並套用保留期限
+
+        同一站點、同一時間的結果已存在時略過（重送的批次不會重複寫入）；
+        早於原始資料保留期限的結果也略過，因為該週期的原始資料已刪除，
+        重新計算會以少數遲到的結果覆蓋完整的彙總
+
+        Args:
+            results: 測試結果串流
+            now: 保留期限的基準時間（預設為這批結果中最晚的時間；
+                 收集其他機器的結果時應傳入本機時間，避免送來的時間刪掉其他站點的資料）
+
+        Returns:
+            {'received': 收到的筆數, 'inserted': 實際新增的筆數, 'dropped': 早於保留期限而略過的筆數}
+            （其餘是已存在的重複結果）
+        """
+        columns = [column.name for column in SpeedtestResult.__table__.columns if column.name != 'id']
+        rows = []
+        for result in results:
+            row = {name: result.get(name) for name in columns}
+            row['timestamp'] = _parse_timestamp(result['timestamp'])
+            rows.append(row)
+        counts = {'received': len(rows), 'inserted': 0, 'dropped': 0}
+        if not rows:
+            return counts
+
+        now = now or max(row['timestamp'] for row in rows)
+        cutoff = self._raw_cutoff(now)
+        counts['dropped'] = sum(row['timestamp'] < cutoff for row in rows)
+        if counts['dropped']:
+            logger.warning(f"略過 {counts['dropped']} 筆早於原始資料保留期限（{cutoff:%Y-%m-%d}）的結果")
+            rows = [row for row in rows if row['timestamp'] >= cutoff]
+            if not rows:
+                return counts
+
+        buckets = {
+            (row['site'] or '', period, bucket_start(row['timestamp'], period)) for row in rows for period in PERIODS
+        }
+
+        session = self._Session()
+        try:
+            statement = sqlite_insert(SpeedtestResult.__table__).on_conflict_do_nothing()
+            counts['inserted'] = session.execute(statement, rows).rowcount
+            for site, period, start in sorted(buckets):
+                self._refresh_rollup(session, period, start, site)
+            self._apply_retention(session, now)
+            session.commit()
+            return counts
+
+        finally:
+            session.close()
+
+    def _refresh_rollup(self, session, period: str, start: datetime, site: str = '') -> None:
+        """由原始資料重新計算一個站點、一個週期的彙總"""
+        end = _bucket_end(start, period)
+        metric_columns = [getattr(SpeedtestResult, metric) for metric in METRICS]
+        site_filter = SpeedtestResult.site == site if site else SpeedtestResult.site.is_(None)
+        rows = session.execute(
+            select(*metric_columns).where(
+                SpeedtestResult.timestamp >= start, SpeedtestResult.timestamp < end, site_filter
+            )
+        ).all()
+
+        for index, metric in enumerate(METRICS):
+            values = sorted(row[index] for row in rows if row[index] is not None)
+            if not values:
+                continue
+            stmt = sqlite_insert(SpeedtestRollup).values(
+                period=period, bucket_start=start, metric=metric, site=site, count=len(values),
+                min=values[0], avg=sum(values) / len(values), max=values[-1], p95=percentile(values, 0.95)
+            )
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=['period', 'bucket_start', 'metric', 'site'],
+                set_={name: stmt.excluded[name] for name in ('count', 'min', 'avg', 'max', 'p95')}
+            ))
+
+    def _raw_cutoff(self, now: datetime) -> datetime:
+        # 至少保留一天，避免當天的每日彙總被截斷
+        return bucket_start(now, 'day') - timedelta(days=max(self.raw_retention_days, 1))
+
+    def _apply_retention(self, session, now: datetime) -> None:
+        """刪除超過保留期限的原始資料與每小時彙總"""
+        raw_cutoff = self._raw_cutoff(now)
+        session.execute(delete(SpeedtestResult).where(SpeedtestResult.timestamp < raw_cutoff))
+        hourly_cutoff = bucket_start(now, 'day') - timedelta(days=self.hourly_retention_days)
+        session.execute(delete(SpeedtestRollup).where(
+            SpeedtestRollup.period == 'hour', SpeedtestRollup.bucket_start < hourly_cutoff
+        ))
+
+    def add_tcp_results(self, results: Iterable[Dict]) -> int:
+        """
+        批次新增 TCP 連線延遲監控結果（同一個交易），並套用原始資料的保留期限
+
+        Args:
+            results: 每筆包含 timestamp、target、latency_ms（失敗為 None）與 error
+
+        Returns:
+            新增的筆數
+        """
+        rows = [{
+            'timestamp': _parse_timestamp(result['timestamp']),
+            'target': result['target'],
+            'latency_ms': result.get('latency_ms'),
+            'error': result.get('error'),
+        } for result in results]
+        if not rows:
+            return 0
+
+        session = self._Session()
+        try:
+            session.execute(TcpProbeResult.__table__.insert(), rows)
+            cutoff = self._raw_cutoff(max(row['timestamp'] for row in rows))
+            session.execute(delete(TcpProbeResult).where(TcpProbeResult.timestamp < cutoff))
+            session.commit()
+            return len(rows)
+
+        finally:
+            session.close()
+
+    def query_tcp(self, start: datetime, end: datetime, target: Optional[str] = None) -> List[Dict]:
+        """
+        查詢時間範圍內的 TCP 連線延遲監控結果
+
+        Args:
+            start: 開始時間（包含）
+            end: 結束時間（不包含）
+            target: 只查詢指定目標（預設全部）
+
+        Returns:
+            依時間排序的結果列表
+        """
+        session = self._Session()
+        try:
+            query = select(TcpProbeResult).where(TcpProbeResult.timestamp >= start, TcpProbeResult.timestamp < end)
+            if target is not None:
+                query = query.where(TcpProbeResult.target == target)
+            query = query.order_by(TcpProbeResult.timestamp, TcpProbeResult.id)
+            return [
+                {'timestamp': row.timestamp.strftime(TIMESTAMP_FORMAT), 'target': row.target,
+                 'latency_ms': row.latency_ms, 'error': row.error}
+                for row in session.execute(query).scalars()
+            ]
+
+        finally:
+            session.close()
+
+    def query_raw(self, start: datetime, end: datetime, site: Optional[str] = None) -> List[Dict]:
+        """
+        查詢時間範圍內的原始結果（以時間索引讀取）
+
+        Args:
+            start: 開始時間（包含）
+            end: 結束時間（不包含）
+            site: 只查詢指定站點（預設全部，以站點與時間的索引讀取）
+
+        Returns:
+            依時間排序的結果列表，時間格式同 test_speed
+        """
+        session = self._Session()
+        try:
+            query = select(SpeedtestResult).where(SpeedtestResult.timestamp >= start, SpeedtestResult.timestamp < end)
+            if site is not None:
+                query = query.where(SpeedtestResult.site == site)
+            rows = session.execute(query.order_by(SpeedtestResult.timestamp, SpeedtestResult.id)).scalars()
+            results = []
+            for row in rows:
+                result = {column.name: getattr(row, column.name) for column in SpeedtestResult.__table__.columns}
+                result.pop('id')
+                result['timestamp'] = row.timestamp.strftime(TIMESTAMP_FORMAT)
+                results.append(result)
+            return results
+
+        finally:
+            session.close()
+
+    def sites(self) -> List[Dict]:
+        """
+        列出所有站點的結果筆數與時間範圍
+
+        Returns:
+            依站點名稱排序的列表，每筆包含 site、count、first、last（本機結果的 site 為 None）
+        """
+        session = self._Session()
+        try:
+            rows = session.execute(
+                select(SpeedtestResult.site, func.count(), func.min(SpeedtestResult.timestamp),
+                       func.max(SpeedtestResult.timestamp))
+                .group_by(SpeedtestResult.site)
+                .order_by(SpeedtestResult.site)
+            ).all()
+            return [
+                {'site': site, 'count': count, 'first': first.strftime(TIMESTAMP_FORMAT),
+                 'last': last.strftime(TIMESTAMP_FORMAT)}
+                for site, count, first, last in rows
+            ]
+
+        finally:
+            session.close()
+
+    def query_rollups(self, period: str, start: datetime, end: datetime,
+                      metric: Optional[str] = None, site: str = '') -> List[Dict]:
+        """
+        查詢時間範圍內的彙總
+
+        Args:
+            period: hour 或 day
+            start: 開始時間（包含）
+            end: 結束時間（不包含）
+            metric: 只查詢指定欄位（預設全部）
+            site: 站點（預設為本機結果）
+
+        Returns:
+            依週期開始時間排序的彙總列表
+        """
+        if period not in PERIODS:
+            raise ValueError(f"不支援的彙總週期: {period}")
+
+        session = self._Session()
+        try:
+            query = select(SpeedtestRollup).where(
+                SpeedtestRollup.period == period,
+                SpeedtestRollup.bucket_start >= start,
+                SpeedtestRollup.bucket_start < end,
+                SpeedtestRollup.site == site
+            )
+            if metric is not None:
+                query = query.where(SpeedtestRollup.metric == metric)
+            query = query.order_by(SpeedtestRollup.bucket_start, SpeedtestRollup.metric)
+
+            return [
+                {'bucket_start': row.bucket_start, 'metric': row.metric, 'count': row.count,
+                 'min': row.min, 'avg': row.avg, 'max': row.max, 'p95': row.p95}
+                for row in session.execute(query).scalars()
+            ]
+
+        finally:
+            session.close()
+
+    def time_range(self) -> Optional[Tuple[datetime, datetime]]:
+        """
+        取得原始資料的最早與最晚時間
+
+        Returns:
+            (最早時間, 最晚時間)，沒有資料時返回 None
+        """
+        session = self._Session()
+        try:
+            first = session.execute(
+                select(SpeedtestResult.timestamp).order_by(SpeedtestResult.timestamp).limit(1)
+            ).scalar()
+            if first is None:
+                return None
+            last = session.execute(
+                select(SpeedtestResult.timestamp).order_by(SpeedtestResult.timestamp.desc()).limit(1)
+            ).scalar()
+            return first, last
+
+        finally:
+            session.close()
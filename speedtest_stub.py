@@ -0,0 +1,302 @@
+"""
+本機 speedtest 模擬伺服器
+模擬 speedtest.net 協定的設定、伺服器列表、下載、上傳與延遲端點，
+可設定頻寬與延遲，讓 network_speedtest 在沒有網路的環境（筆電、CI）也能測試與計時
+
+使用方式：
+    python speedtest_stub.py --port 8080 --download-mbps 100 --upload-mbps 20 --latency-ms 15
+    SPEEDTEST_BASE_URL=http://127.0.0.1:8080 python network_speedtest.py
+"""
+
+import re
+import time
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from logger_config import setup_logger
+
+logger = setup_logger("speedtest_stub")
+
+# 下載檔案以此區塊重複填充，每次寫入的大小
+CHUNK_SIZE = 16 * 1024
+_PAYLOAD = (b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ' * (CHUNK_SIZE // 36 + 1))[:CHUNK_SIZE]
+
+# speedtest.net 的 randomNxN.jpg 大約是 N * N * 2 bytes
+_RANDOM_IMAGE = re.compile(r'^/speedtest/random(\d+)x\d+\.jpg$')
+
+# 連線的接收緩衝區，避免上傳資料大量堆在 socket 緩衝區而高估上傳速度
+RECEIVE_BUFFER_SIZE = 64 * 1024
+
+
+class RateLimiter:
+    """所有連線共用的頻寬限制（依序分配傳送時間）"""
+
+    def __init__(self, mbps: Optional[float]):
+        """
+        Args:
+            mbps: 頻寬上限（Mbps），None 表示不限制
+        """
+        self.bytes_per_second = mbps * 1_000_000 / 8 if mbps else None
+        self._lock = threading.Lock()
+        self._available_at = 0.0
+
+    def consume(self, size: int) -> None:
+        """
+        等待到可以傳送 size bytes 為止
+
+        Args:
+            size: 要傳送的 bytes
+        """
+        if self.bytes_per_second is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._available_at, now)
+            self._available_at = start + size / self.bytes_per_second
+            wait = self._available_at - now
+        time.sleep(wait)
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def server_bind(self):
+        # 在監聽 socket 設定，讓接受的連線在握手時就使用較小的接收視窗
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        super().server_bind()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server_version = "SpeedtestStub/1.0"
+
+    @property
+    def stub(self) -> "StubSpeedtestServer":
+        return self.server.stub
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, body: bytes, content_type: str = 'text/plain') -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.stub.delay()
+
+        if path == '/speedtest-config.php':
+            self._send(self.stub.config_xml(), 'text/xml')
+        elif path in ('/speedtest-servers-static.php', '/speedtest-servers.php'):
+            self._send(self.stub.servers_xml(), 'text/xml')
+        elif path == '/speedtest/latency.txt':
+            self._send(b'test=test')
+        elif path == '/speedtest/upload.php':
+            self._send(b'size=0')
+        elif path in ('/', '/speedtest/', '/index.html'):
+            # 讓 speedtest 的 mini server 模式（--mini）也能辨識
+            self._send(b'<html><script>upload_extension: "php"</script></html>', 'text/html')
+        else:
+            match = _RANDOM_IMAGE.match(path)
+            if match:
+                self._download(self.stub.download_size(int(match.group(1))))
+            else:
+                self.send_error(404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path != '/speedtest/upload.php':
+            self.send_error(404)
+            return
+
+        self.stub.delay()
+        remaining = int(self.headers.get('Content-Length') or 0)
+        received = 0
+        try:
+            while remaining > 0:
+                self.stub.upload_limiter.consume(min(CHUNK_SIZE, remaining))
+                data = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                received += len(data)
+                remaining -= len(data)
+        except (ConnectionError, socket.timeout):
+            # 測試時間到時用戶端會直接中斷上傳
+            pass
+        finally:
+            self.stub.record('bytes_received', received)
+            self.stub.record('uploads', 1)
+
+        if remaining == 0:
+            self._send(f'size={received}'.encode())
+        else:
+            self.close_connection = True
+
+    def _download(self, size: int) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+
+        sent = 0
+        try:
+            while sent < size:
+                chunk = _PAYLOAD[:min(CHUNK_SIZE, size - sent)]
+                self.stub.download_limiter.consume(len(chunk))
+                self.wfile.write(chunk)
+                sent += len(chunk)
+        except (ConnectionError, socket.timeout):
+            # 測試時間到時用戶端會直接關閉連線
+            self.close_connection = True
+        finally:
+            self.stub.record('bytes_sent', sent)
+            self.stub.record('downloads', 1)
+
+
+class StubSpeedtestServer:
+    """在背景執行緒執行的本機 speedtest 模擬伺服器"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, download_mbps: Optional[float] = None,
+                 upload_mbps: Optional[float] = None, latency_ms: float = 0.0, test_length: int = 10,
+                 threads: int = 2, download_scale: float = 1.0, upload_ratio: int = 5,
+                 upload_chunks: int = 6):
+        """
+        Args:
+            host: 監聽位址
+            port: 監聽埠（0 表示自動選擇）
+            download_mbps: 下載頻寬上限（Mbps），None 表示不限制
+            upload_mbps: 上傳頻寬上限（Mbps），None 表示不限制
+            latency_ms: 每個請求回應前的延遲（毫秒）
+            test_length: 設定中的下載與上傳測試秒數
+            threads: 設定中的執行緒數（下載使用兩倍）
+            download_scale: 下載檔案大小相對於 speedtest.net 的比例
+            upload_ratio: 設定中的上傳大小比例（1~7，越大上傳的區塊越大）
+            upload_chunks: 設定中的上傳區塊數上限
+        """
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.test_length = max(1, int(test_length))
+        self.threads = threads
+        self.download_scale = download_scale
+        self.upload_ratio = upload_ratio
+        self.upload_chunks = upload_chunks
+        self.download_limiter = RateLimiter(download_mbps)
+        self.upload_limiter = RateLimiter(upload_mbps)
+        self.stats: Dict[str, int] = {'bytes_sent': 0, 'bytes_received': 0, 'downloads': 0, 'uploads': 0}
+        self._stats_lock = threading.Lock()
+        self._server: Optional[_StubHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """伺服器網址（設定為 SPEEDTEST_BASE_URL）"""
+        return f"http://{self.host}:{self.port}"
+
+    def delay(self) -> None:
+        """模擬網路延遲"""
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def record(self, key: str, value: int) -> None:
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def download_size(self, dimension: int) -> int:
+        """
+        randomNxN.jpg 的檔案大小
+
+        Args:
+            dimension: 圖片邊長 N
+
+        Returns:
+            bytes
+        """
+        return max(CHUNK_SIZE, int(dimension * dimension * 2 * self.download_scale))
+
+    def config_xml(self) -> bytes:
+        """speedtest-config.php 的內容"""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<settings>\n'
+            f'<client ip="{self.host}" lat="25.0330" lon="121.5654" isp="Speedtest Stub" isprating="3.7" '
+            'rating="0" ispdlavg="0" ispulavg="0" loggedin="0" country="TW" />\n'
+            f'<server-config threadcount="{self.threads}" ignoreids="" notonmap="" forcepingid="" '
+            'preferredserverid="" />\n'
+            f'<download testlength="{self.test_length}" initialtest="250K" mintestsize="250K" threadsperurl="1" />\n'
+            f'<upload testlength="{self.test_length}" ratio="{self.upload_ratio}" initialtest="0" mintestsize="32K" '
+            f'threads="{self.threads}" maxchunksize="512K" maxchunkcount="{self.upload_chunks}" threadsperurl="4" />\n'
+            '</settings>\n'
+        ).encode()
+
+    def servers_xml(self) -> bytes:
+        """speedtest-servers-static.php 的內容（只有本機伺服器）"""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n<settings>\n<servers>\n'
+            f'<server url="{self.url}/speedtest/upload.php" lat="25.0330" lon="121.5654" name="Localhost" '
+            f'country="Local" cc="TW" sponsor="Speedtest Stub" id="1" host="{self.host}:{self.port}" />\n'
+            '</servers>\n</settings>\n'
+        ).encode()
+
+    def start(self) -> "StubSpeedtestServer":
+        """在背景執行緒啟動伺服器"""
+        self._server = _StubHTTPServer((self.host, self.port), _StubHandler)
+        self._server.stub = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="speedtest-stub", daemon=True)
+        self._thread.start()
+        logger.info(f"speedtest 模擬伺服器已啟動: {self.url}")
+        return self
+
+    def stop(self) -> None:
+        """停止伺服器"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+            logger.info("speedtest 模擬伺服器已停止")
+
+    def __enter__(self) -> "StubSpeedtestServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    """
+    主函數
+    """
+    parser = argparse.ArgumentParser(description="本機 speedtest 模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽位址")
+    parser.add_argument("--port", type=int, default=8080, help="監聽埠")
+    parser.add_argument("--download-mbps", type=float, default=None, help="下載頻寬上限（Mbps，預設不限制）")
+    parser.add_argument("--upload-mbps", type=float, default=None, help="上傳頻寬上限（Mbps，預設不限制）")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每個請求的延遲（毫秒）")
+    parser.add_argument("--test-length", type=int, default=10, help="下載與上傳的測試秒數")
+    parser.add_argument("--download-scale", type=float, default=1.0, help="下載檔案大小相對於 speedtest.net 的比例")
+    args = parser.parse_args()
+
+    server = StubSpeedtestServer(args.host, args.port, args.download_mbps, args.upload_mbps,
+                                 args.latency_ms, args.test_length, download_scale=args.download_scale)
+    server.start()
+    print(f"speedtest 模擬伺服器: {server.url}")
+    print(f"設定 SPEEDTEST_BASE_URL={server.url} 後執行 network_speedtest.py")
+    print("按 Ctrl+C 停止\n")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""
+網速測試結果百分位摘要
+逐列串流讀取 speedtest_results.csv，依日、週、月將速度放進可合併的對數分桶分位數草圖，
+不需要把整個檔案讀進記憶體排序；草圖與已讀取的檔案位置一起快取，
+重新執行時只處理新增的資料列
+"""
+
+import os
+import csv
+import json
+import math
+import logging
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from speedtest_atomic import write_json_atomic
+
+logger = logging.getLogger("speedtest")
+
+# 快取檔案路徑
+SUMMARY_CACHE_FILE = os.getenv("SPEEDTEST_SUMMARY_CACHE", "speedtest_summary_cache.json")
+
+# 摘要的欄位與百分位
+SUMMARY_METRICS = ['download_mbps', 'upload_mbps', 'ping_ms', 'jitter_ms']
+QUANTILES = (0.05, 0.5, 0.95)
+
+# 彙總週期
+SUMMARY_PERIODS = ('day', 'week', 'month')
+
+# 分位數草圖的相對誤差
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+# 用來判斷檔案是否被改寫（而不是只有附加）的開頭長度
+FINGERPRINT_SIZE = 4096
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class QuantileSketch:
+    """
+    對數分桶的分位數草圖
+
+    數值 x 放進第 ceil(log_gamma(x)) 個桶，gamma = (1 + a) / (1 - a)，
+    查詢到的分位數與實際值的相對誤差不超過 a；兩個草圖只要把桶的計數相加就能合併
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        """
+        Args:
+            relative_accuracy: 相對誤差（0~1）
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        """
+        加入一個數值（0 與負數都算在 0）
+
+        Args:
+            value: 數值
+        """
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        合併另一個草圖（需要相同的相對誤差）
+
+        Args:
+            other: 另一個草圖
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("只能合併相對誤差相同的草圖")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """
+        查詢分位數
+
+        Args:
+            fraction: 分位（0~1）
+
+        Returns:
+            分位數估計值，沒有資料時返回 None
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # 桶的範圍是 (gamma^(i-1), gamma^i]，取相對誤差最小的代表值
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> Dict:
+        return {'zero': self.zero_count, 'count': self.count,
+                'bins': {str(index): count for index, count in self.bins.items()}}
+
+    @classmethod
+    def from_dict(cls, data: Dict, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY) -> "QuantileSketch":
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = data['zero']
+        sketch.count = data['count']
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        return sketch
+
+
+def period_key(timestamp: datetime, period: str) -> str:
+    """
+    取得時間所屬週期的標籤
+
+    Args:
+        timestamp: 時間
+        period: day、week（ISO 週）或 month
+
+    Returns:
+        例如 2026-01-13、2026-W03、2026-01
+    """
+    if period == 'day':
+        return timestamp.strftime('%Y-%m-%d')
+    if period == 'week':
+        year, week, _ = timestamp.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'month':
+        return timestamp.strftime('%Y-%m')
+    raise ValueError(f"不支援的彙總週期: {period}")
+
+
+def _fingerprint(csv_file: str, size: int = FINGERPRINT_SIZE) -> str:
+    with open(csv_file, 'rb') as f:
+        return f.read(size).hex()
+
+
+def iter_csv_lines(csv_file: str, offset: int = 0) -> Iterator[Tuple[List[str], int]]:
+    """
+    從指定位置逐列串流讀取 CSV
+
+    只回傳完整的資料列（以換行結尾），寫到一半的最後一列留到下次讀取
+
+    Args:
+        csv_file: CSV 檔案路徑
+        offset: 開始讀取的 byte 位置（0 表示從標題行開始）
+
+    Yields:
+        (欄位值列表, 該列結尾的 byte 位置)
+    """
+    with open(csv_file, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            # 只有檔案開頭可能有 BOM
+            line = raw.decode('utf-8-sig' if offset == 0 else 'utf-8')
+            offset += len(raw)
+            values = next(csv.reader([line]), [])
+            if values:
+                yield values, offset
+
+
+class SummaryBuilder:
+    """依週期與欄位累積分位數草圖，並以檔案位置快取"""
+
+    def __init__(self, cache_file: Optional[str] = SUMMARY_CACHE_FILE):
+        """
+        Args:
+            cache_file: 快取檔案路徑（None 表示不快取）
+        """
+        self.cache_file = cache_file
+        self.sketches: Dict[str, Dict[str, Dict[str, QuantileSketch]]] = {period: {} for period in SUMMARY_PERIODS}
+        self.offset = 0
+        self.header: Optional[List[str]] = None
+
+    def _load_cache(self, csv_file: str) -> None:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取摘要快取失敗，將重新讀取整個檔案: {e}")
+            return
+
+        # 檔案被改寫、截斷或換成別的檔案時，快取不再適用
+        fingerprint = cache.get('fingerprint')
+        if (cache.get('csv_file') != os.path.abspath(csv_file)
+                or not fingerprint
+                or cache.get('offset', 0) > os.path.getsize(csv_file)
+                or _fingerprint(csv_file, len(fingerprint) // 2) != fingerprint):
+            logger.info("CSV 檔案已變更，重新建立摘要")
+            return
+
+        self.offset = cache['offset']
+        self.header = cache['header']
+        self.sketches = {
+            period: {
+                key: {metric: QuantileSketch.from_dict(data) for metric, data in metrics.items()}
+                for key, metrics in cache['sketches'].get(period, {}).items()
+            }
+            for period in SUMMARY_PERIODS
+        }
+
+    def _save_cache(self, csv_file: str) -> None:
+        if not self.cache_file:
+            return
+        cache = {
+            'csv_file': os.path.abspath(csv_file),
+            'offset': self.offset,
+            'fingerprint': _fingerprint(csv_file, min(self.offset, FINGERPRINT_SIZE)),
+            'header': self.header,
+            'sketches': {
+                period: {key: {metric: sketch.to_dict() for metric, sketch in metrics.items()}
+                         for key, metrics in keys.items()}
+                for period, keys in self.sketches.items()
+            }
+        }
+        try:
+            write_json_atomic(self.cache_file, cache)
+        except OSError as e:
+            logger.warning(f"寫入摘要快取失敗: {e}")
+
+    def add(self, row: Dict[str, str]) -> None:
+        """
+        加入一筆測試結果
+
+        Args:
+            row: CSV 資料列
+        """
+        try:
+            timestamp = datetime.strptime(row['timestamp'], TIMESTAMP_FORMAT)
+        except (KeyError, TypeError, ValueError):
+            return
+
+        for period in SUMMARY_PERIODS:
+            metrics = self.sketches[period].setdefault(period_key(timestamp, period), {})
+            for metric in SUMMARY_METRICS:
+                try:
+                    value = float(row[metric])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                metrics.setdefault(metric, QuantileSketch()).add(value)
+
+    def update(self, csv_file: str) -> int:
+        """
+        從快取的位置讀取 CSV 新增的資料列
+
+        Args:
+            csv_file: CSV 檔案路徑
+
+        Returns:
+            本次讀取的資料列數
+        """
+        self._load_cache(csv_file)
+        added = 0
+        for values, offset in iter_csv_lines(csv_file, self.offset):
+            if self.header is None:
+                self.header = values
+            else:
+                self.add(dict(zip(self.header, values)))
+                added += 1
+            self.offset = offset
+        self._save_cache(csv_file)
+        return added
+
+    def summary(self, period: str, metrics: Optional[List[str]] = None) -> List[Dict]:
+        """
+        產生摘要表
+
+        Args:
+            period: day、week 或 month
+            metrics: 要輸出的欄位（預設全部）
+
+        Returns:
+            依週期排序的列表，每筆包含 period、metric、count 與各百分位
+        """
+        if period not in SUMMARY_PERIODS:
+            raise ValueError(f"不支援的彙總週期: {period}")
+        rows = []
+        for key in sorted(self.sketches[period]):
+            for metric in metrics or SUMMARY_METRICS:
+                sketch = self.sketches[period][key].get(metric)
+                if sketch is None or sketch.count == 0:
+                    continue
+                row = {'period': key, 'metric': metric, 'count': sketch.count}
+                for fraction in QUANTILES:
+                    row[f"p{round(fraction * 100)}"] = round(sketch.quantile(fraction), 2)
+                rows.append(row)
+        return rows
+
+
+def summarize_csv(csv_file: str, period: str = 'month', metrics: Optional[List[str]] = None,
+                  cache_file: Optional[str] = SUMMARY_CACHE_FILE) -> Optional[List[Dict]]:
+    """
+    串流讀取 CSV 並產生百分位摘要
+
+    Args:
+        csv_file: speedtest_results.csv 路徑
+        period: day、week 或 month
+        metrics: 要輸出的欄位（預設全部）
+        cache_file: 快取檔案路徑（None 表示不快取）
+
+    Returns:
+        摘要表，如果失敗則返回 None
+    """
+    try:
+        builder = SummaryBuilder(cache_file)
+        added = builder.update(csv_file)
+        logger.info(f"摘要已更新，本次讀取 {added} 筆新結果")
+        return builder.summary(period, metrics)
+
+    except Exception as e:
+        logger.error(f"產生網速摘要失敗: {e}", exc_info=True)
+        return None
+
+
+def write_summary_csv(rows: List[Dict], output_file: str) -> None:
+    """
+    將摘要表寫入 CSV
+
+    Args:
+        rows: summarize_csv 的結果
+        output_file: 輸出檔案名稱
+    """
+    fieldnames = ['period', 'metric', 'count'] + [f"p{round(fraction * 100)}" for fraction in QUANTILES]
+    with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def format_summary(rows: List[Dict]) -> str:
+    """
+    將摘要表格式化為文字表格
+
+    Args:
+        rows: summarize_csv 的結果
+
+    Returns:
+        文字表格
+    """
+    columns = ['count'] + [f"p{round(fraction * 100)}" for fraction in QUANTILES]
+    lines = [f"{'週期':<10}{'欄位':<14}" + ''.join(f"{column:>10}" for column in columns)]
+    for row in rows:
+        lines.append(f"{row['period']:<12}{row['metric']:<16}" + ''.join(f"{row[column]:>10}" for column in columns))
+    return '\n'.join(lines)
@@ -0,0 +1,221 @@
+"""
+TCP 連線延遲監控
+以 asyncio 同時對多個主機建立 TCP 連線，測量連線延遲與可達性；
+每一輪的結果批次寫入時間序列資料庫。單一行程即可監控數百個目標，
+等待連線時不佔用 CPU
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("speedtest")
+
+# 監控目標（以逗號分隔的 host:port），或每行一個目標的檔案
+MONITOR_HOSTS = os.getenv("SPEEDTEST_MONITOR_HOSTS", "")
+MONITOR_HOSTS_FILE = os.getenv("SPEEDTEST_MONITOR_HOSTS_FILE", "")
+
+# 每輪的間隔、每次連線的逾時（秒）與同時連線數上限
+MONITOR_INTERVAL_SECONDS = float(os.getenv("SPEEDTEST_MONITOR_INTERVAL", "60"))
+MONITOR_TIMEOUT_SECONDS = float(os.getenv("SPEEDTEST_MONITOR_TIMEOUT", "3"))
+MONITOR_CONCURRENCY = int(os.getenv("SPEEDTEST_MONITOR_CONCURRENCY", "200"))
+
+# 沒有指定埠時使用的埠
+DEFAULT_PORT = 443
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_target(target: str) -> Tuple[str, int]:
+    """
+    解析監控目標
+
+    Args:
+        target: host、host:port 或 [IPv6]:port
+
+    Returns:
+        (host, port)
+
+    Raises:
+        ValueError: 格式不正確
+    """
+    target = target.strip()
+    if target.startswith('['):
+        host, _, rest = target[1:].partition(']')
+        port = rest[1:] if rest.startswith(':') else ''
+    elif target.count(':') == 1:
+        host, _, port = target.partition(':')
+    else:
+        host, port = target, ''
+
+    if not host:
+        raise ValueError(f"不正確的監控目標: {target}")
+    try:
+        return host, int(port) if port else DEFAULT_PORT
+    except ValueError:
+        raise ValueError(f"不正確的監控目標: {target}")
+
+
+def load_targets(hosts: str = MONITOR_HOSTS, hosts_file: str = MONITOR_HOSTS_FILE) -> List[str]:
+    """
+    讀取監控目標（重複的只保留一個）
+
+    Args:
+        hosts: 以逗號分隔的目標
+        hosts_file: 每行一個目標的檔案（# 開頭為註解）
+
+    Returns:
+        目標列表（host:port 格式）
+    """
+    entries = [entry for entry in hosts.split(',') if entry.strip()]
+    if hosts_file:
+        with open(hosts_file, 'r', encoding='utf-8') as f:
+            entries.extend(line.split('#', 1)[0] for line in f if line.split('#', 1)[0].strip())
+
+    targets = []
+    for entry in entries:
+        host, port = parse_target(entry)
+        target = f"[{host}]:{port}" if ':' in host else f"{host}:{port}"
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+async def probe_tcp(target: str, timeout: float = MONITOR_TIMEOUT_SECONDS) -> Dict:
+    """
+    測量一次 TCP 連線延遲（完成三向交握即關閉）
+
+    先以 loop.getaddrinfo 解析位址，只計算連線本身的時間，不包含 DNS 查詢；
+    有多個位址時依序嘗試，以成功連線的那一次計時
+
+    Args:
+        target: host:port
+        timeout: 逾時秒數（DNS 查詢與連線合計）
+
+    Returns:
+        包含 timestamp、target、latency_ms（失敗為 None）與 error 的字典
+    """
+    host, port = parse_target(target)
+    result = {'timestamp': datetime.now().strftime(TIMESTAMP_FORMAT), 'target': target,
+              'latency_ms': None, 'error': None}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        addresses = await asyncio.wait_for(
+            loop.getaddrinfo(host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP), timeout
+        )
+        error = None
+        for family, _, _, _, address in addresses:
+            # 位址已是數字格式，open_connection 不會再查詢 DNS
+            start = time.perf_counter()
+            try:
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(address[0], address[1], family=family),
+                    max(0.0, deadline - loop.time())
+                )
+            except OSError as e:
+                error = e
+                continue
+            result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            break
+        else:
+            if error is not None:
+                raise error
+            result['error'] = 'dns: 查無位址'
+    except asyncio.TimeoutError:
+        result['error'] = 'timeout'
+    except socket.gaierror as e:
+        result['error'] = f"dns: {e.strerror or e}"
+    except OSError as e:
+        result['error'] = e.strerror or type(e).__name__
+    return result
+
+
+async def probe_all(targets: List[str], timeout: float = MONITOR_TIMEOUT_SECONDS,
+                    concurrency: int = MONITOR_CONCURRENCY) -> List[Dict]:
+    """
+    同時測量所有目標（同時連線數不超過 concurrency）
+
+    Args:
+        targets: 目標列表
+        timeout: 每次連線的逾時秒數
+        concurrency: 同時連線數上限
+
+    Returns:
+        依目標順序的結果列表
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(target: str) -> Dict:
+        async with semaphore:
+            return await probe_tcp(target, timeout)
+
+    return list(await asyncio.gather(*(limited(target) for target in targets)))
+
+
+def _log_round(results: List[Dict]) -> None:
+    failed = [result for result in results if result['latency_ms'] is None]
+    succeeded = [result for result in results if result['latency_ms'] is not None]
+    message = f"TCP 監控 {len(results)} 個目標，成功 {len(succeeded)}，失敗 {len(failed)}"
+    if succeeded:
+        slowest = max(succeeded, key=lambda result: result['latency_ms'])
+        message += f"，最慢: {slowest['target']} {slowest['latency_ms']} ms"
+    logger.info(message)
+    for result in failed:
+        logger.warning(f"無法連線到 {result['target']}: {result['error']}")
+
+
+async def monitor(targets: List[str], store=None, interval: float = MONITOR_INTERVAL_SECONDS,
+                  timeout: float = MONITOR_TIMEOUT_SECONDS, concurrency: int = MONITOR_CONCURRENCY,
+                  rounds: Optional[int] = None, stop: Optional[asyncio.Event] = None) -> int:
+    """
+    以固定間隔持續監控所有目標，每輪的結果批次寫入資料庫
+
+    Args:
+        targets: 目標列表
+        store: SpeedtestStore（None 表示只記錄到 logger）
+        interval: 每輪的間隔（秒）
+        timeout: 每次連線的逾時秒數
+        concurrency: 同時連線數上限
+        rounds: 執行幾輪後結束（None 表示持續執行）
+        stop: 設定後立即結束的事件
+
+    Returns:
+        執行的輪數
+    """
+    loop = asyncio.get_running_loop()
+    stop = stop or asyncio.Event()
+    next_round = loop.time()
+    completed = 0
+
+    while not stop.is_set() and (rounds is None or completed < rounds):
+        results = await probe_all(targets, timeout, concurrency)
+        _log_round(results)
+        if store is not None:
+            try:
+                # 在執行緒寫入 SQLite，避免阻塞事件迴圈；寫入時間計入本輪，下一輪仍依固定間隔開始
+                await asyncio.to_thread(store.add_tcp_results, results)
+            except Exception as e:
+                logger.error(f"儲存 TCP 監控結果失敗: {e}")
+        completed += 1
+
+        if rounds is not None and completed >= rounds:
+            break
+
+        # 固定間隔；一輪超過間隔時直接開始下一輪
+        next_round = max(next_round + interval, loop.time())
+        try:
+            await asyncio.wait_for(stop.wait(), next_round - loop.time())
+        except asyncio.TimeoutError:
+            pass
+
+    return completed
@@ -0,0 +1,188 @@
+"""
+有記憶體上限的排序緩衝區
+資料先保留在記憶體中，估計大小超過上限時排序後寫入暫存檔（sorted run），
+讀取時以 heapq.merge 合併所有 run，整體等同外部排序，記憶體用量不隨資料量增加；
+run 太多、各讀入一組就會超過上限時，先分批合併成較少的 run（多趟合併）
+"""
+
+import os
+import sys
+import heapq
+import pickle
+import logging
+import tempfile
+from collections.abc import Mapping, Sequence
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger("spill_buffer")
+
+# 每個 run 以多筆為一組寫入，合併時每個 run 只在記憶體中保留一組
+SPILL_CHUNK_SIZE = 1000
+
+
+def estimate_size(item: Any) -> int:
+    """
+    估計一筆資料在記憶體中佔用的位元組數
+
+    Args:
+        item: 資料（字典或資料列時會加上各欄位值的大小）
+
+    Returns:
+        估計的位元組數
+    """
+    size = sys.getsizeof(item)
+    if isinstance(item, Mapping):
+        size += sum(sys.getsizeof(value) for value in item.values())
+    elif isinstance(item, Sequence) and not isinstance(item, (str, bytes, bytearray)):
+        size += sum(sys.getsizeof(value) for value in item)
+    return size
+
+
+def _read_run(path: str) -> Iterator[Any]:
+    """逐組讀取暫存檔中的資料"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                chunk = pickle.load(f)
+            except EOFError:
+                return
+            yield from chunk
+
+
+class SpillingBuffer:
+    """
+    超過記憶體上限時寫入暫存檔的排序緩衝區
+
+    迭代時依 key 排序輸出所有資料，可重複迭代；用完後呼叫 close() 刪除暫存檔
+    """
+
+    def __init__(self, memory_budget_bytes: int, key: Optional[Callable[[Any], Any]] = None,
+                 size_of: Callable[[Any], int] = estimate_size, spill_dir: Optional[str] = None):
+        """
+        Args:
+            memory_budget_bytes: 記憶體中資料的估計大小上限
+            key: 排序鍵函式
+            size_of: 估計單筆資料大小的函式
+            spill_dir: 暫存檔目錄（預設為系統暫存目錄）
+        """
+        self.memory_budget_bytes = memory_budget_bytes
+        self._key = key
+        self._size_of = size_of
+        self._spill_dir = spill_dir
+        self._items: List[Any] = []
+        self._size = 0
+        self._count = 0
+        self._runs: List[str] = []
+        self._run_id = 0
+        self._spilled_size = 0
+        self._spilled_count = 0
+        self._tempdir: Optional[tempfile.TemporaryDirectory] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self) -> "SpillingBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def spilled_runs(self) -> int:
+        """已寫入暫存檔的 run 數量"""
+        return len(self._runs)
+
+    def append(self, item: Any) -> None:
+        """
+        加入一筆資料，超過記憶體上限時將目前的資料寫入暫存檔
+
+        Args:
+            item: 資料
+        """
+        self._items.append(item)
+        self._size += self._size_of(item)
+        self._count += 1
+        if self._size > self.memory_budget_bytes:
+            self._spill()
+
+    def extend(self, items: Iterable[Any]) -> None:
+        """
+        加入多筆資料
+
+        Args:
+            items: 資料串流
+        """
+        for item in items:
+            self.append(item)
+
+    def _write_run(self, items: Iterable[Any]) -> str:
+        """將已排序的資料分組寫入新的暫存檔，返回檔案路徑"""
+        if self._tempdir is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="spill_", dir=self._spill_dir)
+
+        path = os.path.join(self._tempdir.name, f"run_{self._run_id:05d}.pkl")
+        self._run_id += 1
+        items = iter(items)
+        with open(path, 'wb') as f:
+            while True:
+                chunk = list(islice(items, SPILL_CHUNK_SIZE))
+                if not chunk:
+                    break
+                pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def _spill(self) -> None:
+        """將記憶體中的資料排序後寫入新的暫存檔"""
+        self._items.sort(key=self._key)
+        path = self._write_run(self._items)
+
+        logger.info(f"記憶體中 {len(self._items):,} 筆資料（約 {self._size:,} bytes）已寫入暫存檔 {path}")
+        self._runs.append(path)
+        self._spilled_size += self._size
+        self._spilled_count += len(self._items)
+        self._items = []
+        self._size = 0
+
+    def _merge_fan_in(self) -> int:
+        """同時合併的 run 數量，讓每個 run 各讀入一組資料時合計不超過記憶體上限"""
+        chunk_bytes = self._spilled_size / max(self._spilled_count, 1) * SPILL_CHUNK_SIZE
+        return max(2, int(self.memory_budget_bytes // max(chunk_bytes, 1)))
+
+    def _merge_runs(self) -> None:
+        """run 數量超過可同時合併的數量時，依序分批合併成較少的 run"""
+        fan_in = self._merge_fan_in()
+        while len(self._runs) > fan_in:
+            merged = []
+            for i in range(0, len(self._runs), fan_in):
+                group = self._runs[i:i + fan_in]
+                if len(group) == 1:
+                    merged.append(group[0])
+                    continue
+                merged.append(self._write_run(heapq.merge(*(_read_run(path) for path in group), key=self._key)))
+                for path in group:
+                    os.remove(path)
+            logger.info(f"{len(self._runs)} 個暫存檔超過單次可合併的 {fan_in} 個，已合併為 {len(merged)} 個")
+            self._runs = merged
+
+    def __iter__(self) -> Iterator[Any]:
+        if not self._runs:
+            self._items.sort(key=self._key)
+            return iter(self._items)
+        if self._items:
+            # 合併時記憶體中只保留各 run 的一組資料
+            self._spill()
+        self._merge_runs()
+        return heapq.merge(*(_read_run(path) for path in self._runs), key=self._key)
+
+    def close(self) -> None:
+        """刪除暫存檔並釋放記憶體中的資料"""
+        self._items = []
+        self._size = 0
+        self._count = 0
+        self._runs = []
+        self._spilled_size = 0
+        self._spilled_count = 0
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
@@ -0,0 +1,35 @@
+"""
+測試共用的輔助函式
+"""
+
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+
+def make_result(timestamp: Union[datetime, str, int] = datetime(2026, 1, 13, 10, 0), download: float = 100.0,
+                upload: float = 50.0, ping: float = 15.5, server_name: str = '台北',
+                mb: Optional[float] = None) -> Dict:
+    """
+    產生 network_speedtest.test_speed 格式的測試結果
+
+    Args:
+        timestamp: 測試時間（datetime、字串，或 2026-01-13 當天的小時）
+        download: 下載速度（Mbps）
+        upload: 上傳速度（Mbps）
+        ping: 延遲（毫秒）
+        server_name: 伺服器名稱
+        mb: 傳輸量（MB，下載佔 80%；None 表示不含傳輸量欄位）
+
+    Returns:
+        測試結果字典
+    """
+    if isinstance(timestamp, int):
+        timestamp = datetime(2026, 1, 13, timestamp, 0)
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    result = {'timestamp': timestamp, 'download_mbps': download, 'upload_mbps': upload, 'ping_ms': ping,
+              'server_name': server_name, 'server_country': 'Taiwan', 'server_sponsor': 'ISP'}
+    if mb is not None:
+        result['bytes_received'] = int(mb * 800_000)
+        result['bytes_sent'] = int(mb * 200_000)
+    return result
@@ -4,7 +4,7 @@ SHA_256 模組單元測試
 """
 
 import pytest
-from SHA_256 import password_hash
+from SHA_256 import password_hash, password_hash_batch
 
 
 class TestPasswordHash:
@@ -126,3 +126,37 @@ class TestPasswordHash:
         result = password_hash("123456789", "987654321")
         assert isinstance(result, str)
         assert len(result) == 64
+
+
+class TestPasswordHashBatch:
+    """測試 password_hash_batch 批次雜湊"""
+
+    @staticmethod
+    def _pairs(count):
+        return [(f"pw{i}", f"{i:032x}") for i in range(count)]
+
+    def test_in_process_matches_single(self):
+        """測試單一行程時結果與逐筆雜湊相同"""
+        pairs = self._pairs(250)
+        expected = [password_hash(v, u) for v, u in pairs]
+        assert list(password_hash_batch(pairs, workers=1, chunk_size=7)) == expected
+
+    def test_process_pool_keeps_input_order(self):
+        """測試多個行程時結果依輸入順序輸出"""
+        pairs = self._pairs(2000)
+        expected = [password_hash(v, u) for v, u in pairs]
+        assert list(password_hash_batch(iter(pairs), workers=2, chunk_size=64)) == expected
+
+    def test_empty_input(self):
+        assert list(password_hash_batch([], workers=2)) == []
+
+    def test_is_lazy(self):
+        """測試結果以串流輸出，不需要先讀完輸入"""
+        def endless():
+            i = 0
+            while True:
+                yield (str(i), "u")
+                i += 1
+
+        results = password_hash_batch(endless(), workers=1, chunk_size=10)
+        assert next(results) == password_hash("0", "u")
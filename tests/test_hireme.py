@@ -3,9 +3,46 @@ HireMe 單元測試
 測試核心功能函式
 """
 
+import re
+import csv
+import random
 import pytest
-from datetime import date, datetime
-from hireme import is_email_format, count_users_by_week
+from datetime import date, datetime, timedelta
+from functools import partial
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine, event, text
+from hireme import (
+    is_email_format,
+    count_users_by_week,
+    count_users_by_weeks,
+    iter_registered_users,
+    query_registered_users,
+    summarize_users_by_week,
+    stream_week_summary,
+    build_weekly_count_sql,
+    query_weekly_counts,
+    iter_users_with_rec_lookup,
+    lookup_dispatch_rec_users,
+    parse_args,
+    build_funnel_sql,
+    query_funnel,
+    write_funnel_csv_report,
+    conversion_rate,
+    FUNNEL_STAGES,
+    export_users_csv,
+    buffer_users,
+    shard_output_file,
+    build_week_finder,
+    main,
+    count_dates_by_weeks,
+    _iter_users,
+    REGISTERED_USERS_SQL,
+    EXPORTED_FINISHED_USERS_SQL,
+    EMAIL_FORMAT_FILTER_SQL
+)
+from spill_buffer import SpillingBuffer
+from week_range import get_week_ranges
 
 
 class TestEmailValidation:
@@ -58,6 +95,57 @@ class TestEmailValidation:
         assert is_email_format("user@exam ple.com") == False
 
 
+def _like_regex(pattern: str) -> str:
+    """將 T-SQL LIKE 樣式轉為正規表示式（二進位定序：字元範圍依字碼比對）"""
+    parts = []
+    for token in re.findall(r'\[[^\]]*\]|.', pattern):
+        if token == '%':
+            parts.append('.*')
+        elif token == '_':
+            parts.append('.')
+        elif token.startswith('['):
+            parts.append('[' + token[1:-1].replace('\\', '\\\\') + ']')
+        else:
+            parts.append(re.escape(token))
+    return ''.join(parts)
+
+
+def _sql_email_filter(login_name: str) -> bool:
+    """以二進位定序的語意套用 EMAIL_FORMAT_FILTER_SQL 中的 LIKE 與 PATINDEX 條件"""
+    for negated, pattern in re.findall(r"LoginName COLLATE Latin1_General_BIN (NOT )?LIKE '([^']*)'",
+                                       EMAIL_FORMAT_FILTER_SQL):
+        if bool(re.fullmatch(_like_regex(pattern), login_name, re.DOTALL)) == bool(negated):
+            return False
+    # PATINDEX('%[^a-zA-Z]%', REVERSE(...))：由後往前第一個非英文字母的位置，必須是第 3 個以後的 .
+    pattern = re.search(r"PATINDEX\('%([^']*)%'", EMAIL_FORMAT_FILTER_SQL).group(1)
+    match = re.search(_like_regex(pattern), login_name[::-1])
+    return match is not None and match.start() + 1 >= 3 and match.group() == '.'
+
+
+class TestEmailFormatSql:
+    """測試資料庫端的 email 條件與 EMAIL_PATTERN 一致"""
+
+    def test_predicates_use_binary_collation(self):
+        predicates = [line for line in EMAIL_FORMAT_FILTER_SQL.split('\n    AND ') if line.strip()]
+        assert len(predicates) == 6
+        assert all('COLLATE Latin1_General_BIN' in predicate for predicate in predicates)
+        # 比較句點的條件也以二進位定序比對，全形句點不等於 .
+        assert "COLLATE Latin1_General_BIN = '.'" in predicates[-1]
+
+    @pytest.mark.parametrize("login_name", [
+        "test@example.com", "first.last@company.com.tw", "user+tag@example.com", "user_name@example.com",
+        "user@example", "user@@example.com", "user@exa_mple.com", "user@example.c0m",
+        "josé@example.com", "user@exämple.com", "user@example.cöm", "ｕser@example.com",
+        "user@example．com", "user＠example.com", "用戶@example.com", "user@例子.tw",
+    ])
+    def test_sql_and_regex_agree(self, login_name):
+        assert _sql_email_filter(login_name) == is_email_format(login_name)
+
+    def test_non_ascii_rejected(self):
+        for login_name in ("josé@example.com", "user@example.cöm", "user@example．com", "用戶@example.com"):
+            assert is_email_format(login_name) is False
+            assert _sql_email_filter(login_name) is False
+
 class TestUserCounting:
     """測試用戶週統計功能"""
 
@@ -156,6 +244,612 @@ class TestUserCounting:
         assert count == 3
 
 
+class TestUserCountingByWeeks:
+    """測試單次掃描的週統計功能"""
+
+    def test_counts_all_weeks_in_one_pass(self):
+        """測試一次回傳所有週的人數"""
+        users = [
+            {'CreateDate': date(2025, 11, 17)},
+            {'CreateDate': datetime(2025, 11, 23, 23, 59, 59)},
+            {'CreateDate': "2025-11-24"},
+            {'CreateDate': date(2026, 1, 11)},
+            {'CreateDate': None},
+        ]
+        counts = count_users_by_weeks(users, get_week_ranges())
+        assert counts == [2, 1, 0, 0, 0, 0, 0, 1]
+
+    def test_week_finder_reuses_cached_index(self):
+        """測試報告期間的週列表共用快取的索引，其他週列表另外建立"""
+        with patch('hireme.BucketIndex') as mock_index:
+            find_week = build_week_finder(get_week_ranges())
+            assert build_week_finder(get_week_ranges()) == find_week
+            mock_index.assert_not_called()
+        assert find_week(date(2025, 11, 25)) == 1
+
+        weeks = get_week_ranges()[2:4]
+        assert build_week_finder(weeks)(date(2025, 12, 1)) == 0
+
+    def test_ignores_dates_outside_weeks(self):
+        """測試不在任何週內的日期不被計入"""
+        users = [
+            {'CreateDate': date(2025, 11, 16)},
+            {'CreateDate': date(2026, 1, 12)},
+        ]
+        counts = count_users_by_weeks(users, get_week_ranges())
+        assert counts == [0] * len(get_week_ranges())
+
+    def test_unsorted_weeks_keep_input_order(self):
+        """測試未排序的週仍依輸入順序回傳"""
+        weeks = [
+            ("B", date(2025, 11, 24), date(2025, 11, 30), "b"),
+            ("A", date(2025, 11, 17), date(2025, 11, 23), "a"),
+        ]
+        users = [{'CreateDate': date(2025, 11, 18)}] * 3 + [{'CreateDate': date(2025, 11, 25)}]
+        assert count_users_by_weeks(users, weeks) == [1, 3]
+
+    def test_gap_between_weeks(self):
+        """測試週之間有空檔時，空檔內的日期不被計入"""
+        weeks = [
+            ("A", date(2025, 11, 17), date(2025, 11, 18), "a"),
+            ("B", date(2025, 11, 24), date(2025, 11, 30), "b"),
+        ]
+        users = [{'CreateDate': date(2025, 11, 20)}]
+        assert count_users_by_weeks(users, weeks) == [0, 0]
+
+    def test_matches_per_week_count(self):
+        """測試結果與逐週統計一致"""
+        users = [{'CreateDate': date(2025, 11, 17) + timedelta(days=i % 60)} for i in range(500)]
+        weeks = get_week_ranges()
+        expected = [count_users_by_week(users, start, end) for _, start, end, _ in weeks]
+        assert count_users_by_weeks(users, weeks) == expected
+
+
+def _mock_session(rows):
+    """建立會回傳指定資料列的 mock session"""
+    session = MagicMock()
+    result = MagicMock()
+    result.partitions.side_effect = lambda size: (rows[i:i + size] for i in range(0, len(rows), size))
+    session.execute.return_value = result
+    return session
+
+
+def _row(user_id, login_name, create_date, name_c='測試'):
+    return SimpleNamespace(Id=user_id, LoginName=login_name, CreateDate=create_date, NameC=name_c)
+
+
+class TestNumpyCounting:
+    """測試 NumPy 向量化統計與純 Python 統計結果一致"""
+
+    @staticmethod
+    def _random_dates(count):
+        rng = random.Random(7)
+        values = []
+        for _ in range(count):
+            day = date(2025, 11, 10) + timedelta(days=rng.randrange(70))
+            kind = rng.randrange(4)
+            if kind == 0:
+                values.append(day)
+            elif kind == 1:
+                values.append(datetime.combine(day, datetime.min.time()) + timedelta(hours=rng.randrange(24)))
+            elif kind == 2:
+                values.append(day.strftime("%Y-%m-%d"))
+            else:
+                values.append(None)
+        return values
+
+    def test_numpy_matches_python(self):
+        """測試混合日期格式時兩種方式結果相同"""
+        pytest.importorskip("numpy")
+        values = self._random_dates(3000)
+        weeks = get_week_ranges()
+
+        expected = count_dates_by_weeks(values, weeks, use_numpy=False)
+        assert count_dates_by_weeks(values, weeks, use_numpy=True) == expected
+        assert sum(expected) > 0
+
+    def test_numpy_unsorted_weeks_with_gap(self):
+        """測試未排序且有空檔的週"""
+        pytest.importorskip("numpy")
+        weeks = [
+            ("B", date(2025, 11, 24), date(2025, 11, 30), "b"),
+            ("A", date(2025, 11, 17), date(2025, 11, 18), "a"),
+        ]
+        values = [date(2025, 11, 18), date(2025, 11, 20), datetime(2025, 11, 30, 23, 0), date(2025, 12, 1)]
+        assert count_dates_by_weeks(values, weeks, use_numpy=True) == [1, 1]
+
+    def test_chunked_count_users_by_weeks(self):
+        """測試分批向量化統計與不分批結果相同"""
+        pytest.importorskip("numpy")
+        users = [{'CreateDate': value} for value in self._random_dates(1000)]
+        weeks = get_week_ranges()
+
+        expected = count_dates_by_weeks([u['CreateDate'] for u in users], weeks, use_numpy=False)
+        with patch('hireme.NUMPY_CHUNK_SIZE', 64):
+            assert count_users_by_weeks(iter(users), weeks) == expected
+
+    def test_fallback_without_numpy(self):
+        """測試未安裝 NumPy 時改用純 Python"""
+        users = [{'CreateDate': date(2025, 11, 20)}, {'CreateDate': "2025-11-25"}]
+        with patch('hireme.np', None):
+            assert count_users_by_weeks(users, get_week_ranges())[:2] == [1, 1]
+            assert count_dates_by_weeks([date(2025, 11, 20)], get_week_ranges(), use_numpy=True)[0] == 1
+
+
+class TestStreamingQuery:
+    """測試串流查詢與統計功能"""
+
+    def test_iter_registered_users_filters_email(self):
+        """測試串流查詢只保留 email 格式的用戶"""
+        rows = [
+            _row('1', 'a@example.com', date(2025, 11, 20)),
+            _row('2', 'not-an-email', date(2025, 11, 20)),
+            _row('3', None, date(2025, 11, 21)),
+            _row('4', 'b@example.com', date(2025, 11, 25), None),
+        ]
+        session = _mock_session(rows)
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            users = list(iter_registered_users(MagicMock(), batch_size=2))
+
+        assert [u['Id'] for u in users] == ['1', '4']
+        assert users[1]['NameC'] == ''
+        session.execute.return_value.partitions.assert_called_once_with(2)
+        assert session.execute.call_args.kwargs['execution_options'] == {"stream_results": True}
+        session.close.assert_called_once()
+
+    def test_iter_registered_users_is_lazy(self):
+        """測試未開始讀取前不會執行查詢"""
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            iter_registered_users(MagicMock())
+            mock_sessionmaker.assert_not_called()
+
+    def test_query_registered_users_exception(self):
+        """測試完整載入時發生例外返回空列表"""
+        session = MagicMock()
+        session.execute.side_effect = Exception("DB error")
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            assert query_registered_users(MagicMock()) == []
+
+        session.close.assert_called_once()
+
+    def test_summarize_users_by_week_from_generator(self):
+        """測試直接統計串流資料"""
+        users = ({'CreateDate': date(2025, 11, 17) + timedelta(days=i)} for i in range(14))
+        total_count, week_counts = summarize_users_by_week(users)
+
+        assert total_count == 14
+        assert week_counts[0]['count'] == 7
+        assert week_counts[1]['count'] == 7
+        assert sum(w['count'] for w in week_counts) == 14
+
+    def test_stream_week_summary_failure(self):
+        """測試串流中途失敗時返回 None"""
+        def broken():
+            yield {'CreateDate': date(2025, 11, 20)}
+            raise RuntimeError("connection lost")
+
+        assert stream_week_summary(broken(), "註冊用戶") is None
+
+
+class TestRecLookupJoin:
+    """測試以 backId 查詢 REC_User 後在本機 JOIN"""
+
+    def test_join_with_lookup(self):
+        """測試只輸出 email 格式且 REC_User 有對應的用戶"""
+        rows = [
+            SimpleNamespace(Id='1', LoginName='a@example.com', backId='R1'),
+            SimpleNamespace(Id='2', LoginName='bad', backId='R2'),
+            SimpleNamespace(Id='3', LoginName='c@example.com', backId='R3'),
+            SimpleNamespace(Id='4', LoginName='d@example.com', backId='R4'),
+        ]
+        rec_users = {'R1': (date(2025, 11, 20), '甲'), 'R2': (date(2025, 11, 20), '乙'), 'R4': (date(2025, 11, 21), None)}
+        requested = []
+
+        def lookup(keys, start_date, end_date):
+            requested.append(set(keys))
+            return {k: rec_users[k] for k in keys if k in rec_users}
+
+        session = _mock_session(rows)
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            users = list(iter_users_with_rec_lookup(MagicMock(), lookup, batch_size=2))
+
+        assert [(u['Id'], u['NameC']) for u in users] == [('1', '甲'), ('4', '')]
+        # 非 email 格式的 backId 不會被查詢
+        assert requested == [{'R1'}, {'R3', 'R4'}]
+        session.close.assert_called_once()
+
+
+def _sqlite_engine(path, attachments):
+    """建立 SQLite 引擎，並在每次連線時 ATTACH 指定的資料庫"""
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def attach(dbapi_connection, connection_record):
+        for alias, db_path in attachments.items():
+            dbapi_connection.execute(f"ATTACH DATABASE '{db_path}' AS {alias}")
+
+    return engine
+
+
+@pytest.fixture
+def federated_engines(tmp_path):
+    """
+    以 SQLite 模擬兩個資料庫：
+    hireme / dispatch 引擎各自把自己的資料庫掛為 dbo，
+    reference 引擎同時掛載兩者，用來執行原本的跨資料庫 JOIN
+    """
+    hireme_db = tmp_path / 'hireme.db'
+    dispatch_db = tmp_path / 'dispatch.db'
+    hireme_engine = _sqlite_engine(tmp_path / 'a.db', {'dbo': hireme_db})
+    dispatch_engine = _sqlite_engine(tmp_path / 'b.db', {'dbo': dispatch_db})
+    reference_engine = _sqlite_engine(tmp_path / 'c.db', {'hm': hireme_db, 'jb': dispatch_db})
+
+    rng = random.Random(42)
+    users, statuses, rec_users = [], [], []
+    for i in range(600):
+        login_name = rng.choice([f'user{i}@example.com', f'user{i}', None, f'u{i}@mail.com.tw'])
+        line_uid = rng.choice([f'line{i}', None, f'line{i}'])
+        users.append({'id': f'U{i}', 'login': login_name, 'line': line_uid})
+        if rng.random() < 0.9:
+            back_id = rng.choice([f'R{i}', None, f'R{i}'])
+            statuses.append({'uid': f'U{i}', 'back': back_id,
+                             'exp': rng.choice([0, 1, None]), 'fin': rng.choice([0, 1, None])})
+        if rng.random() < 0.85:
+            create_date = datetime(2025, 11, 10) + timedelta(hours=rng.randrange(0, 24 * 70))
+            rec_users.append({'id': f'R{i}', 'cd': create_date.strftime('%Y-%m-%d %H:%M:%S'),
+                              'name': rng.choice([f'名{i}', None])})
+
+    with hireme_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dbo.[User] (Id TEXT PRIMARY KEY, LoginName TEXT, lineUid TEXT)"))
+        conn.execute(text("CREATE TABLE dbo.userResumeTempStatus "
+                          "(userId TEXT PRIMARY KEY, backId TEXT, hasExport INTEGER, hasFin INTEGER)"))
+        conn.execute(text("INSERT INTO dbo.[User] VALUES (:id, :login, :line)"), users)
+        conn.execute(text("INSERT INTO dbo.userResumeTempStatus VALUES (:uid, :back, :exp, :fin)"), statuses)
+
+    with dispatch_engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dbo.REC_User (UserID TEXT PRIMARY KEY, CreateDate TEXT, NameC TEXT)"))
+        conn.execute(text("INSERT INTO dbo.REC_User VALUES (:id, :cd, :name)"), rec_users)
+
+    yield hireme_engine, dispatch_engine, reference_engine
+
+    for engine in (hireme_engine, dispatch_engine, reference_engine):
+        engine.dispose()
+
+
+def _cross_database_users(reference_engine, sql):
+    """執行原本的跨資料庫 JOIN（資料庫名稱換成 SQLite 的掛載名稱）"""
+    sql = sql.replace('HireMePlz.dbo.', 'hm.').replace('JBHRIS_DISPATCH.dbo.', 'jb.')
+    return _iter_users(reference_engine, sql, 100)
+
+
+def _sort_users(users):
+    return sorted(users, key=lambda u: (u['Id'], str(u['CreateDate'])))
+
+
+class TestFederatedJoin:
+    """測試分別查詢兩個資料庫後在本機 JOIN，結果與跨資料庫 SQL JOIN 相同"""
+
+    @pytest.mark.parametrize("exported_finished, sql", [
+        (False, REGISTERED_USERS_SQL),
+        (True, EXPORTED_FINISHED_USERS_SQL),
+    ], ids=["registered", "exported_finished"])
+    def test_matches_cross_database_join(self, federated_engines, exported_finished, sql):
+        """測試結果與跨資料庫 JOIN 完全相同"""
+        hireme_engine, dispatch_engine, reference_engine = federated_engines
+
+        expected = _sort_users(_cross_database_users(reference_engine, sql))
+        lookup = partial(lookup_dispatch_rec_users, dispatch_engine)
+        actual = _sort_users(iter_users_with_rec_lookup(hireme_engine, lookup, exported_finished, batch_size=37))
+
+        assert len(expected) > 5
+        assert actual == expected
+
+    def test_in_list_is_batched(self, federated_engines):
+        """測試 IN 清單超過上限時分批查詢，結果不變"""
+        hireme_engine, dispatch_engine, reference_engine = federated_engines
+
+        expected = _sort_users(_cross_database_users(reference_engine, REGISTERED_USERS_SQL))
+        lookup = partial(lookup_dispatch_rec_users, dispatch_engine)
+        with patch('hireme.IN_LIST_BATCH_SIZE', 5):
+            actual = _sort_users(iter_users_with_rec_lookup(hireme_engine, lookup, batch_size=200))
+
+        assert actual == expected
+
+    def test_memory_bounded_by_batch_size(self):
+        """測試每次查詢 REC_User 的 backId 數量不超過 batch_size"""
+        rows = [SimpleNamespace(Id=str(i), LoginName=f'u{i}@example.com', backId=f'R{i}') for i in range(25)]
+        sizes = []
+
+        def lookup(keys, start_date, end_date):
+            sizes.append(len(keys))
+            return {}
+
+        session = _mock_session(rows)
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            assert list(iter_users_with_rec_lookup(MagicMock(), lookup, batch_size=10)) == []
+
+        assert sizes == [10, 10, 5]
+
+
+class TestWeeklyAggregateQuery:
+    """測試資料庫端週統計查詢"""
+
+    def test_build_sql_has_one_value_row_per_week(self):
+        """測試每週對應一組 VALUES 與參數"""
+        weeks = get_week_ranges()
+        sql, params = build_weekly_count_sql(weeks)
+
+        assert len(params) == len(weeks) * 2
+        assert params['week_start_0'] == weeks[0][1]
+        assert params[f'week_end_{len(weeks) - 1}'] == weeks[-1][2]
+        assert 'GROUPING SETS' in sql
+        assert 'hasExport' not in sql
+
+    def test_build_sql_exported_finished(self):
+        """測試已匯出且已完成的條件"""
+        sql, _ = build_weekly_count_sql(get_week_ranges(), exported_finished=True)
+        assert 'urts.hasExport = 1' in sql
+        assert 'urts.hasFin = 1' in sql
+
+    def test_query_weekly_counts_parses_rows(self):
+        """測試將每週一列與總計一列轉為報告格式"""
+        rows = [
+            SimpleNamespace(is_total=0, week_index=0, user_count=5),
+            SimpleNamespace(is_total=0, week_index=2, user_count=3),
+            SimpleNamespace(is_total=0, week_index=None, user_count=1),
+            SimpleNamespace(is_total=1, week_index=None, user_count=9),
+        ]
+        session = MagicMock()
+        session.execute.return_value.fetchall.return_value = rows
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            total_count, week_counts = query_weekly_counts(MagicMock())
+
+        assert total_count == 9
+        assert [w['count'] for w in week_counts] == [5, 0, 3, 0, 0, 0, 0, 0]
+        assert week_counts[0]['period'] == get_week_ranges()[0][0]
+        session.close.assert_called_once()
+
+    def test_query_weekly_counts_exception(self):
+        """測試查詢失敗時返回 None"""
+        session = MagicMock()
+        session.execute.side_effect = Exception("DB error")
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            assert query_weekly_counts(MagicMock()) is None
+
+    def test_default_mode_is_aggregate(self):
+        """測試預設使用資料庫端統計"""
+        assert parse_args([]).mode == "aggregate"
+        assert parse_args(["--mode", "stream"]).mode == "stream"
+        assert parse_args(["--mode", "snapshot"]).mode == "snapshot"
+        assert parse_args(["--mode", "federated", "--batch-size", "100"]).batch_size == 100
+
+    @pytest.mark.parametrize("batch_size", ["0", "-5"])
+    def test_invalid_batch_size(self, batch_size):
+        """測試每批筆數必須是正整數"""
+        with pytest.raises(SystemExit):
+            parse_args(["--batch-size", batch_size])
+
+
+class TestFunnel:
+    """測試單一查詢的註冊漏斗"""
+
+    def test_one_case_column_per_stage(self):
+        """測試每個階段一個條件彙總欄位，且不含階段條件的 WHERE"""
+        stages = FUNNEL_STAGES + [("extra", "額外", "urts.hasFin = 1")]
+        sql, params = build_funnel_sql(get_week_ranges(), stages)
+
+        assert sql.count('SUM(CASE WHEN') == len(stages)
+        assert 'AS stage_extra' in sql
+        assert 'AND urts.hasExport = 1\n' not in sql
+        assert len(params) == len(get_week_ranges()) * 2
+
+    def test_query_funnel_single_query(self):
+        """測試只執行一次查詢並解析每週與總計"""
+        rows = [
+            SimpleNamespace(is_total=0, week_index=1, stage_registered=10, stage_exported=4, stage_finished=2),
+            SimpleNamespace(is_total=1, week_index=None, stage_registered=10, stage_exported=4, stage_finished=None),
+        ]
+        session = MagicMock()
+        session.execute.return_value.fetchall.return_value = rows
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            funnel = query_funnel(MagicMock())
+
+        session.execute.assert_called_once()
+        assert len(funnel) == len(get_week_ranges()) + 1
+        assert funnel[0]['counts'] == {'registered': 0, 'exported': 0, 'finished': 0}
+        assert funnel[1]['counts'] == {'registered': 10, 'exported': 4, 'finished': 2}
+        assert funnel[-1]['counts']['finished'] == 0
+        assert funnel[-1]['period'] == '總計（11/17~1/11）'
+
+    def test_query_funnel_exception(self):
+        session = MagicMock()
+        session.execute.side_effect = Exception("DB error")
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            assert query_funnel(MagicMock()) is None
+
+    def test_conversion_rate(self):
+        assert conversion_rate(1, 4) == 25.0
+        assert conversion_rate(1, 3) == 33.33
+        assert conversion_rate(5, 0) == 0.0
+
+    def test_write_funnel_csv_report(self, tmp_path):
+        """測試 CSV 包含各階段人數與轉換率"""
+        funnel = [
+            {'period': 'W1', 'counts': {'registered': 10, 'exported': 4, 'finished': 1}},
+            {'period': '總計', 'counts': {'registered': 10, 'exported': 4, 'finished': 1}},
+        ]
+        output_file = tmp_path / "funnel.csv"
+
+        write_funnel_csv_report(funnel, output_file=str(output_file))
+
+        with open(output_file, 'r', encoding='utf-8-sig') as f:
+            data = list(csv.reader(f))
+        assert data[0] == ['期間', '註冊人數', '已匯出人數', '已匯出轉換率(%)',
+                           '已匯出且已完成人數', '已匯出且已完成轉換率(%)', '整體轉換率(%)']
+        assert data[1] == ['W1', '10', '4', '40.0', '1', '25.0', '10.0']
+
+
+class TestExportUsers:
+    """測試用戶明細串流匯出"""
+
+    @staticmethod
+    def _users():
+        return [
+            {'Id': '1', 'LoginName': 'a@example.com', 'CreateDate': datetime(2025, 11, 17, 9, 30), 'NameC': '甲'},
+            {'Id': '2', 'LoginName': 'b@example.com', 'CreateDate': date(2025, 11, 25), 'NameC': ''},
+            {'Id': '3', 'LoginName': 'c@example.com', 'CreateDate': "2025-11-18", 'NameC': '丙'},
+            {'Id': '4', 'LoginName': 'd@example.com', 'CreateDate': date(2026, 2, 1), 'NameC': '丁'},
+        ]
+
+    @staticmethod
+    def _read(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            return list(csv.reader(f))
+
+    def test_export_single_file(self, tmp_path):
+        output_file = str(tmp_path / "users.csv")
+
+        written = export_users_csv(iter(self._users()), output_file)
+
+        assert written == {output_file: 4}
+        data = self._read(output_file)
+        assert data[0] == ['Id', 'LoginName', 'CreateDate', 'NameC']
+        assert data[1] == ['1', 'a@example.com', '2025-11-17 09:30:00', '甲']
+        assert len(data) == 5
+
+    def test_export_shard_by_week(self, tmp_path):
+        output_file = str(tmp_path / "users.csv")
+        weeks = get_week_ranges()
+
+        written = export_users_csv(iter(self._users()), output_file, shard_by_week=True)
+
+        first_week = shard_output_file(output_file, weeks[0][3])
+        second_week = shard_output_file(output_file, weeks[1][3])
+        unassigned = shard_output_file(output_file, "未分週")
+        assert written == {first_week: 2, second_week: 1, unassigned: 1}
+        assert [row[0] for row in self._read(first_week)[1:]] == ['1', '3']
+        assert first_week.endswith("users_2025-11-第3週.csv")
+
+    def test_export_shards_with_open_file_limit(self, tmp_path):
+        """測試超過同時開啟上限時關閉較舊的檔案，重新開啟時附加寫入且不重複標題"""
+        output_file = str(tmp_path / "users.csv")
+        weeks = get_week_ranges()
+        users = self._users() + [
+            {'Id': '5', 'LoginName': 'e@example.com', 'CreateDate': date(2025, 11, 19), 'NameC': '戊'},
+        ]
+
+        with patch('hireme.open', wraps=open) as mock_open:
+            written = export_users_csv(iter(users), output_file, shard_by_week=True, max_open_files=1)
+
+        first_week = shard_output_file(output_file, weeks[0][3])
+        assert written[first_week] == 3
+        data = self._read(first_week)
+        assert data[0] == ['Id', 'LoginName', 'CreateDate', 'NameC']
+        assert [row[0] for row in data[1:]] == ['1', '3', '5']
+        assert [c.args[1] for c in mock_open.call_args_list if c.args[0] == first_week] == ['w', 'a', 'a']
+
+    def test_export_invalid_progress_interval(self, tmp_path):
+        with pytest.raises(ValueError):
+            export_users_csv(iter(self._users()), str(tmp_path / "users.csv"), progress_interval=0)
+        with pytest.raises(SystemExit):
+            parse_args(["export-users", "--progress-interval", "0"])
+        assert parse_args(["export-users", "--progress-interval", "5"]).progress_interval == 5
+
+    def test_export_empty_stream(self, tmp_path):
+        """測試沒有用戶時仍產生只有標題的檔案"""
+        output_file = str(tmp_path / "users.csv")
+        assert export_users_csv(iter([]), output_file) == {output_file: 0}
+        assert self._read(output_file) == [['Id', 'LoginName', 'CreateDate', 'NameC']]
+
+    def test_export_progress(self, tmp_path):
+        with patch('hireme.logger') as mock_logger:
+            export_users_csv(iter(self._users()), str(tmp_path / "users.csv"), progress_interval=2)
+        progress = [c for c in mock_logger.info.call_args_list if "已匯出 " in c.args[0]]
+        assert len(progress) == 2
+
+    def test_export_failure_returns_none(self, tmp_path):
+        def broken():
+            yield self._users()[0]
+            raise RuntimeError("connection lost")
+
+        assert export_users_csv(broken(), str(tmp_path / "users.csv")) is None
+
+    def test_export_subcommand(self, tmp_path):
+        output_file = str(tmp_path / "users.csv")
+        args = parse_args(["--batch-size", "100", "export-users", "--output", output_file, "--shard-by-week"])
+        assert args.command == "export-users"
+        assert args.shard_by_week
+        assert parse_args([]).command is None
+
+        engine = MagicMock()
+        with patch('hireme.get_db_engine', return_value=engine), \
+                patch('hireme.iter_registered_users', return_value=iter(self._users())) as mock_iter:
+            main(["--batch-size", "100", "export-users", "--output", output_file])
+
+        mock_iter.assert_called_once_with(engine, 100)
+        engine.dispose.assert_called_once()
+        assert len(self._read(output_file)) == 5
+
+    def test_export_sorted_with_spill(self, tmp_path):
+        """測試排序匯出超過記憶體上限時仍依 CreateDate 排序"""
+        output_file = str(tmp_path / "users.csv")
+        users = list(reversed(self._users())) * 50
+
+        with patch('hireme.get_db_engine', return_value=MagicMock()), \
+                patch('hireme.iter_registered_users', return_value=iter(users)), \
+                patch('hireme.SpillingBuffer', wraps=SpillingBuffer) as mock_buffer:
+            main(["--memory-budget-mb", "0.01", "export-users", "--output", output_file, "--sort-by-date"])
+
+        assert mock_buffer.call_args.args[0] == int(0.01 * 1024 * 1024)
+        ids = [row[0] for row in self._read(output_file)[1:]]
+        assert ids == ['1'] * 50 + ['3'] * 50 + ['2'] * 50 + ['4'] * 50
+
+
+class TestMemoryBudget:
+    """測試有記憶體上限的用戶緩衝"""
+
+    def test_buffer_users_spills_and_sorts(self):
+        users = [{'Id': str(i), 'LoginName': f'u{i}@example.com',
+                  'CreateDate': date(2025, 11, 17) + timedelta(days=(i * 7) % 50), 'NameC': ''}
+                 for i in range(2000)]
+
+        with buffer_users(iter(users), memory_budget_mb=0.02) as buffer:
+            assert buffer.spilled_runs > 1
+            assert len(buffer) == 2000
+            dates = [u['CreateDate'] for u in buffer]
+            assert dates == sorted(dates)
+            # 統計結果與未緩衝時相同
+            assert summarize_users_by_week(buffer) == summarize_users_by_week(users)
+
+    def test_query_with_budget_returns_buffer(self):
+        rows = [_row(str(i), f'u{i}@example.com', date(2025, 11, 30) - timedelta(days=i % 10)) for i in range(300)]
+        session = _mock_session(rows)
+
+        with patch('hireme.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            users = query_registered_users(MagicMock(), memory_budget_mb=0.01)
+
+        try:
+            assert len(users) == 300
+            assert next(iter(users))['CreateDate'] == date(2025, 11, 21)
+        finally:
+            users.close()
+
+
 class TestDataStructure:
     """測試資料結構相關功能"""
 
@@ -0,0 +1,266 @@
+"""
+hireme_arrow 模組單元測試
+測試欄式讀取、統計與 CSV 輸出與原本逐列處理的結果一致
+"""
+
+import csv
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from hireme import count_dates_by_weeks, is_email_format
+from week_range import get_week_ranges
+
+pa = pytest.importorskip("pyarrow")
+
+from hireme_arrow import (  # noqa: E402
+    encode_ids,
+    decode_ids,
+    fetch_users_arrow,
+    count_table_by_weeks,
+    write_users_csv_arrow,
+    export_users_arrow,
+    _record_batch
+)
+
+
+def _mock_session(rows):
+    """建立會回傳指定資料列的 mock session"""
+    session = MagicMock()
+    result = MagicMock()
+    result.partitions.side_effect = lambda size: (rows[i:i + size] for i in range(0, len(rows), size))
+    session.execute.return_value = result
+    return session
+
+
+def _rows(count):
+    """產生 (Id, LoginName, CreateDate, NameC) 資料列，每三筆有一筆不是 email"""
+    rows = []
+    for i in range(count):
+        login_name = f"user{i}@example.com" if i % 3 else f"user{i}"
+        create_date = datetime(2025, 11, 10, 8, 0) + timedelta(days=i % 70, minutes=i)
+        rows.append((uuid.UUID(int=i + 1).hex, login_name, create_date, None if i % 5 == 0 else f"名稱{i}"))
+    return rows
+
+
+def _fetch(rows, batch_size=4):
+    session = _mock_session(rows)
+    with patch('hireme_arrow.sessionmaker') as mock_sessionmaker:
+        mock_sessionmaker.return_value = lambda: session
+        table = fetch_users_arrow(MagicMock(), batch_size=batch_size)
+    return table, session
+
+
+class TestIdEncoding:
+    """測試 Id 固定長度二進位編碼"""
+
+    def test_round_trip(self):
+        ids = (uuid.uuid4().hex, uuid.uuid4().hex, uuid.uuid4().hex)
+        encoded = encode_ids(ids)
+        assert encoded.type == pa.binary(16)
+        assert encoded.nbytes == 48
+        assert decode_ids(encoded).to_pylist() == list(ids)
+
+    def test_guid_with_hyphens(self):
+        guid = '3A33C354-CDFA-48F7-9CD3-B00F413FC99F'
+        assert decode_ids(encode_ids((guid,))).to_pylist() == ['3a33c354cdfa48f79cd3b00f413fc99f']
+
+    def test_decode_sliced_array(self):
+        """測試切片後的欄位只解碼切片範圍"""
+        ids = tuple(uuid.UUID(int=i).hex for i in range(5))
+        assert decode_ids(encode_ids(ids).slice(2, 2)).to_pylist() == list(ids[2:4])
+
+    def test_invalid_id(self):
+        with pytest.raises(ValueError):
+            encode_ids(('abc',))
+
+    def test_uneven_ids_rejected(self):
+        """測試長短不一但合計為 16 bytes 倍數的 Id 不會錯位"""
+        guid = uuid.uuid4().hex
+        with pytest.raises(ValueError):
+            encode_ids((guid[:-2], guid + 'ab'))
+
+
+class TestArrowFetch:
+    """測試欄式讀取"""
+
+    def test_record_batch_filters_email(self):
+        batch = _record_batch(_rows(9))
+        assert batch.num_rows == 6
+        assert all(is_email_format(name) for name in batch.column('LoginName').to_pylist())
+        assert '' in batch.column('NameC').to_pylist()
+
+    def test_record_batch_skips_invalid_ids(self):
+        """測試 NULL 或非 GUID 的 Id 只略過該筆，不中斷整批"""
+        guid = uuid.uuid4()
+        rows = [
+            (None, 'a@example.com', datetime(2025, 11, 20), 'a'),
+            ('not-a-guid', 'b@example.com', datetime(2025, 11, 20), 'b'),
+            (guid, 'c@example.com', datetime(2025, 11, 20), 'c'),
+            ('bad', 'nobody', datetime(2025, 11, 20), 'd'),
+        ]
+        batch = _record_batch(rows)
+        assert batch.num_rows == 1
+        assert batch.column('LoginName').to_pylist() == ['c@example.com']
+        assert decode_ids(batch.column('Id')).to_pylist() == [guid.hex]
+
+    def test_record_batch_checks_guid_shape(self):
+        """測試長度相符但不是十六進位、或連字號位置錯誤的 Id 也會略過"""
+        guid = uuid.uuid4()
+        rows = [
+            ('g' * 32, 'a@example.com', datetime(2025, 11, 20), 'a'),
+            (guid.hex[:8] + '-' + guid.hex[8:12] + guid.hex[12:16] + '-' + guid.hex[16:20] + '-' + guid.hex[20:] + '-',
+             'b@example.com', datetime(2025, 11, 20), 'b'),
+            ('０' * 32, 'c@example.com', datetime(2025, 11, 20), 'c'),
+            (str(guid).upper(), 'd@example.com', datetime(2025, 11, 20), 'd'),
+            (guid.hex, 'e@example.com', datetime(2025, 11, 20), 'e'),
+        ]
+        with patch('hireme_arrow.logger') as mock_logger:
+            batch = _record_batch(rows)
+        assert batch.column('LoginName').to_pylist() == ['d@example.com', 'e@example.com']
+        assert decode_ids(batch.column('Id')).to_pylist() == [guid.hex, guid.hex]
+        assert '3' in mock_logger.warning.call_args.args[0]
+
+    def test_record_batch_without_email(self):
+        assert _record_batch([(uuid.uuid4().hex, 'nobody', datetime(2025, 11, 20), 'x')]) is None
+
+    def test_fetch_streams_in_batches(self):
+        rows = _rows(30)
+        table, session = _fetch(rows)
+
+        assert table.num_rows == sum(1 for row in rows if is_email_format(row[1]))
+        assert table.schema.field('CreateDate').type == pa.timestamp('us')
+        session.execute.return_value.partitions.assert_called_once_with(4)
+        assert session.execute.call_args.kwargs['execution_options'] == {"stream_results": True}
+        session.close.assert_called_once()
+
+    def test_fetch_spills_over_budget(self, tmp_path):
+        """測試超過記憶體上限時寫入 Arrow IPC 暫存檔，統計結果不變"""
+        rows = _rows(300)
+        expected, _ = _fetch(rows, batch_size=50)
+
+        session = _mock_session(rows)
+        with patch('hireme_arrow.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            table = fetch_users_arrow(MagicMock(), batch_size=50, memory_budget_bytes=1024, spill_dir=str(tmp_path))
+
+        assert (tmp_path / "users.arrow").exists()
+        assert table.equals(expected)
+        weeks = get_week_ranges()
+        assert count_table_by_weeks(table, weeks) == count_table_by_weeks(expected, weeks)
+
+    def test_fetch_budget_requires_spill_dir(self):
+        with pytest.raises(ValueError):
+            fetch_users_arrow(MagicMock(), memory_budget_bytes=1024)
+
+    def test_fetch_empty_result(self):
+        table, _ = _fetch([])
+        assert table.num_rows == 0
+        assert count_table_by_weeks(table, get_week_ranges())[0] == 0
+
+
+class TestArrowCounting:
+    """測試欄位統計與逐列統計結果一致"""
+
+    def test_counts_match_python(self):
+        rows = _rows(300)
+        weeks = get_week_ranges()
+        table, _ = _fetch(rows, batch_size=50)
+
+        expected = count_dates_by_weeks([row[2] for row in rows if is_email_format(row[1])], weeks, use_numpy=False)
+        total, week_counts = count_table_by_weeks(table, weeks)
+
+        assert total == table.num_rows
+        assert [w['count'] for w in week_counts] == expected
+        assert week_counts[0]['period'] == weeks[0][0]
+
+    def test_counts_without_numpy(self):
+        rows = _rows(100)
+        weeks = get_week_ranges()
+        table, _ = _fetch(rows)
+
+        expected = count_table_by_weeks(table, weeks)
+        with patch('hireme_arrow.np', None):
+            assert count_table_by_weeks(table, weeks) == expected
+
+
+class TestArrowCsv:
+    """測試欄式 CSV 輸出"""
+
+    def test_write_users_csv(self, tmp_path):
+        rows = _rows(6)
+        table, _ = _fetch(rows)
+        output_file = tmp_path / "users.csv"
+
+        write_users_csv_arrow(table, str(output_file))
+
+        with open(output_file, 'r', encoding='utf-8-sig') as f:
+            data = list(csv.reader(f))
+        assert data[0] == ['Id', 'LoginName', 'CreateDate', 'NameC']
+        assert len(data) == 1 + table.num_rows
+        assert data[1][0] == rows[1][0]
+        assert data[1][1] == rows[1][1]
+        assert data[1][2].startswith(rows[1][2].strftime('%Y-%m-%d %H:%M:%S'))
+
+
+    def test_export_users_sorted(self, tmp_path):
+        rows = _rows(12)[::-1]
+        session = _mock_session(rows)
+        output_file = tmp_path / "users.csv"
+
+        with patch('hireme_arrow.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            written = export_users_arrow(MagicMock(), str(output_file), sort_by_date=True)
+
+        with open(output_file, 'r', encoding='utf-8-sig') as f:
+            dates = [row['CreateDate'] for row in csv.DictReader(f)]
+        assert written == {str(output_file): len(dates)}
+        assert dates == sorted(dates)
+
+    def test_export_users_failure(self, tmp_path):
+        with patch('hireme_arrow.fetch_users_arrow', side_effect=RuntimeError("db down")):
+            assert export_users_arrow(MagicMock(), str(tmp_path / "users.csv")) is None
+
+
+class TestArrowMode:
+    """測試 hireme 的 arrow 模式"""
+
+    def test_report_summary_arrow(self):
+        from hireme import parse_args, report_summary
+
+        assert parse_args(["--mode", "arrow"]).mode == "arrow"
+
+        session = _mock_session(_rows(30))
+        with patch('hireme_arrow.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: session
+            total, week_counts = report_summary(MagicMock(), "arrow", batch_size=8)
+
+        assert total == 20
+        assert len(week_counts) == len(get_week_ranges())
+
+    def test_report_summary_arrow_with_budget(self):
+        from hireme import report_summary
+
+        with patch('hireme_arrow.sessionmaker') as mock_sessionmaker:
+            mock_sessionmaker.return_value = lambda: _mock_session(_rows(30))
+            expected = report_summary(MagicMock(), "arrow", batch_size=8)
+            assert report_summary(MagicMock(), "arrow", batch_size=8, memory_budget_mb=0.001) == expected
+
+    def test_export_users_arrow_mode(self, tmp_path):
+        from hireme import main
+
+        output_file = tmp_path / "users.csv"
+        with patch('hireme.get_db_engine'), \
+                patch('hireme_arrow.export_users_arrow', return_value={str(output_file): 3}) as mock_export, \
+                patch('hireme.iter_registered_users') as mock_iter:
+            main(["--mode", "arrow", "export-users", "--output", str(output_file), "--sort-by-date"])
+
+        mock_export.assert_called_once()
+        assert mock_export.call_args.args[1:4] == (str(output_file), False, True)
+        mock_iter.assert_not_called()
+
+    def test_arrow_mode_rejects_shard_by_week(self):
+        from hireme import parse_args
+
+        with pytest.raises(SystemExit):
+            parse_args(["--mode", "arrow", "export-users", "--shard-by-week"])
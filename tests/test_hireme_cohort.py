@@ -0,0 +1,173 @@
+"""
+hireme_cohort 模組單元測試
+測試用戶 ID 索引、點陣圖運算與留存報告
+"""
+
+import csv
+import pytest
+from datetime import date, datetime
+from sqlalchemy import create_engine, event, text
+from hireme_cohort import (
+    normalize_user_id,
+    UserIdIndex,
+    UserBitmap,
+    build_registration_bitmaps,
+    build_login_bitmaps,
+    compute_retention,
+    iter_weekly_login_user_ids,
+    write_cohort_csv_report
+)
+from week_range import get_week_ranges
+
+
+def bitmap_of(*positions):
+    bitmap = UserBitmap()
+    for position in positions:
+        bitmap.add(position)
+    return bitmap
+
+
+class TestUserIdIndex:
+    """測試用戶 ID 索引"""
+
+    def test_dense_positions(self):
+        """測試位置從 0 開始連續配置，重複 ID 取得相同位置"""
+        index = UserIdIndex()
+        assert index.add('a') == 0
+        assert index.add('b') == 1
+        assert index.add('a') == 0
+        assert len(index) == 2
+
+    def test_guid_and_hex_ids_match(self):
+        """測試 GUID 格式與 32 字元十六進位格式視為同一位用戶"""
+        index = UserIdIndex()
+        hex_id = '3a33c354cdfa48f79cd3b00f413fc99f'
+        guid = '3A33C354-CDFA-48F7-9CD3-B00F413FC99F'
+        assert normalize_user_id(guid) == hex_id
+        assert index.add(hex_id) == index.add(guid)
+
+    def test_get_does_not_allocate(self):
+        index = UserIdIndex()
+        index.add('a')
+        assert index.get('A') == 0
+        assert index.get('b') is None
+        assert len(index) == 1
+
+
+class TestUserBitmap:
+    """測試點陣圖運算"""
+
+    def test_add_and_contains(self):
+        bitmap = bitmap_of(0, 9, 1000)
+        assert 0 in bitmap
+        assert 9 in bitmap
+        assert 1000 in bitmap
+        assert 8 not in bitmap
+        assert 5000 not in bitmap
+        assert len(bitmap) == 3
+
+    def test_set_operations(self):
+        a = bitmap_of(1, 2, 3, 100)
+        b = bitmap_of(2, 3, 4)
+        assert len(a & b) == 2
+        assert len(a | b) == 5
+        assert len(a - b) == 2
+        assert 100 in (a - b)
+        assert 4 not in (a - b)
+
+    def test_empty_bitmap(self):
+        empty = UserBitmap()
+        assert len(empty) == 0
+        assert len(empty & bitmap_of(1)) == 0
+        assert len(bitmap_of(1) - empty) == 1
+
+    def test_one_bit_per_user(self):
+        """測試每位用戶只佔 1 bit"""
+        bitmap = bitmap_of(*range(0, 80000, 3))
+        assert bitmap.nbytes() == 10000
+
+
+class TestRetention:
+    """測試留存統計"""
+
+    def test_retention_rows(self):
+        weeks = get_week_ranges()[:2]
+        index = UserIdIndex()
+        users = [
+            {'Id': 'u1', 'CreateDate': date(2025, 11, 17)},
+            {'Id': 'u2', 'CreateDate': datetime(2025, 11, 20, 8, 0)},
+            {'Id': 'u3', 'CreateDate': date(2025, 11, 25)},
+            {'Id': 'u4', 'CreateDate': "2025-11-26"},
+        ]
+        registered, registered_by_week = build_registration_bitmaps(users, index, weeks)
+        logins_by_week = build_login_bitmaps([['U1', 'x9'], ['u1', 'u3', 'x9']], index)
+        # 非註冊用戶不配置位置
+        assert len(index) == 4
+        assert [len(bitmap) for bitmap in logins_by_week] == [1, 2]
+
+        rows = compute_retention(registered, registered_by_week, logins_by_week, weeks)
+
+        assert rows[0]['registered'] == 2
+        assert rows[0]['logged_in'] == 1
+        assert rows[0]['never_logged_in'] == 1
+        assert rows[0]['weekly'] == [1, 1]
+        assert rows[1]['weekly'] == [0, 1]
+        # 最後一列為所有註冊用戶，非註冊用戶 x9 不計入
+        assert rows[-1]['period'] == "全部註冊用戶"
+        assert rows[-1]['registered'] == 4
+        assert rows[-1]['logged_in'] == 2
+        assert rows[-1]['login_rate'] == 50.0
+
+    def test_write_csv_report(self, tmp_path):
+        weeks = get_week_ranges()[:2]
+        rows = [
+            {'period': weeks[0][0], 'registered': 2, 'logged_in': 1, 'never_logged_in': 1,
+             'login_rate': 50.0, 'weekly': [1, 0]},
+            {'period': "全部註冊用戶", 'registered': 2, 'logged_in': 1, 'never_logged_in': 1,
+             'login_rate': 50.0, 'weekly': [1, 0]},
+        ]
+        output_file = tmp_path / "cohort.csv"
+
+        write_cohort_csv_report(rows, weeks, str(output_file))
+
+        with open(output_file, 'r', encoding='utf-8-sig') as f:
+            data = list(csv.reader(f))
+        assert data[0][:2] == ['註冊期間', '註冊人數']
+        assert len(data[0]) == 5 + len(weeks)
+        assert data[1] == [weeks[0][0], '2', '1', '1', '50.0', '1', '0']
+
+
+class TestLoginQuery:
+    """以 SQLite 測試登入用戶查詢"""
+
+    @pytest.fixture
+    def membership_engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+        dbo_path = str(tmp_path / 'dbo.db')
+
+        @event.listens_for(engine, "connect")
+        def attach_dbo(dbapi_connection, connection_record):
+            dbapi_connection.execute(f"ATTACH DATABASE '{dbo_path}' AS dbo")
+
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE dbo.AbpAuditLogs (Id TEXT PRIMARY KEY, ApplicationName TEXT, Url TEXT, "
+                "HttpStatusCode INTEGER, ExecutionTime DATETIME, UserId TEXT)"
+            ))
+            app = 'Public.JbJobMembership.HttpApi.Host'
+            conn.execute(text("INSERT INTO dbo.AbpAuditLogs VALUES (:id, :app, :url, :code, :time, :user)"), [
+                {'id': '1', 'app': app, 'url': '/connect/token', 'code': 200, 'time': '2025-11-18 10:00:00.000000', 'user': 'A'},
+                {'id': '2', 'app': app, 'url': '/connect/token', 'code': 200, 'time': '2025-11-19 10:00:00.000000', 'user': 'A'},
+                {'id': '3', 'app': app, 'url': '/api/app/line-login/token', 'code': 200, 'time': '2025-11-23 23:00:00.000000', 'user': 'B'},
+                {'id': '4', 'app': app, 'url': '/connect/token', 'code': 400, 'time': '2025-11-18 10:00:00.000000', 'user': 'C'},
+                {'id': '5', 'app': 'Other', 'url': '/connect/token', 'code': 200, 'time': '2025-11-18 10:00:00.000000', 'user': 'D'},
+                {'id': '6', 'app': app, 'url': '/connect/token', 'code': 200, 'time': '2025-11-24 00:00:00.000000', 'user': 'E'},
+                {'id': '7', 'app': app, 'url': '/connect/token', 'code': 200, 'time': '2025-11-18 10:00:00.000000', 'user': None},
+            ])
+
+        yield engine
+        engine.dispose()
+
+    def test_distinct_successful_logins_in_week(self, membership_engine):
+        user_ids = list(iter_weekly_login_user_ids(membership_engine, date(2025, 11, 17), date(2025, 11, 23)))
+        assert sorted(user_ids) == ['A', 'B']
@@ -14,6 +14,19 @@ from network_speedtest import (
     run_speedtest,
     CSV_FILE
 )
+from speedtest_cache import SpeedtestCache
+from speedtest_store import SpeedtestStore
+from speedtest_anomaly import AnomalyDetector
+
+
+@pytest.fixture(autouse=True)
+def server_cache(tmp_path):
+    """每個測試使用獨立的伺服器快取，避免重複使用其他測試的 Speedtest 物件"""
+    cache = SpeedtestCache(path=str(tmp_path / "speedtest_servers.json"), base_url="")
+    with patch('network_speedtest._server_cache', cache), \
+            patch('network_speedtest.SPEEDTEST_DB', str(tmp_path / "speedtest_results.db")), \
+            patch('network_speedtest._anomaly_detector', AnomalyDetector(path=str(tmp_path / "anomaly.json"))):
+        yield cache
 
 
 class TestTestSpeed:
@@ -33,6 +46,8 @@ class TestTestSpeed:
             'sponsor': 'Test ISP'
         }
         mock_st.results.ping = 15.5
+        mock_st.results.bytes_received = 125_000_000
+        mock_st.results.bytes_sent = 62_500_000
 
         # 設定 mock 速度（單位為 bps，需轉換為 Mbps）
         mock_st.download.return_value = 100_000_000  # 100 Mbps
@@ -49,6 +64,10 @@ class TestTestSpeed:
         assert result['server_name'] == 'Test Server'
         assert result['server_country'] == 'Taiwan'
         assert result['server_sponsor'] == 'Test ISP'
+        # mock 伺服器沒有網址，略過延遲取樣
+        assert result['jitter_ms'] is None
+        assert result['bytes_received'] == 125_000_000
+        assert result['bytes_sent'] == 62_500_000
 
         # 驗證方法被呼叫
         mock_st.get_best_server.assert_called_once()
@@ -374,10 +393,49 @@ class TestSaveToCsv:
 
             expected_order = [
                 'timestamp', 'download_mbps', 'upload_mbps', 'ping_ms',
-                'server_name', 'server_country', 'server_sponsor'
+                'server_name', 'server_country', 'server_sponsor',
+                'ping_min_ms', 'ping_median_ms', 'ping_p95_ms', 'jitter_ms', 'ping_loss_ratio',
+                'bytes_received', 'bytes_sent'
             ]
             assert header == expected_order
 
+    def test_save_to_csv_migrates_old_header(self, tmp_path):
+        """測試舊版 CSV 補上延遲取樣欄位，舊資料保留"""
+        csv_file = tmp_path / "test_speedtest.csv"
+        old_fields = ['timestamp', 'download_mbps', 'upload_mbps', 'ping_ms',
+                      'server_name', 'server_country', 'server_sponsor']
+        with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=old_fields)
+            writer.writeheader()
+            writer.writerow(dict(zip(old_fields, ['2026-01-13 09:00:00', 90.0, 45.0, 20.0, '台北', 'Taiwan', 'ISP'])))
+
+        result = {
+            'timestamp': '2026-01-13 10:00:00', 'download_mbps': 100.0, 'upload_mbps': 50.0, 'ping_ms': 15.0,
+            'server_name': 'New Server', 'server_country': 'Taiwan', 'server_sponsor': 'ISP',
+            'ping_min_ms': 10.0, 'ping_median_ms': 12.0, 'ping_p95_ms': 30.0, 'jitter_ms': 5.5, 'ping_loss_ratio': 0.1
+        }
+        with patch('network_speedtest.CSV_FILE', str(csv_file)):
+            save_to_csv(result)
+
+        with open(csv_file, 'r', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+        assert rows[0]['server_name'] == '台北'
+        assert rows[0]['jitter_ms'] == ''
+        assert rows[1]['jitter_ms'] == '5.5'
+        assert not (tmp_path / "test_speedtest.csv.tmp").exists()
+
+    @patch('network_speedtest.logger')
+    def test_save_to_csv_unknown_columns_not_rewritten(self, mock_logger, tmp_path):
+        """測試有無法辨識的欄位時不改寫檔案"""
+        csv_file = tmp_path / "test_speedtest.csv"
+        csv_file.write_text('timestamp,custom\n2026-01-13 09:00:00,x\n', encoding='utf-8')
+
+        with patch('network_speedtest.CSV_FILE', str(csv_file)):
+            save_to_csv({'timestamp': '2026-01-13 10:00:00'})
+
+        assert csv_file.read_text(encoding='utf-8') == 'timestamp,custom\n2026-01-13 09:00:00,x\n'
+        mock_logger.error.assert_called_once()
+
 
 class TestRunSpeedtest:
     """測試 run_speedtest 函式"""
@@ -402,6 +460,39 @@ class TestRunSpeedtest:
         mock_network_test_speed.assert_called_once()
         mock_save_to_csv.assert_called_once_with(mock_result)
 
+    @patch('network_speedtest.save_to_csv')
+    @patch('network_speedtest.test_speed')
+    def test_run_speedtest_saves_to_store(self, mock_network_test_speed, mock_save_to_csv, tmp_path):
+        """測試結果同時存入時間序列資料庫"""
+        mock_network_test_speed.return_value = {
+            'timestamp': '2026-01-13 10:30:00', 'download_mbps': 100.0, 'upload_mbps': 50.0,
+            'ping_ms': 15.0, 'server_name': 'Test Server', 'server_country': 'Taiwan', 'server_sponsor': 'ISP'
+        }
+
+        run_speedtest()
+
+        store = SpeedtestStore(str(tmp_path / "speedtest_results.db"))
+        try:
+            rows = store.query_raw(datetime(2026, 1, 13), datetime(2026, 1, 14))
+        finally:
+            store.close()
+        assert [row['server_name'] for row in rows] == ['Test Server']
+
+    @patch('network_speedtest.save_to_csv')
+    @patch('network_speedtest.test_speed')
+    def test_run_speedtest_checks_anomalies(self, mock_network_test_speed, mock_save_to_csv):
+        """測試結果送進異常偵測"""
+        result = {
+            'timestamp': '2026-01-13 10:30:00', 'download_mbps': 100.0, 'upload_mbps': 50.0,
+            'ping_ms': 15.0, 'server_name': 'Test Server', 'server_country': 'Taiwan', 'server_sponsor': 'ISP'
+        }
+        mock_network_test_speed.return_value = result
+
+        with patch('network_speedtest._anomaly_detector') as mock_detector:
+            run_speedtest()
+
+        mock_detector.observe.assert_called_once_with(result)
+
     @patch('network_speedtest.save_to_csv')
     @patch('network_speedtest.test_speed')
     @patch('network_speedtest.logger')
@@ -0,0 +1,182 @@
+"""
+rec_user_snapshot 模組單元測試
+使用 SQLite 模擬 JBHRIS_DISPATCH 來源與本機快照
+"""
+
+import sqlite3
+import pytest
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+from sqlalchemy import create_engine, event, text
+from rec_user_snapshot import (
+    SnapshotMeta,
+    get_snapshot_engine,
+    get_snapshot_age,
+    sync_rec_user_snapshot,
+    lookup_rec_users,
+    format_age
+)
+
+
+@pytest.fixture
+def source_engine(tmp_path):
+    """建立以 dbo schema 存放 REC_User 的 SQLite 來源資料庫"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    dbo_path = str(tmp_path / 'dbo.db')
+
+    @event.listens_for(engine, "connect")
+    def attach_dbo(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{dbo_path}' AS dbo")
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE dbo.REC_User (UserID TEXT PRIMARY KEY, CreateDate DATETIME, NameC TEXT)"))
+
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def snapshot_engine(tmp_path):
+    """建立本機快照資料庫"""
+    engine = get_snapshot_engine(str(tmp_path / 'snapshot.db'))
+    yield engine
+    engine.dispose()
+
+
+def insert_source(engine, rows):
+    """新增來源資料列"""
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT OR REPLACE INTO dbo.REC_User (UserID, CreateDate, NameC) VALUES (:id, :create_date, :name)"),
+            [{'id': r[0], 'create_date': r[1].strftime('%Y-%m-%d %H:%M:%S.%f'), 'name': r[2]} for r in rows]
+        )
+
+
+def snapshot_rows(engine):
+    """讀取快照內容"""
+    with engine.connect() as conn:
+        return {row.UserID: row.NameC for row in conn.execute(text("SELECT UserID, NameC FROM REC_User"))}
+
+
+class TestSync:
+    """測試快照同步"""
+
+    def test_never_synced_age_is_none(self, snapshot_engine):
+        """測試從未同步時沒有快照年齡"""
+        assert get_snapshot_age(snapshot_engine) is None
+
+    def test_initial_sync_copies_all_rows(self, source_engine, snapshot_engine):
+        """測試第一次同步複製所有資料列"""
+        insert_source(source_engine, [
+            ('A', datetime(2025, 11, 17, 9, 0), '甲'),
+            ('B', datetime(2025, 11, 18, 9, 0), '乙'),
+        ])
+
+        synced = sync_rec_user_snapshot(source_engine, snapshot_engine, batch_size=1)
+
+        assert synced == 2
+        assert snapshot_rows(snapshot_engine) == {'A': '甲', 'B': '乙'}
+        assert get_snapshot_age(snapshot_engine) < timedelta(minutes=1)
+
+    def test_batch_above_sqlite_parameter_limit(self, source_engine, tmp_path):
+        """測試參數上限為 999（舊版 SQLite）時，一批超過 333 列仍可寫入"""
+        snapshot_engine = get_snapshot_engine(str(tmp_path / 'limited.db'))
+
+        @event.listens_for(snapshot_engine, "connect")
+        def limit_variables(dbapi_connection, connection_record):
+            dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+
+        snapshot_engine.dispose()
+        insert_source(source_engine, [
+            (f'U{i:04d}', datetime(2025, 11, 17, 9, 0) + timedelta(minutes=i), f'名稱{i}') for i in range(1200)
+        ])
+
+        try:
+            synced = sync_rec_user_snapshot(source_engine, snapshot_engine, batch_size=5000)
+            assert synced == 1200
+            assert len(snapshot_rows(snapshot_engine)) == 1200
+        finally:
+            snapshot_engine.dispose()
+
+    def test_incremental_sync_reads_from_watermark(self, source_engine, snapshot_engine):
+        """測試增量同步只讀取最新 CreateDate 之後的資料列"""
+        insert_source(source_engine, [
+            ('A', datetime(2025, 11, 17, 9, 0), '甲'),
+            ('B', datetime(2025, 11, 18, 9, 0), '乙'),
+        ])
+        sync_rec_user_snapshot(source_engine, snapshot_engine)
+
+        insert_source(source_engine, [
+            ('A', datetime(2025, 11, 17, 9, 0), '甲（改名）'),
+            ('C', datetime(2025, 11, 18, 9, 0), '丙'),
+            ('D', datetime(2025, 11, 20, 9, 0), '丁'),
+        ])
+        synced = sync_rec_user_snapshot(source_engine, snapshot_engine)
+
+        # B、C 與浮水印同時間，D 較新；A 早於浮水印不會被讀取
+        assert synced == 3
+        assert snapshot_rows(snapshot_engine) == {'A': '甲', 'B': '乙', 'C': '丙', 'D': '丁'}
+
+    def test_full_sync_rebuilds_snapshot(self, source_engine, snapshot_engine):
+        """測試完整同步會反映來源的修改與刪除"""
+        insert_source(source_engine, [
+            ('A', datetime(2025, 11, 17, 9, 0), '甲'),
+            ('B', datetime(2025, 11, 18, 9, 0), '乙'),
+        ])
+        sync_rec_user_snapshot(source_engine, snapshot_engine)
+
+        with source_engine.begin() as conn:
+            conn.execute(text("DELETE FROM dbo.REC_User WHERE UserID = 'B'"))
+        insert_source(source_engine, [('A', datetime(2025, 11, 17, 9, 0), '甲（改名）')])
+
+        synced = sync_rec_user_snapshot(source_engine, snapshot_engine, full=True)
+
+        assert synced == 1
+        assert snapshot_rows(snapshot_engine) == {'A': '甲（改名）'}
+
+    def test_sync_failure_returns_none(self, snapshot_engine):
+        """測試來源查詢失敗時返回 None"""
+        broken_source = create_engine("sqlite://")
+        assert sync_rec_user_snapshot(broken_source, snapshot_engine) is None
+
+
+class TestLookup:
+    """測試快照查詢"""
+
+    def test_lookup_filters_keys_and_dates(self, source_engine, snapshot_engine):
+        """測試只返回指定 UserID 且日期在區間內的資料"""
+        insert_source(source_engine, [
+            ('A', datetime(2025, 11, 17, 9, 0), '甲'),
+            ('B', datetime(2025, 11, 16, 23, 59), '乙'),
+            ('C', datetime(2025, 11, 20, 9, 0), '丙'),
+            ('D', datetime(2025, 11, 23, 0, 0), '丁'),
+            ('E', datetime(2025, 11, 23, 9, 0), '戊'),
+        ])
+        sync_rec_user_snapshot(source_engine, snapshot_engine)
+
+        found = lookup_rec_users(snapshot_engine, ['A', 'B', 'D', 'E', 'X'], date(2025, 11, 17), date(2025, 11, 23))
+
+        # 與 SQL BETWEEN 相同：結束日期只包含當天 00:00
+        assert set(found) == {'A', 'D'}
+        assert found['A'] == (datetime(2025, 11, 17, 9, 0), '甲')
+
+    def test_lookup_many_keys_in_batches(self, source_engine, snapshot_engine):
+        """測試超過單批上限的 UserID 會分批查詢"""
+        insert_source(source_engine, [(f'U{i}', datetime(2025, 11, 18), str(i)) for i in range(50)])
+        sync_rec_user_snapshot(source_engine, snapshot_engine)
+
+        with patch('rec_user_snapshot.LOOKUP_BATCH_SIZE', 7):
+            found = lookup_rec_users(snapshot_engine, [f'U{i}' for i in range(50)], date(2025, 11, 17), date(2025, 11, 23))
+
+        assert len(found) == 50
+
+
+class TestFormatAge:
+    """測試快照年齡格式"""
+
+    def test_format_age(self):
+        assert format_age(None) == "從未同步"
+        assert format_age(timedelta(days=2, hours=3, minutes=10)) == "2 天 3 小時"
+
+    def test_snapshot_meta_model(self):
+        assert SnapshotMeta.__tablename__ == 'snapshot_meta'
@@ -0,0 +1,145 @@
+"""
+speedtest_adaptive 模組單元測試
+測試穩定時拉長間隔、變差時縮短間隔、每日流量預算與狀態保存
+"""
+
+import pytest
+from datetime import date
+from unittest.mock import Mock, patch
+from speedtest_adaptive import AdaptivePolicy, result_bytes
+from network_speedtest import run_speedtest
+from tests.conftest import make_result
+
+DAY = date(2026, 1, 13)
+
+
+@pytest.fixture
+def policy(tmp_path):
+    return AdaptivePolicy(3600, min_interval=900, max_interval=4 * 3600, backoff=2, band=0.2,
+                          daily_budget_mb=1000, path=str(tmp_path / "adaptive.json"))
+
+
+class TestInterval:
+    """測試間隔調整"""
+
+    def test_backs_off_while_stable(self, policy):
+        intervals = [policy.observe(make_result(download=value), today=DAY) for value in (100, 95, 105, 98, 102)]
+        # 第一筆建立參考值，之後每次穩定就加倍，不超過最長間隔
+        assert intervals == [3600, 7200, 14400, 14400, 14400]
+
+    def test_degradation_tests_more_often(self, policy):
+        for _ in range(3):
+            policy.observe(make_result(), today=DAY)
+        assert policy.observe(make_result(download=40.0), today=DAY) == 900
+        # 保留變差前的參考值，持續變差時維持最短間隔
+        assert policy.observe(make_result(download=42.0), today=DAY) == 900
+        assert policy.state['reference']['download_mbps'] == 100.0
+        # 回到參考值的範圍內後才再逐步拉長
+        assert policy.observe(make_result(download=97.0), today=DAY) == 1800
+        assert policy.observe(make_result(download=99.0), today=DAY) == 3600
+
+    def test_ping_increase_is_degradation(self, policy):
+        policy.observe(make_result(ping=15.0), today=DAY)
+        assert policy.observe(make_result(ping=18.0), today=DAY) == 7200
+        assert policy.observe(make_result(ping=60.0), today=DAY) == 900
+
+    def test_improvement_returns_to_base(self, policy):
+        policy.observe(make_result(), today=DAY)
+        policy.observe(make_result(), today=DAY)
+        assert policy.observe(make_result(download=300.0), today=DAY) == 3600
+
+    def test_anomaly_or_failure_tests_more_often(self, policy):
+        policy.observe(make_result(), today=DAY)
+        policy.observe(make_result(), today=DAY)
+        assert policy.observe(make_result(), [{'metric': 'upload_mbps'}], today=DAY) == 900
+        policy.observe(make_result(), today=DAY)
+        assert policy.observe(None, today=DAY) == 900
+        assert policy.state['reference']['download_mbps'] == 100.0
+
+    def test_fixed_interval_without_max(self, tmp_path):
+        policy = AdaptivePolicy(3600, min_interval=900, max_interval=0, path=str(tmp_path / "adaptive.json"))
+        assert [policy.observe(make_result(), today=DAY) for _ in range(3)] == [3600, 3600, 3600]
+
+    def test_invalid_settings(self, tmp_path):
+        with pytest.raises(ValueError):
+            AdaptivePolicy(0, path=str(tmp_path / "adaptive.json"))
+        with pytest.raises(ValueError):
+            AdaptivePolicy(3600, backoff=0.5, path=str(tmp_path / "adaptive.json"))
+
+
+class TestBudget:
+    """測試每日流量預算"""
+
+    def test_result_bytes(self):
+        assert result_bytes(make_result(mb=200)) == 200_000_000
+        assert result_bytes({'bytes_received': '', 'bytes_sent': None}) == 0
+
+    def test_skips_when_next_run_exceeds_budget(self, policy):
+        for _ in range(5):
+            assert policy.allow_run(DAY)
+            policy.observe(make_result(mb=200), today=DAY)
+        assert policy.bytes_today(DAY) == 1_000_000_000
+        # 再測一次會超過 1000 MB
+        assert not policy.allow_run(DAY)
+        # 隔天重新計算
+        assert policy.allow_run(date(2026, 1, 14))
+        assert policy.bytes_today(date(2026, 1, 14)) == 0
+
+    def test_unlimited_budget(self, tmp_path):
+        policy = AdaptivePolicy(3600, daily_budget_mb=0, path=str(tmp_path / "adaptive.json"))
+        for _ in range(10):
+            policy.observe(make_result(mb=500), today=DAY)
+        assert policy.allow_run(DAY)
+
+
+class TestPersistence:
+    """測試狀態保存"""
+
+    def test_state_survives_restart(self, policy):
+        policy.observe(make_result(mb=200), today=DAY)
+        policy.observe(make_result(mb=200), today=DAY)
+
+        restarted = AdaptivePolicy(3600, min_interval=900, max_interval=4 * 3600, daily_budget_mb=1000,
+                                   path=policy.path)
+        assert restarted.interval == 7200
+        assert restarted.bytes_today(DAY) == 400_000_000
+        assert restarted.observe(make_result(), today=DAY) == 14400
+
+    def test_corrupt_state_ignored(self, tmp_path):
+        path = tmp_path / "adaptive.json"
+        path.write_text("{not json", encoding='utf-8')
+        assert AdaptivePolicy(3600, path=str(path)).interval == 3600
+
+    def test_interval_clamped_to_new_settings(self, policy):
+        for _ in range(4):
+            policy.observe(make_result(), today=DAY)
+        assert AdaptivePolicy(3600, max_interval=7200, path=policy.path).interval == 7200
+
+
+class TestRunSpeedtestAdaptive:
+    """測試定時測試套用自適應排程"""
+
+    def test_reschedules_after_result(self, policy):
+        scheduler = Mock()
+        with patch('network_speedtest._adaptive_policy', policy), \
+             patch('network_speedtest._scheduler', scheduler), \
+             patch('network_speedtest.test_speed', return_value=make_result()), \
+             patch('network_speedtest.save_to_csv'), \
+             patch('network_speedtest.save_to_store'), \
+             patch('network_speedtest.check_anomalies', return_value=[]):
+            run_speedtest()
+            run_speedtest()
+
+        assert [call.args[0] for call in scheduler.reschedule.call_args_list] == [3600, 7200]
+
+    def test_budget_exhausted_skips_test(self, tmp_path):
+        policy = AdaptivePolicy(3600, daily_budget_mb=300, path=str(tmp_path / "adaptive.json"))
+        with patch('network_speedtest._adaptive_policy', policy), \
+             patch('network_speedtest.test_speed', return_value=make_result(mb=200)) as mock_test, \
+             patch('network_speedtest.save_to_csv'), \
+             patch('network_speedtest.save_to_store'), \
+             patch('network_speedtest.check_anomalies', return_value=[]):
+            run_speedtest()
+            run_speedtest()
+
+        mock_test.assert_called_once()
@@ -0,0 +1,112 @@
+"""
+speedtest_anomaly 模組單元測試
+測試 EWMA 基準、異常判斷與狀態保存
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+from speedtest_anomaly import AnomalyDetector, EwmaStat
+from tests.conftest import make_result
+
+
+@pytest.fixture
+def detector(tmp_path):
+    return AnomalyDetector(path=str(tmp_path / "anomaly.json"), alpha=0.2, z_threshold=3.0, warmup=5)
+
+
+def warm_up(detector, count=10):
+    for i in range(count):
+        detector.observe(make_result(download=100.0 + (i % 3), upload=50.0 + (i % 2), ping=15.0 + (i % 2)))
+
+
+class TestEwmaStat:
+    """測試 EWMA 平均值與變異數"""
+
+    def test_first_value_sets_mean(self):
+        stat = EwmaStat()
+        stat.update(42.0, 0.1)
+        assert stat.mean == 42.0
+        assert stat.var == 0.0
+        assert stat.count == 1
+
+    def test_converges_to_constant(self):
+        stat = EwmaStat()
+        stat.update(0.0, 0.5)
+        for _ in range(30):
+            stat.update(10.0, 0.5)
+        assert stat.mean == pytest.approx(10.0, abs=1e-6)
+        assert stat.var == pytest.approx(0.0, abs=1e-6)
+
+    def test_std_floor(self):
+        stat = EwmaStat(mean=100.0, var=0.0, count=3)
+        assert stat.std == pytest.approx(5.0)
+        assert stat.z_score(90.0) == pytest.approx(-2.0)
+
+    def test_no_baseline(self):
+        assert EwmaStat().z_score(10.0) is None
+
+
+class TestAnomalyDetector:
+    """測試異常判斷"""
+
+    def test_normal_results(self, detector):
+        warm_up(detector)
+        assert detector.observe(make_result(download=99.0)) == []
+
+    def test_degraded_download_and_ping(self, detector):
+        warm_up(detector)
+        with patch('speedtest_anomaly.logger') as mock_logger:
+            anomalies = detector.observe(make_result(download=20.0, ping=80.0))
+
+        assert {a['metric'] for a in anomalies} == {'download_mbps', 'ping_ms'}
+        download = next(a for a in anomalies if a['metric'] == 'download_mbps')
+        assert download['value'] == 20.0
+        assert download['z'] < -3
+        assert 99 < download['mean'] < 102
+        assert mock_logger.warning.call_count == 2
+        assert '基準' in mock_logger.warning.call_args_list[0][0][0]
+
+    def test_improvement_is_not_anomaly(self, detector):
+        warm_up(detector)
+        assert detector.observe(make_result(download=500.0, ping=1.0)) == []
+
+    def test_no_alert_during_warmup(self, detector):
+        warm_up(detector, count=3)
+        assert detector.observe(make_result(download=1.0)) == []
+
+    def test_missing_metric_skipped(self, detector):
+        warm_up(detector)
+        assert detector.observe({'download_mbps': 1.0})[0]['metric'] == 'download_mbps'
+        assert detector.stats['upload_mbps'].count == 10
+
+    def test_invalid_alpha(self, tmp_path):
+        with pytest.raises(ValueError):
+            AnomalyDetector(path=str(tmp_path / "a.json"), alpha=0)
+
+
+class TestStatePersistence:
+    """測試狀態保存"""
+
+    def test_state_survives_restart(self, detector):
+        warm_up(detector)
+        restarted = AnomalyDetector(path=detector.path, alpha=0.2, z_threshold=3.0, warmup=5)
+        assert restarted.stats['download_mbps'].count == 10
+        assert restarted.stats['download_mbps'].mean == pytest.approx(detector.stats['download_mbps'].mean)
+        assert restarted.observe(make_result(download=20.0))[0]['metric'] == 'download_mbps'
+
+    def test_state_file_is_constant_size(self, detector):
+        warm_up(detector, count=5)
+        with open(detector.path, encoding='utf-8') as f:
+            size = len(f.read())
+        warm_up(detector, count=50)
+        with open(detector.path, encoding='utf-8') as f:
+            state = json.load(f)
+        assert set(state) == {'download_mbps', 'upload_mbps', 'ping_ms'}
+        assert abs(len(json.dumps(state, indent=2)) - size) < 50
+
+    def test_corrupt_state_file(self, detector):
+        with open(detector.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        assert detector.observe(make_result()) == []
+        assert detector.stats['download_mbps'].count == 1
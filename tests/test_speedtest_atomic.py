@@ -0,0 +1,45 @@
+"""
+speedtest_atomic 模組單元測試
+測試 JSON 狀態檔案的原子寫入
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+from speedtest_atomic import write_json_atomic
+
+
+class TestWriteJsonAtomic:
+    """測試先寫暫存檔再取代"""
+
+    def test_writes_json(self, tmp_path):
+        path = tmp_path / "state.json"
+        write_json_atomic(str(path), {'名稱': 1}, ensure_ascii=False, indent=2)
+
+        assert json.loads(path.read_text(encoding='utf-8')) == {'名稱': 1}
+        assert '名稱' in path.read_text(encoding='utf-8')
+        assert not (tmp_path / "state.json.tmp").exists()
+
+    def test_failure_keeps_previous_file(self, tmp_path):
+        """測試寫入失敗時保留原本的檔案並刪除暫存檔"""
+        path = tmp_path / "state.json"
+        write_json_atomic(str(path), {'value': 1})
+
+        with patch('speedtest_atomic.os.replace', side_effect=OSError("disk full")):
+            with pytest.raises(OSError):
+                write_json_atomic(str(path), {'value': 2})
+
+        assert json.loads(path.read_text(encoding='utf-8')) == {'value': 1}
+        assert not (tmp_path / "state.json.tmp").exists()
+
+    def test_unserializable_data(self, tmp_path):
+        path = tmp_path / "state.json"
+        with pytest.raises(TypeError):
+            write_json_atomic(str(path), {'value': object()})
+        assert not path.exists()
+        assert not (tmp_path / "state.json.tmp").exists()
+
+
+# 如果直接執行此檔案，顯示測試資訊
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,198 @@
+"""
+speedtest_cache 模組單元測試
+測試 Speedtest 物件重複使用、伺服器選擇快取與延遲測量
+"""
+
+import json
+import threading
+import urllib.request
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+from speedtest_cache import (
+    SpeedtestCache,
+    BaseUrlHandler,
+    select_best_server,
+    probe_latency,
+    probe_servers
+)
+
+SERVERS = [
+    {'id': '1', 'name': 'Far', 'url': 'http://far.example/speedtest/upload.php'},
+    {'id': '2', 'name': 'Near', 'url': 'http://near.example/speedtest/upload.php'},
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SpeedtestCache(path=str(tmp_path / "servers.json"), ttl=3600, base_url="")
+
+
+@pytest.fixture
+def latency_server():
+    """回應 latency.txt 的本機 HTTP 伺服器"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'test=test' if self.path.startswith('/speedtest/latency.txt') else b'nope'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def mock_speedtest():
+    st = Mock()
+    st.get_closest_servers.return_value = [dict(s) for s in SERVERS]
+    st.results.server = {'id': '0', 'name': 'Builtin', 'url': 'http://builtin.example/upload.php'}
+    return st
+
+
+class TestSpeedtestReuse:
+    """測試 Speedtest 物件重複使用"""
+
+    @patch('speedtest_cache.speedtest.Speedtest')
+    def test_reuse_within_ttl(self, mock_speedtest_class, cache):
+        first = cache.get_speedtest()
+        assert cache.get_speedtest() is first
+        mock_speedtest_class.assert_called_once()
+
+    @patch('speedtest_cache.speedtest.Speedtest')
+    def test_recreate_after_ttl(self, mock_speedtest_class, cache):
+        cache.ttl = 0
+        cache.get_speedtest()
+        cache.get_speedtest()
+        assert mock_speedtest_class.call_count == 2
+
+
+class TestBaseUrl:
+    """測試改用相容伺服器"""
+
+    @pytest.mark.parametrize("url, expected", [
+        ("https://www.speedtest.net/speedtest-config.php?x=1.0",
+         "http://127.0.0.1:8080/speedtest-config.php?x=1.0"),
+        ("http://c.speedtest.net/speedtest-servers-static.php?threads=4",
+         "http://127.0.0.1:8080/speedtest-servers-static.php?threads=4"),
+        ("http://mirror.example/speedtest/random350x350.jpg",
+         "http://mirror.example/speedtest/random350x350.jpg"),
+    ])
+    def test_rewrite_speedtest_net_requests(self, url, expected):
+        handler = BaseUrlHandler("http://127.0.0.1:8080/")
+        request = handler.https_request(urllib.request.Request(url))
+        assert request.full_url == expected
+
+    @patch('speedtest_cache.RedirectedSpeedtest')
+    def test_base_url_creates_redirected_speedtest(self, mock_redirected, tmp_path):
+        cache = SpeedtestCache(path=str(tmp_path / "servers.json"), base_url="http://127.0.0.1:8080")
+        cache.get_speedtest()
+        mock_redirected.assert_called_once_with("http://127.0.0.1:8080")
+
+    def test_switching_base_url_discards_cached_servers(self, cache):
+        cache.remember_best(SERVERS[1])
+        stub_cache = SpeedtestCache(path=cache.path, ttl=3600, base_url="http://127.0.0.1:8080")
+        assert stub_cache.best_server() is None
+        stub_cache.remember_best(SERVERS[0])
+
+        restarted = SpeedtestCache(path=cache.path, ttl=3600, base_url="")
+        assert restarted.best_server() is None
+
+
+class TestServerSelection:
+    """測試最佳伺服器選擇"""
+
+    def test_selects_fastest_candidate_and_persists(self, cache):
+        st = mock_speedtest()
+        with patch('speedtest_cache.probe_servers', return_value={'1': 80.0, '2': 12.0}) as mock_probe:
+            best = select_best_server(st, cache)
+
+        assert best['name'] == 'Near'
+        mock_probe.assert_called_once()
+        st.get_best_server.assert_called_once_with([best])
+
+        # 重新啟動後從 JSON 檔案讀取最佳伺服器，不再測量候選伺服器
+        restarted = SpeedtestCache(path=cache.path, ttl=3600, base_url="")
+        st = mock_speedtest()
+        with patch('speedtest_cache.probe_servers') as mock_probe:
+            assert select_best_server(st, restarted)['name'] == 'Near'
+        mock_probe.assert_not_called()
+        st.get_closest_servers.assert_not_called()
+
+    def test_candidate_list_cached(self, cache):
+        st = mock_speedtest()
+        with patch('speedtest_cache.probe_servers', return_value={'2': 10.0}):
+            select_best_server(st, cache)
+        cache.invalidate_best()
+        with patch('speedtest_cache.probe_servers', return_value={'1': 10.0}):
+            assert select_best_server(st, cache)['name'] == 'Far'
+        st.get_closest_servers.assert_called_once()
+
+    def test_expired_best_is_reselected(self, cache):
+        st = mock_speedtest()
+        with patch('speedtest_cache.probe_servers', return_value={'2': 10.0}):
+            select_best_server(st, cache)
+        cache.ttl = 0
+        assert cache.best_server() is None
+
+    def test_fallback_to_builtin_selection(self, cache):
+        """測試候選伺服器都無法測量時改用 speedtest 內建的選擇"""
+        st = mock_speedtest()
+        with patch('speedtest_cache.probe_servers', return_value={}):
+            best = select_best_server(st, cache)
+        assert best['name'] == 'Builtin'
+        st.get_best_server.assert_called_once_with()
+        assert cache.best_server()['name'] == 'Builtin'
+
+    def test_corrupt_cache_file(self, cache):
+        with open(cache.path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        assert cache.best_server() is None
+
+
+class TestDegradation:
+    """測試測量結果變差時重新選擇伺服器"""
+
+    def test_first_result_sets_baseline(self, cache):
+        cache.remember_best(SERVERS[1])
+        assert not cache.check_degradation(100.0, 10.0)
+        assert not cache.check_degradation(80.0, 15.0)
+        assert cache.best_server() is not None
+
+    @pytest.mark.parametrize("download, ping", [(40.0, 10.0), (100.0, 25.0)])
+    def test_degraded_result_invalidates_best(self, cache, download, ping):
+        cache.remember_best(SERVERS[1])
+        cache.check_degradation(100.0, 10.0)
+        assert cache.check_degradation(download, ping)
+        assert cache.best_server() is None
+        with open(cache.path, encoding='utf-8') as f:
+            assert 'best' not in json.load(f)
+
+
+class TestLatencyProbe:
+    """以本機 HTTP 伺服器測試延遲測量"""
+
+    def test_probe_latency(self, latency_server):
+        latency = probe_latency({'url': f"{latency_server}/speedtest/upload.php"})
+        assert latency is not None and latency >= 0
+
+    def test_probe_invalid_response(self, latency_server):
+        assert probe_latency({'url': f"{latency_server}/other/upload.php"}) is None
+
+    def test_probe_unreachable(self):
+        assert probe_latency({'url': "http://127.0.0.1:9/speedtest/upload.php"}, timeout=0.5) is None
+
+    def test_probe_servers_concurrently(self, latency_server):
+        servers = [
+            {'id': 1, 'url': f"{latency_server}/speedtest/upload.php"},
+            {'id': 2, 'url': "http://127.0.0.1:9/speedtest/upload.php"},
+        ]
+        latencies = probe_servers(servers, timeout=0.5)
+        assert list(latencies) == ['1']
@@ -0,0 +1,310 @@
+"""
+speedtest_collector 模組單元測試
+以本機收集伺服器測試批次寫入、重送不重複、站點查詢，以及測試機的緩衝與重試
+"""
+
+import json
+import urllib.error
+import urllib.request
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from speedtest_collector import CollectorServer, ResultForwarder, normalize_result, read_csv_results
+from speedtest_store import SpeedtestStore
+from network_speedtest import main as speedtest_main, run_speedtest
+from tests.conftest import make_result
+
+
+def get_json(url, token=None):
+    request = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'} if token else {})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+@pytest.fixture
+def store(tmp_path):
+    # 保留期限以現在時間為準，測試資料使用固定日期，因此保留較長的期間
+    store = SpeedtestStore(str(tmp_path / "collector.db"), raw_retention_days=3650)
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def collector(store):
+    with CollectorServer(store, port=0, token='') as server:
+        yield server
+
+
+class TestNormalizeResult:
+    """測試送來的結果轉換"""
+
+    def test_csv_strings_converted(self):
+        row = normalize_result({'timestamp': '2026-01-13 10:00:00', 'download_mbps': '95.5',
+                                'jitter_ms': '', 'server_name': '台北'}, 'taipei')
+        assert row['download_mbps'] == 95.5
+        assert row['jitter_ms'] is None
+        assert row['server_name'] == '台北'
+        assert row['site'] == 'taipei'
+
+    def test_future_timestamp_rejected(self):
+        future = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        with pytest.raises(ValueError):
+            normalize_result({'timestamp': future}, 'taipei')
+
+    @pytest.mark.parametrize("result", [{}, {'timestamp': '2026/01/13'}, [],
+                                        {'timestamp': '2026-01-13 10:00:00', 'download_mbps': 'fast'}])
+    def test_invalid_result(self, result):
+        with pytest.raises(ValueError):
+            normalize_result(result, 'taipei')
+
+
+    @pytest.mark.parametrize("value", ['1e400', 10 ** 30])
+    def test_huge_integer_rejected(self, value):
+        with pytest.raises(OverflowError):
+            normalize_result({'timestamp': '2026-01-13 10:00:00', 'bytes_received': value}, 'taipei')
+
+class TestCollectorServer:
+    """測試收集伺服器"""
+
+    def test_forward_and_query_by_site(self, collector, tmp_path):
+        taipei = ResultForwarder(collector.url, 'taipei', str(tmp_path / "taipei.jsonl"), batch_size=2)
+        kaohsiung = ResultForwarder(collector.url, 'kaohsiung', str(tmp_path / "kaohsiung.jsonl"))
+        taipei.enqueue([make_result(hour) for hour in range(10, 15)])
+        kaohsiung.enqueue([make_result(10, download=30.0)])
+
+        assert taipei.flush() == 5
+        assert kaohsiung.flush() == 1
+        assert taipei.pending() == []
+
+        sites = get_json(f"{collector.url}/sites")['sites']
+        assert [(site['site'], site['count']) for site in sites] == [('kaohsiung', 1), ('taipei', 5)]
+
+        results = get_json(f"{collector.url}/results?site=kaohsiung&start=2026-01-13&end=2026-01-14")['results']
+        assert [result['download_mbps'] for result in results] == [30.0]
+        assert results[0]['site'] == 'kaohsiung'
+
+        rollups = get_json(f"{collector.url}/rollups?site=taipei&metric=download_mbps"
+                           f"&start=2026-01-13&end=2026-01-14")['rollups']
+        assert [(rollup['bucket_start'], rollup['count']) for rollup in rollups] == [('2026-01-13 00:00:00', 5)]
+
+    def test_resent_batch_not_duplicated(self, collector, store, tmp_path):
+        forwarder = ResultForwarder(collector.url, 'taipei', str(tmp_path / "buffer.jsonl"))
+        forwarder.enqueue([make_result(10), make_result(11)])
+        forwarder.flush()
+        forwarder.enqueue([make_result(11), make_result(12)])
+        forwarder.flush()
+        assert store.sites()[0]['count'] == 3
+
+    def test_retention_uses_collector_clock(self, tmp_path):
+        store = SpeedtestStore(str(tmp_path / "retention.db"), raw_retention_days=7)
+        try:
+            with CollectorServer(store, port=0, token='') as server:
+                recent = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+                taipei = ResultForwarder(server.url, 'taipei', str(tmp_path / "taipei.jsonl"))
+                taipei.enqueue([{**make_result(), 'timestamp': recent}])
+                assert taipei.flush() == 1
+
+                # 時鐘錯誤的測試機送來未來的時間，不能刪掉其他站點的資料
+                skewed = ResultForwarder(server.url, 'skewed', str(tmp_path / "skewed.jsonl"), retries=0)
+                skewed.enqueue([{**make_result(), 'timestamp': '2030-01-01 00:00:00'}])
+                assert skewed.flush() == 0
+
+                assert [site['site'] for site in get_json(f"{server.url}/sites")['sites']] == ['taipei']
+        finally:
+            store.close()
+
+    def test_rejected_batch_moved_aside(self, collector, store, tmp_path):
+        """測試收集伺服器拒收的批次移到拒收檔，後面的批次照常送出"""
+        forwarder = ResultForwarder(collector.url, 'taipei', str(tmp_path / "buffer.jsonl"), batch_size=1)
+        forwarder.enqueue([make_result(10), {**make_result(11), 'download_mbps': 'fast'}, make_result(12)])
+        with patch('speedtest_collector.time.sleep') as mock_sleep:
+            assert forwarder.flush() == 2
+
+        mock_sleep.assert_not_called()
+        assert forwarder.pending() == []
+        rows = store.query_raw(datetime(2026, 1, 13), datetime(2026, 1, 14), site='taipei')
+        assert [row['timestamp'] for row in rows] == ['2026-01-13 10:00:00', '2026-01-13 12:00:00']
+
+        rejected_file = tmp_path / "buffer.jsonl.rejected"
+        rejected = [json.loads(line) for line in rejected_file.read_text(encoding='utf-8').splitlines()]
+        assert [(entry['site'], entry['status'], entry['result']['timestamp']) for entry in rejected] == [
+            ('taipei', 400, '2026-01-13 11:00:00')
+        ]
+
+    def test_bad_request(self, collector):
+        request = urllib.request.Request(f"{collector.url}/results", data=b'{"results": []}', method='POST')
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=5)
+        assert error.value.code == 400
+
+    def test_huge_number_is_bad_request(self, collector, store):
+        body = json.dumps({'site': 'taipei', 'results': [{**make_result(), 'bytes_received': 10 ** 30}]})
+        request = urllib.request.Request(f"{collector.url}/results", data=body.encode('utf-8'), method='POST')
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=5)
+        assert error.value.code == 400
+        assert store.sites() == []
+
+    def test_token_required(self, store, tmp_path):
+        with CollectorServer(store, port=0, token='secret') as server:
+            with pytest.raises(urllib.error.HTTPError) as error:
+                get_json(f"{server.url}/sites")
+            assert error.value.code == 401
+            with pytest.raises(urllib.error.HTTPError) as error:
+                get_json(f"{server.url}/sites", token='secre')
+            assert error.value.code == 401
+            assert get_json(f"{server.url}/sites", token='secret') == {'sites': []}
+
+            forwarder = ResultForwarder(server.url, 'taipei', str(tmp_path / "buffer.jsonl"), token='wrong')
+            forwarder.enqueue([make_result()])
+            with patch('speedtest_collector.time.sleep') as mock_sleep:
+                assert forwarder.flush() == 0
+            # 權杖錯誤時不重試，結果留在緩衝檔
+            mock_sleep.assert_not_called()
+            assert len(forwarder.pending()) == 1
+
+
+class TestResultForwarder:
+    """測試測試機的緩衝與重試"""
+
+    def test_retry_with_backoff_then_keep_buffer(self, tmp_path):
+        forwarder = ResultForwarder("http://127.0.0.1:9", 'taipei', str(tmp_path / "buffer.jsonl"),
+                                    retries=2, backoff=0.5, timeout=1)
+        forwarder.enqueue([make_result()])
+        with patch.object(forwarder, '_post', side_effect=urllib.error.URLError('refused')) as mock_post, \
+             patch('speedtest_collector.time.sleep') as mock_sleep:
+            assert forwarder.flush() == 0
+
+        assert mock_post.call_count == 3
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 1.0]
+        assert forwarder.pending() == [make_result()]
+
+    def test_transient_failure_recovers(self, tmp_path):
+        forwarder = ResultForwarder("http://collector", 'taipei', str(tmp_path / "buffer.jsonl"), batch_size=2)
+        forwarder.enqueue([make_result(hour) for hour in range(10, 13)])
+        replies = [urllib.error.URLError('timeout'), {'inserted': 2}, {'inserted': 1}]
+        with patch.object(forwarder, '_post', side_effect=replies) as mock_post, \
+             patch('speedtest_collector.time.sleep'):
+            assert forwarder.flush() == 3
+
+        assert [len(call.args[0]) for call in mock_post.call_args_list] == [2, 2, 1]
+        assert forwarder.pending() == []
+
+    def test_stops_at_failed_batch(self, tmp_path):
+        forwarder = ResultForwarder("http://collector", 'taipei', str(tmp_path / "buffer.jsonl"),
+                                    batch_size=1, retries=0)
+        forwarder.enqueue([make_result(10), make_result(11), make_result(12)])
+        with patch.object(forwarder, '_post', side_effect=[{'inserted': 1}, OSError('reset')]) as mock_post:
+            assert forwarder.flush() == 1
+
+        assert mock_post.call_count == 2
+        assert [result['timestamp'] for result in forwarder.pending()] == ['2026-01-13 11:00:00', '2026-01-13 12:00:00']
+
+    def test_buffered_site_kept(self, tmp_path):
+        buffer_file = str(tmp_path / "buffer.jsonl")
+        ResultForwarder("http://collector", 'taipei', buffer_file).enqueue([make_result(10)])
+        forwarder = ResultForwarder("http://collector", 'kaohsiung', buffer_file)
+        forwarder.enqueue([make_result(11)])
+        with patch.object(forwarder, '_post', return_value={'inserted': 1}) as mock_post:
+            assert forwarder.flush() == 2
+
+        # 不同站點的結果分開送出，各自保留寫入時的站點
+        assert [call.args[1] for call in mock_post.call_args_list] == ['taipei', 'kaohsiung']
+
+    def test_sent_position_tracked_by_offset(self, tmp_path):
+        buffer_file = tmp_path / "buffer.jsonl"
+        forwarder = ResultForwarder("http://collector", 'taipei', str(buffer_file), batch_size=1, retries=0)
+        forwarder.enqueue([make_result(10), make_result(11)])
+        content = buffer_file.read_bytes()
+        with patch.object(forwarder, '_post', side_effect=[{'inserted': 1}, OSError('reset')]):
+            forwarder.flush()
+
+        # 送出一批只更新位置，不改寫緩衝檔
+        assert buffer_file.read_bytes() == content
+        assert int((tmp_path / "buffer.jsonl.offset").read_text()) == content.index(b'\n') + 1
+
+        with patch.object(forwarder, '_post', return_value={'inserted': 1}):
+            assert forwarder.flush() == 1
+        # 全部送出後清空
+        assert buffer_file.read_bytes() == b''
+        assert forwarder.pending() == []
+
+    def test_corrupt_buffer_line_skipped(self, tmp_path):
+        buffer_file = tmp_path / "buffer.jsonl"
+        buffer_file.write_text('{"timestamp": "2026-01-13 10:00:00"}\n{"timest\n', encoding='utf-8')
+        assert ResultForwarder("http://collector", 'taipei', str(buffer_file)).pending() == [
+            {'timestamp': '2026-01-13 10:00:00'}
+        ]
+
+
+class TestPushCommand:
+    """測試 push 子指令"""
+
+    def test_push_local_csv(self, collector, store, tmp_path):
+        csv_file = tmp_path / "speedtest_results.csv"
+        csv_file.write_text(
+            "﻿timestamp,download_mbps,upload_mbps,ping_ms,server_name,server_country,server_sponsor\n"
+            "2026-01-13 10:00:00,95.5,40.1,12.3,台北,Taiwan,ISP\n"
+            "2026-01-13 11:00:00,90.0,41.0,13.0,台北,Taiwan,ISP\n",
+            encoding='utf-8'
+        )
+        assert next(read_csv_results(str(csv_file)))['download_mbps'] == '95.5'
+
+        args = ['push', '--csv', str(csv_file), '--url', collector.url, '--site', 'taipei']
+        with patch('speedtest_collector.ResultForwarder.enqueue') as mock_enqueue:
+            speedtest_main(args)
+            # 再次送出同一個檔案不會重複寫入
+            speedtest_main(args)
+
+        # 直接送出，不經過定時測試的緩衝檔
+        mock_enqueue.assert_not_called()
+
+        rows = store.query_raw(datetime(2026, 1, 13), datetime(2026, 1, 14), site='taipei')
+        assert [row['download_mbps'] for row in rows] == [95.5, 90.0]
+
+    def test_push_reports_rows_older_than_retention(self, tmp_path, capsys):
+        """測試早於收集伺服器保留期限的結果不會寫入，並回報略過的筆數"""
+        recent = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        csv_file = tmp_path / "speedtest_results.csv"
+        csv_file.write_text(
+            "timestamp,download_mbps,upload_mbps,ping_ms,server_name,server_country,server_sponsor\n"
+            "2020-01-13 10:00:00,95.5,40.1,12.3,台北,Taiwan,ISP\n"
+            f"{recent},90.0,41.0,13.0,台北,Taiwan,ISP\n",
+            encoding='utf-8'
+        )
+        store = SpeedtestStore(str(tmp_path / "retention.db"), raw_retention_days=7)
+        try:
+            with CollectorServer(store, port=0, token='') as server:
+                forwarder = ResultForwarder(server.url, 'taipei', str(tmp_path / "buffer.jsonl"))
+                assert forwarder.send(read_csv_results(str(csv_file))) == {
+                    'sent': 2, 'inserted': 1, 'dropped': 1, 'rejected': 0
+                }
+
+                speedtest_main(['push', '--csv', str(csv_file), '--url', server.url, '--site', 'taipei'])
+            assert store.sites()[0]['count'] == 1
+        finally:
+            store.close()
+
+        assert "已送出 2 筆結果（新增 0 筆，已存在 1 筆，早於保留期限略過 1 筆）" in capsys.readouterr().out
+
+    def test_push_without_url(self, tmp_path):
+        with patch('network_speedtest.logger') as mock_logger:
+            speedtest_main(['push', '--csv', str(tmp_path / "missing.csv"), '--url', ''])
+        mock_logger.error.assert_called_once()
+
+
+class TestRunSpeedtestForwarding:
+    """測試定時測試後轉送結果"""
+
+    def test_result_forwarded(self, tmp_path):
+        forwarder = ResultForwarder("http://collector", 'taipei', str(tmp_path / "buffer.jsonl"))
+        with patch('network_speedtest._forwarder', forwarder), \
+             patch('network_speedtest.test_speed', return_value=make_result()), \
+             patch('network_speedtest.save_to_csv'), \
+             patch('network_speedtest.save_to_store'), \
+             patch('network_speedtest.check_anomalies'), \
+             patch.object(forwarder, '_post', return_value={'inserted': 1}) as mock_post:
+            run_speedtest()
+
+        mock_post.assert_called_once_with([make_result()], 'taipei')
+        assert forwarder.pending() == []
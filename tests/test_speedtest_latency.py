@@ -0,0 +1,81 @@
+"""
+speedtest_latency 模組單元測試
+以本機模擬伺服器測試延遲取樣、抖動統計與時間上限
+"""
+
+import time
+import pytest
+from unittest.mock import patch
+from speedtest_latency import summarize_latency, sample_latency, measure_latency, LATENCY_FIELDS
+from speedtest_stub import StubSpeedtestServer
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with StubSpeedtestServer(latency_ms=20) as server:
+        yield server
+
+
+class TestSummarizeLatency:
+    """測試延遲統計"""
+
+    def test_statistics(self):
+        stats = summarize_latency([10.0, 12.0, None, 14.0, 40.0])
+        assert stats['ping_min_ms'] == 10.0
+        assert stats['ping_median_ms'] == 13.0
+        assert stats['ping_p95_ms'] == 40.0
+        assert stats['jitter_ms'] == pytest.approx(12.21, abs=0.01)
+        assert stats['ping_loss_ratio'] == 0.2
+
+    def test_all_failed(self):
+        stats = summarize_latency([None, None])
+        assert stats['ping_loss_ratio'] == 1.0
+        assert stats['jitter_ms'] is None
+
+    def test_no_samples(self):
+        assert summarize_latency([])['ping_loss_ratio'] is None
+
+
+class TestSampleLatency:
+    """以本機模擬伺服器測試取樣"""
+
+    def test_fixed_interval(self, stub):
+        samples = sample_latency(f"{stub.url}/speedtest/latency.txt", samples=5, interval=0.02, budget=1.0)
+        assert len(samples) == 5
+        assert all(sample is not None and sample >= 20 for sample in samples)
+
+    def test_concurrent(self, stub):
+        started = time.monotonic()
+        samples = sample_latency(f"{stub.url}/speedtest/latency.txt", samples=8, interval=0, budget=1.0)
+        assert all(sample is not None for sample in samples)
+        # 同時送出，總時間接近單次延遲
+        assert time.monotonic() - started < 0.5
+
+    def test_budget_limits_duration(self):
+        with StubSpeedtestServer(latency_ms=300) as slow:
+            started = time.monotonic()
+            samples = sample_latency(f"{slow.url}/speedtest/latency.txt", samples=10, interval=0.1, budget=0.5)
+            elapsed = time.monotonic() - started
+        assert elapsed < 0.8
+        # 排在時間上限之後或來不及回應的取樣視為失敗
+        assert samples.count(None) >= 6
+
+    def test_unreachable_server(self):
+        samples = sample_latency("http://127.0.0.1:9/speedtest/latency.txt", samples=3, interval=0, budget=0.5)
+        assert samples == [None, None, None]
+
+
+class TestMeasureLatency:
+    """測試 measure_latency"""
+
+    def test_measure(self, stub):
+        stats = measure_latency({'url': f"{stub.url}/speedtest/upload.php"}, samples=5, interval=0.01)
+        assert set(stats) == set(LATENCY_FIELDS)
+        assert stats['ping_min_ms'] >= 20
+        assert stats['ping_loss_ratio'] == 0
+
+    def test_server_without_url(self):
+        with patch('speedtest_latency.sample_latency') as mock_sample:
+            stats = measure_latency({'name': 'Test'})
+        mock_sample.assert_not_called()
+        assert all(value is None for value in stats.values())
@@ -0,0 +1,122 @@
+"""
+speedtest_metrics 模組單元測試
+測試 Prometheus 文字格式輸出與 /metrics 伺服器
+"""
+
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import patch
+from speedtest_metrics import SpeedtestMetrics, MetricsServer, escape_label_value
+from network_speedtest import run_speedtest
+from tests.conftest import make_result
+
+
+def parse_samples(text):
+    """將指標文字轉為 {樣本（含標籤）: 數值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples
+
+
+class TestSpeedtestMetrics:
+    """測試指標記錄與輸出"""
+
+    def test_empty_metrics(self):
+        samples = parse_samples(SpeedtestMetrics().render())
+        assert samples['speedtest_runs_total'] == 0
+        assert samples['speedtest_failures_total'] == 0
+        assert not any(sample.startswith('speedtest_download_mbps') for sample in samples)
+
+    def test_latest_values_of_latest_server(self):
+        """測試只輸出最近一次測試的伺服器，換伺服器後舊的序列不再出現"""
+        metrics = SpeedtestMetrics()
+        metrics.record_success(make_result(server_name='A', download=100.0), 20.0)
+        metrics.record_success(make_result(server_name='A', download=80.0), 22.0)
+        labels_a = 'server_name="A",server_country="Taiwan",server_sponsor="ISP"'
+        assert parse_samples(metrics.render())[f'speedtest_download_mbps{{{labels_a}}}'] == 80.0
+
+        metrics.record_success(make_result(server_name='B', download=300.0), 18.0)
+        metrics.record_failure(5.0)
+
+        text = metrics.render()
+        samples = parse_samples(text)
+        assert not any(labels_a in sample for sample in samples)
+        assert samples['speedtest_download_mbps{server_name="B",server_country="Taiwan",server_sponsor="ISP"}'] == 300.0
+        assert samples['speedtest_ping_ms{server_name="B",server_country="Taiwan",server_sponsor="ISP"}'] == 15.5
+        assert samples['speedtest_runs_total'] == 4
+        assert samples['speedtest_failures_total'] == 1
+        assert samples['speedtest_run_duration_seconds_sum'] == 65.0
+        assert samples['speedtest_run_duration_seconds_count'] == 4
+        assert samples['speedtest_last_run_duration_seconds'] == 5.0
+        assert '# TYPE speedtest_download_mbps gauge' in text
+        assert '# TYPE speedtest_failures_total counter' in text
+
+    def test_timeout_counts_as_failure_once(self):
+        """測試逾時計為失敗，該次之後才結束時不重複計算"""
+        metrics = SpeedtestMetrics()
+        metrics.record_timeout(600.0)
+        metrics.record_success(make_result(server_name='A', download=90.0), 650.0)
+        metrics.record_timeout(600.0)
+        metrics.record_failure(700.0)
+        metrics.record_failure(5.0)
+
+        samples = parse_samples(metrics.render())
+        assert samples['speedtest_runs_total'] == 3
+        assert samples['speedtest_failures_total'] == 3
+        assert samples['speedtest_timeouts_total'] == 2
+        # 逾時後才完成的結果仍更新最近一次的數值
+        assert samples['speedtest_download_mbps{server_name="A",server_country="Taiwan",server_sponsor="ISP"}'] == 90.0
+
+    @pytest.mark.parametrize("value, expected", [
+        ('a"b', 'a\\"b'), ('a\\b', 'a\\\\b'), ('a\nb', 'a\\nb'), (None, 'None')
+    ])
+    def test_escape_label_value(self, value, expected):
+        assert escape_label_value(value) == expected
+
+
+class TestMetricsServer:
+    """測試 /metrics 伺服器"""
+
+    def test_serves_metrics(self):
+        metrics = SpeedtestMetrics()
+        metrics.record_success(make_result(), 12.0)
+        with MetricsServer(metrics, '127.0.0.1', 0) as server:
+            with urllib.request.urlopen(server.url, timeout=5) as response:
+                assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+                samples = parse_samples(response.read().decode('utf-8'))
+        assert samples['speedtest_runs_total'] == 1
+
+    def test_scrape_does_not_touch_disk(self):
+        metrics = SpeedtestMetrics()
+        with MetricsServer(metrics, '127.0.0.1', 0) as server, \
+                patch('builtins.open', side_effect=AssertionError("不應讀寫檔案")):
+            with urllib.request.urlopen(server.url, timeout=5) as response:
+                assert response.status == 200
+
+    def test_unknown_path(self):
+        with MetricsServer(SpeedtestMetrics(), '127.0.0.1', 0) as server:
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(server.url.replace('/metrics', '/other'), timeout=5)
+
+
+class TestRunSpeedtestMetrics:
+    """測試 run_speedtest 記錄指標"""
+
+    @patch('network_speedtest.check_anomalies')
+    @patch('network_speedtest.save_to_store')
+    @patch('network_speedtest.save_to_csv')
+    def test_records_success_and_failure(self, mock_csv, mock_store, mock_anomalies):
+        metrics = SpeedtestMetrics()
+        with patch('network_speedtest._metrics', metrics), \
+                patch('network_speedtest.test_speed', side_effect=[make_result(), None]):
+            run_speedtest()
+            run_speedtest()
+
+        samples = parse_samples(metrics.render())
+        assert samples['speedtest_runs_total'] == 2
+        assert samples['speedtest_failures_total'] == 1
+        assert any(sample.startswith('speedtest_download_mbps{') for sample in samples)
@@ -0,0 +1,204 @@
+"""
+speedtest_scheduler 模組單元測試
+以很短的間隔測試排程時間、重疊處理、逾時與停止
+"""
+
+import time
+import random
+import threading
+import pytest
+from unittest.mock import patch
+from speedtest_scheduler import Scheduler
+
+
+def run_in_background(scheduler, **kwargs):
+    thread = threading.Thread(target=scheduler.run_forever, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+
+class TestSchedulerTiming:
+    """測試執行時間"""
+
+    def test_runs_at_fixed_interval(self):
+        times = []
+        scheduler = Scheduler(lambda: times.append(time.monotonic()), interval=0.05)
+        scheduler.run_forever(max_runs=4)
+
+        assert scheduler.runs == 4
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        assert all(0.03 <= gap <= 0.2 for gap in gaps)
+
+    def test_not_run_immediately(self):
+        times = []
+        started = time.monotonic()
+        scheduler = Scheduler(lambda: times.append(time.monotonic()), interval=0.1)
+        scheduler.run_forever(run_immediately=False, max_runs=1)
+        assert times[0] - started >= 0.09
+
+    def test_jitter_delays_run(self):
+        rng = random.Random(1)
+        expected = random.Random(1).uniform(0, 0.2)
+        times = []
+        started = time.monotonic()
+        scheduler = Scheduler(lambda: times.append(time.monotonic()), interval=1, jitter=0.2, rng=rng)
+        scheduler.run_forever(max_runs=1)
+        assert times[0] - started >= expected - 0.01
+
+    def test_sleeps_until_due_without_polling(self):
+        """測試等待期間不會反覆喚醒"""
+        scheduler = Scheduler(lambda: None, interval=0.2)
+        with patch.object(scheduler._wake, 'wait', wraps=scheduler._wake.wait) as mock_wait:
+            scheduler.run_forever(run_immediately=False, max_runs=1)
+        mock_wait.assert_called_once()
+        assert mock_wait.call_args[0][0] == pytest.approx(0.2, abs=0.05)
+
+    @pytest.mark.parametrize("kwargs", [{'interval': 0}, {'interval': 1, 'overlap': 'parallel'}])
+    def test_invalid_settings(self, kwargs):
+        with pytest.raises(ValueError):
+            Scheduler(lambda: None, **kwargs)
+
+
+class TestReschedule:
+    """測試執行中變更間隔"""
+
+    def test_job_shortens_next_interval(self):
+        times = []
+        scheduler = Scheduler(lambda: None, interval=3600)
+
+        def job():
+            times.append(time.monotonic())
+            scheduler.reschedule(0.05)
+
+        scheduler.job = job
+        thread = run_in_background(scheduler, max_runs=3)
+        thread.join(2)
+        assert not thread.is_alive()
+        assert len(times) == 3
+        assert times[-1] - times[0] < 1
+
+    def test_longer_interval_delays_next_run(self):
+        calls = []
+        scheduler = Scheduler(lambda: None, interval=0.05)
+
+        def job():
+            calls.append(time.monotonic())
+            scheduler.reschedule(3600)
+
+        scheduler.job = job
+        thread = run_in_background(scheduler)
+        time.sleep(0.3)
+        scheduler.stop()
+        thread.join(1)
+        assert len(calls) == 1
+        assert scheduler.interval == 3600
+
+    def test_invalid_interval(self):
+        with pytest.raises(ValueError):
+            Scheduler(lambda: None, interval=1).reschedule(0)
+
+
+class TestOverlap:
+    """測試上一次執行還沒結束時的處理"""
+
+    def test_skip_while_running(self):
+        release = threading.Event()
+        scheduler = Scheduler(release.wait, interval=1, overlap="skip")
+        scheduler.start()
+        try:
+            assert scheduler.trigger()
+            time.sleep(0.05)
+            assert not scheduler.trigger()
+            assert scheduler.skipped == 1
+        finally:
+            release.set()
+            scheduler.stop()
+
+    def test_queue_while_running(self):
+        release = threading.Event()
+        calls = []
+
+        def job():
+            calls.append(1)
+            release.wait()
+
+        scheduler = Scheduler(job, interval=1, overlap="queue")
+        scheduler.start()
+        try:
+            assert scheduler.trigger()
+            time.sleep(0.05)
+            assert scheduler.trigger()
+            # 最多只排一次
+            assert not scheduler.trigger()
+            release.set()
+            deadline = time.monotonic() + 2
+            while len(calls) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(calls) == 2
+        finally:
+            release.set()
+            scheduler.stop()
+
+
+class TestTimeoutAndErrors:
+    """測試逾時與工作失敗"""
+
+    def test_timeout_keeps_job_busy_until_it_exits(self):
+        """測試逾時後仍等到執行緒結束才執行下一次，期間的排程略過，不會重疊"""
+        release = threading.Event()
+        running = []
+        overlaps = []
+
+        def job():
+            if running:
+                overlaps.append(1)
+            running.append(1)
+            try:
+                if scheduler.runs == 0:
+                    release.wait()
+            finally:
+                running.pop()
+
+        timeouts = []
+        scheduler = Scheduler(job, interval=0.05, timeout=0.05, on_timeout=timeouts.append)
+        timer = threading.Timer(0.4, release.set)
+        timer.start()
+        try:
+            scheduler.run_forever(max_runs=2)
+        finally:
+            release.set()
+            timer.cancel()
+        assert scheduler.timed_out == 1
+        assert len(timeouts) == 1 and timeouts[0] >= 0.05
+        assert scheduler.skipped >= 1
+        assert scheduler.runs == 2
+        assert overlaps == []
+
+    def test_job_exception_keeps_scheduling(self):
+        def job():
+            raise RuntimeError("boom")
+
+        scheduler = Scheduler(job, interval=0.02)
+        scheduler.run_forever(max_runs=3)
+        assert scheduler.runs == 3
+
+
+class TestShutdown:
+    """測試停止"""
+
+    def test_stop_wakes_sleeping_scheduler(self):
+        scheduler = Scheduler(lambda: None, interval=3600)
+        thread = run_in_background(scheduler, run_immediately=False)
+        time.sleep(0.05)
+        started = time.monotonic()
+        scheduler.stop()
+        thread.join(1)
+        assert not thread.is_alive()
+        assert time.monotonic() - started < 1
+
+    def test_keyboard_interrupt(self):
+        scheduler = Scheduler(lambda: None, interval=3600)
+        with patch.object(scheduler._wake, 'wait', side_effect=KeyboardInterrupt):
+            scheduler.run_forever(run_immediately=False)
+        assert scheduler._stop.is_set()
+        assert scheduler._worker is None
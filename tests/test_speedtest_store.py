@@ -0,0 +1,221 @@
+"""
+speedtest_store 模組單元測試
+測試原始資料寫入、每小時／每日彙總、保留期限與時間範圍查詢
+"""
+
+import sqlite3
+import pytest
+from datetime import datetime, timedelta
+from speedtest_store import SpeedtestStore, percentile, bucket_start
+from tests.conftest import make_result
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SpeedtestStore(str(tmp_path / "speedtest.db"), raw_retention_days=7, hourly_retention_days=30)
+    yield store
+    store.close()
+
+
+class TestPercentile:
+    """測試百分位數計算"""
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.95) == 95
+        assert percentile(values, 0.5) == 50
+        assert percentile([7.0], 0.95) == 7.0
+
+    def test_bucket_start(self):
+        ts = datetime(2026, 1, 13, 10, 42, 5)
+        assert bucket_start(ts, 'hour') == datetime(2026, 1, 13, 10, 0)
+        assert bucket_start(ts, 'day') == datetime(2026, 1, 13)
+
+
+class TestRollups:
+    """測試每小時與每日彙總"""
+
+    def test_hourly_and_daily_aggregates(self, store):
+        base = datetime(2026, 1, 13, 10, 0)
+        store.add_results([make_result(base + timedelta(minutes=i), download=float(i + 1)) for i in range(20)])
+        store.add_result(make_result(base + timedelta(hours=1), download=100.0))
+
+        hourly = store.query_rollups('hour', base, base + timedelta(hours=2), metric='download_mbps')
+        assert [(r['bucket_start'], r['count']) for r in hourly] == [(base, 20), (base + timedelta(hours=1), 1)]
+        assert hourly[0]['min'] == 1.0
+        assert hourly[0]['max'] == 20.0
+        assert hourly[0]['avg'] == pytest.approx(10.5)
+        assert hourly[0]['p95'] == 19.0
+
+        daily = store.query_rollups('day', datetime(2026, 1, 13), datetime(2026, 1, 14))
+        assert {r['metric'] for r in daily} == {'download_mbps', 'upload_mbps', 'ping_ms'}
+        download = next(r for r in daily if r['metric'] == 'download_mbps')
+        assert download['count'] == 21
+        assert download['max'] == 100.0
+
+    def test_missing_values_skipped(self, store):
+        result = make_result(datetime(2026, 1, 13, 10, 0), download=10.0)
+        result['upload_mbps'] = None
+        store.add_result(result)
+        metrics = {r['metric'] for r in store.query_rollups('hour', datetime(2026, 1, 13), datetime(2026, 1, 14))}
+        assert metrics == {'download_mbps', 'ping_ms'}
+
+    def test_invalid_period(self, store):
+        with pytest.raises(ValueError):
+            store.query_rollups('week', datetime(2026, 1, 1), datetime(2026, 2, 1))
+
+
+class TestRetention:
+    """測試保留期限"""
+
+    def test_old_raw_rows_deleted_but_daily_kept(self, store):
+        old = datetime(2026, 1, 1, 9, 0)
+        store.add_result(make_result(old, download=10.0))
+        store.add_result(make_result(datetime(2026, 1, 13, 9, 0), download=20.0))
+
+        assert store.query_raw(datetime(2025, 12, 1), datetime(2026, 2, 1))[0]['download_mbps'] == 20.0
+        assert store.time_range() == (datetime(2026, 1, 13, 9, 0), datetime(2026, 1, 13, 9, 0))
+        # 原始資料刪除後仍保留彙總
+        assert len(store.query_rollups('day', datetime(2026, 1, 1), datetime(2026, 1, 2), metric='download_mbps')) == 1
+
+    def test_late_result_does_not_overwrite_trimmed_rollup(self, store):
+        day = datetime(2026, 1, 1)
+        store.add_results([make_result(day + timedelta(hours=hour), download=100.0) for hour in range(10)])
+        # 之後的結果讓 1/1 的原始資料超過保留期限
+        store.add_result(make_result(datetime(2026, 1, 20, 9, 0), download=100.0))
+        assert store.add_results([make_result(day + timedelta(hours=12), download=5.0)],
+                                 now=datetime(2026, 1, 20, 10, 0)) == {'received': 1, 'inserted': 0, 'dropped': 1}
+
+        daily = store.query_rollups('day', day, day + timedelta(days=1), metric='download_mbps')
+        assert (daily[0]['count'], daily[0]['avg']) == (10, 100.0)
+
+    def test_hourly_rollups_expire(self, store):
+        store.add_result(make_result(datetime(2025, 11, 1, 9, 0), download=10.0))
+        store.add_result(make_result(datetime(2026, 1, 13, 9, 0), download=20.0))
+        assert store.query_rollups('hour', datetime(2025, 11, 1), datetime(2025, 11, 2)) == []
+        assert store.query_rollups('day', datetime(2025, 11, 1), datetime(2025, 11, 2)) != []
+
+
+class TestQuery:
+    """測試時間範圍查詢"""
+
+    def test_range_query_uses_timestamp_index(self, store):
+        base = datetime(2026, 1, 13)
+        store.add_results([make_result(base + timedelta(hours=i), download=float(i)) for i in range(48)])
+
+        with store.engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT * FROM speedtest_results WHERE timestamp >= ? AND timestamp < ?",
+                ('2026-01-13 05:00:00', '2026-01-13 08:00:00')
+            ).all()
+        assert any('ix_speedtest_results_timestamp' in str(row) for row in plan)
+
+        rows = store.query_raw(base + timedelta(hours=5), base + timedelta(hours=8))
+        assert [row['download_mbps'] for row in rows] == [5.0, 6.0, 7.0]
+        assert rows[0]['timestamp'] == '2026-01-13 05:00:00'
+
+    def test_empty_store(self, store):
+        assert store.time_range() is None
+        assert store.add_results([]) == {'received': 0, 'inserted': 0, 'dropped': 0}
+
+
+class TestSites:
+    """測試多個站點的結果"""
+
+    def test_duplicate_site_results_ignored(self, store):
+        result = make_result(datetime(2026, 1, 13, 10, 0), download=100.0)
+        assert store.add_results([{**result, 'site': 'taipei'}, {**result, 'site': 'kaohsiung'}])['inserted'] == 2
+        # 重送同一批結果
+        assert store.add_results([{**result, 'site': 'taipei'}])['inserted'] == 0
+        # 本機結果（沒有站點）不受限制
+        assert store.add_results([result, result])['inserted'] == 2
+
+        day = (datetime(2026, 1, 13), datetime(2026, 1, 14))
+        assert store.query_rollups('day', *day, metric='download_mbps', site='taipei')[0]['count'] == 1
+        assert store.query_rollups('day', *day, metric='download_mbps')[0]['count'] == 2
+
+    def test_rollups_per_site(self, store):
+        store.add_results([
+            {**make_result(datetime(2026, 1, 13, 10, 0), download=100.0), 'site': 'taipei'},
+            {**make_result(datetime(2026, 1, 13, 10, 30), download=80.0), 'site': 'taipei'},
+        ])
+        # 另一個站點的批次不會改寫 taipei 的彙總
+        store.add_results([{**make_result(datetime(2026, 1, 13, 10, 15), download=10.0), 'site': 'kaohsiung'}])
+        store.add_result(make_result(datetime(2026, 1, 13, 10, 45), download=50.0))
+
+        day = (datetime(2026, 1, 13), datetime(2026, 1, 14))
+        taipei = store.query_rollups('day', *day, metric='download_mbps', site='taipei')
+        assert (taipei[0]['count'], taipei[0]['avg']) == (2, 90.0)
+        kaohsiung = store.query_rollups('day', *day, metric='download_mbps', site='kaohsiung')
+        assert (kaohsiung[0]['count'], kaohsiung[0]['avg']) == (1, 10.0)
+        local = store.query_rollups('day', *day, metric='download_mbps')
+        assert (local[0]['count'], local[0]['avg']) == (1, 50.0)
+
+    def test_query_by_site(self, store):
+        store.add_results([
+            {**make_result(datetime(2026, 1, 13, 10, 0), download=100.0), 'site': 'taipei'},
+            {**make_result(datetime(2026, 1, 13, 11, 0), download=50.0), 'site': 'kaohsiung'},
+            {**make_result(datetime(2026, 1, 14, 10, 0), download=90.0), 'site': 'taipei'},
+        ])
+        rows = store.query_raw(datetime(2026, 1, 13), datetime(2026, 1, 15), site='taipei')
+        assert [row['download_mbps'] for row in rows] == [100.0, 90.0]
+        assert store.sites() == [
+            {'site': 'kaohsiung', 'count': 1, 'first': '2026-01-13 11:00:00', 'last': '2026-01-13 11:00:00'},
+            {'site': 'taipei', 'count': 2, 'first': '2026-01-13 10:00:00', 'last': '2026-01-14 10:00:00'},
+        ]
+
+
+class TestSchemaMigration:
+    """測試舊版資料庫補上延遲取樣欄位"""
+
+    def test_old_rollups_get_site_key(self, tmp_path):
+        path = tmp_path / "old.db"
+        connection = sqlite3.connect(path)
+        connection.execute(
+            "CREATE TABLE speedtest_rollups (period VARCHAR, bucket_start DATETIME, metric VARCHAR, count INTEGER, "
+            "min FLOAT, avg FLOAT, max FLOAT, p95 FLOAT, PRIMARY KEY (period, bucket_start, metric))"
+        )
+        connection.execute(
+            "INSERT INTO speedtest_rollups VALUES ('day', '2026-01-13 00:00:00.000000', 'download_mbps', 10, "
+            "80, 90, 100, 99)"
+        )
+        connection.commit()
+        connection.close()
+
+        store = SpeedtestStore(str(path))
+        try:
+            daily = store.query_rollups('day', datetime(2026, 1, 13), datetime(2026, 1, 14), metric='download_mbps')
+            assert (daily[0]['count'], daily[0]['avg']) == (10, 90.0)
+        finally:
+            store.close()
+
+    def test_old_database_gets_latency_columns(self, tmp_path):
+        path = tmp_path / "old.db"
+        connection = sqlite3.connect(path)
+        connection.execute(
+            "CREATE TABLE speedtest_results (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME NOT NULL, "
+            "download_mbps FLOAT, upload_mbps FLOAT, ping_ms FLOAT, server_name VARCHAR, "
+            "server_country VARCHAR, server_sponsor VARCHAR)"
+        )
+        connection.execute("INSERT INTO speedtest_results (timestamp, download_mbps) VALUES ('2026-01-13 09:00:00', 90)")
+        connection.commit()
+        connection.close()
+
+        store = SpeedtestStore(str(path))
+        try:
+            result = make_result(datetime(2026, 1, 13, 10, 0), download=100.0)
+            result.update({'ping_min_ms': 9.0, 'jitter_ms': 3.5, 'ping_loss_ratio': 0.1})
+            store.add_result(result)
+
+            rows = store.query_raw(datetime(2026, 1, 13), datetime(2026, 1, 14))
+            assert [row['jitter_ms'] for row in rows] == [None, 3.5]
+            assert rows[1]['ping_loss_ratio'] == 0.1
+
+            jitter = store.query_rollups('day', datetime(2026, 1, 13), datetime(2026, 1, 14), metric='jitter_ms')
+            assert jitter[0]['count'] == 1
+
+            # 補上的站點欄位也建立了唯一索引
+            result['site'] = 'taipei'
+            assert store.add_results([result, result])['inserted'] == 1
+        finally:
+            store.close()
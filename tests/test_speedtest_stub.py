@@ -0,0 +1,98 @@
+"""
+speedtest_stub 模組單元測試
+以本機模擬伺服器執行完整的 speedtest 流程，驗證頻寬與延遲設定
+"""
+
+import csv
+import time
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import patch
+from speedtest_stub import StubSpeedtestServer, RateLimiter
+from speedtest_cache import SpeedtestCache, RedirectedSpeedtest
+from speedtest_anomaly import AnomalyDetector
+import network_speedtest
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with StubSpeedtestServer(download_mbps=40, upload_mbps=20, latency_ms=20,
+                             test_length=1, download_scale=0.1) as server:
+        yield server
+
+
+class TestRateLimiter:
+    """測試頻寬限制"""
+
+    def test_limits_throughput(self):
+        limiter = RateLimiter(8)  # 1 MB/s
+        start = time.monotonic()
+        for _ in range(4):
+            limiter.consume(50_000)
+        assert time.monotonic() - start >= 0.19
+
+    def test_unlimited(self):
+        limiter = RateLimiter(None)
+        start = time.monotonic()
+        limiter.consume(10 ** 9)
+        assert time.monotonic() - start < 0.05
+
+
+class TestEndpoints:
+    """測試模擬的 speedtest 端點"""
+
+    def fetch(self, url):
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, response.read()
+
+    def test_latency(self, stub):
+        assert self.fetch(f"{stub.url}/speedtest/latency.txt?x=1") == (200, b'test=test')
+
+    def test_download_size(self, stub):
+        status, body = self.fetch(f"{stub.url}/speedtest/random350x350.jpg")
+        assert status == 200
+        assert len(body) == stub.download_size(350)
+
+    def test_upload(self, stub):
+        request = urllib.request.Request(f"{stub.url}/speedtest/upload.php", data=b'x' * 1000)
+        assert self.fetch(request) == (200, b'size=1000')
+
+    def test_unknown_path(self, stub):
+        with pytest.raises(urllib.error.HTTPError):
+            self.fetch(f"{stub.url}/nope")
+
+
+class TestSpeedtestAgainstStub:
+    """以 speedtest-cli 對模擬伺服器測試"""
+
+    def test_full_measurement(self, stub):
+        st = RedirectedSpeedtest(stub.url)
+        best = st.get_best_server()
+        assert best['sponsor'] == 'Speedtest Stub'
+
+        download_mbps = st.download() / 1_000_000
+        upload_mbps = st.upload() / 1_000_000
+
+        assert 40 * 0.5 <= download_mbps <= 40 * 1.1
+        # speedtest-cli 以送進 socket 的資料量計算上傳速度，會包含緩衝區內的資料，只檢查有測到
+        assert upload_mbps > 0
+        assert st.results.bytes_received > 0
+        assert stub.stats['downloads'] > 0 and stub.stats['uploads'] > 0
+
+    def test_run_speedtest_pipeline(self, stub, tmp_path):
+        """測試 network_speedtest 完整流程（測試、CSV、時間序列資料庫）"""
+        cache = SpeedtestCache(path=str(tmp_path / "servers.json"), base_url=stub.url)
+        csv_file = tmp_path / "results.csv"
+        with patch('network_speedtest._server_cache', cache), \
+                patch('network_speedtest.CSV_FILE', str(csv_file)), \
+                patch('network_speedtest.SPEEDTEST_DB', str(tmp_path / "results.db")), \
+                patch('network_speedtest._anomaly_detector', AnomalyDetector(path=str(tmp_path / "anomaly.json"))):
+            network_speedtest.run_speedtest()
+
+        with open(csv_file, encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 1
+        assert rows[0]['server_sponsor'] == 'Speedtest Stub'
+        assert float(rows[0]['download_mbps']) > 0
+        assert cache.best_server()['sponsor'] == 'Speedtest Stub'
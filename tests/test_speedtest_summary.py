@@ -0,0 +1,190 @@
+"""
+speedtest_summary 模組單元測試
+測試分位數草圖、依週期彙總與以檔案位置快取
+"""
+
+import csv
+import random
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from speedtest_summary import (
+    QuantileSketch,
+    SummaryBuilder,
+    period_key,
+    iter_csv_lines,
+    summarize_csv,
+    write_summary_csv,
+    format_summary
+)
+from network_speedtest import main as speedtest_main
+
+FIELDNAMES = ['timestamp', 'download_mbps', 'upload_mbps', 'ping_ms',
+              'server_name', 'server_country', 'server_sponsor']
+
+
+def write_results(path, rows, header=True):
+    with open(path, 'a', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def make_rows(start, count, download=100.0, step=timedelta(hours=6)):
+    return [{'timestamp': (start + step * i).strftime("%Y-%m-%d %H:%M:%S"),
+             'download_mbps': download + i % 10, 'upload_mbps': 50.0, 'ping_ms': 15.0,
+             'server_name': '台北', 'server_country': 'Taiwan', 'server_sponsor': 'ISP'}
+            for i in range(count)]
+
+
+class TestQuantileSketch:
+    """測試分位數草圖"""
+
+    def test_relative_accuracy(self):
+        rng = random.Random(0)
+        values = [rng.lognormvariate(4, 1) for _ in range(20000)]
+        sketch = QuantileSketch(0.01)
+        for value in values:
+            sketch.add(value)
+
+        values.sort()
+        for fraction in (0.05, 0.5, 0.95):
+            exact = values[int(fraction * (len(values) - 1))]
+            assert sketch.quantile(fraction) == pytest.approx(exact, rel=0.02)
+
+    def test_merge_equals_combined(self):
+        left, right, combined = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for value in range(1, 501):
+            (left if value % 2 else right).add(value)
+            combined.add(value)
+        left.merge(right)
+        assert left.count == combined.count
+        assert left.bins == combined.bins
+
+    def test_zero_values(self):
+        sketch = QuantileSketch()
+        for value in (0, 0, 0, 10):
+            sketch.add(value)
+        assert sketch.quantile(0.5) == 0.0
+        assert sketch.quantile(1.0) == pytest.approx(10, rel=0.01)
+
+    def test_empty(self):
+        assert QuantileSketch().quantile(0.5) is None
+
+    def test_round_trip(self):
+        sketch = QuantileSketch()
+        for value in (1.5, 20.0, 300.0):
+            sketch.add(value)
+        restored = QuantileSketch.from_dict(sketch.to_dict())
+        assert restored.bins == sketch.bins
+        assert restored.quantile(0.5) == sketch.quantile(0.5)
+
+    def test_merge_different_accuracy(self):
+        with pytest.raises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.05))
+
+
+class TestPeriodKey:
+    """測試週期標籤"""
+
+    @pytest.mark.parametrize("period, expected", [('day', '2026-01-01'), ('week', '2026-W01'), ('month', '2026-01')])
+    def test_period_key(self, period, expected):
+        assert period_key(datetime(2026, 1, 1, 12), period) == expected
+
+    def test_iso_week_crosses_year(self):
+        assert period_key(datetime(2024, 12, 30), 'week') == '2025-W01'
+
+
+class TestSummary:
+    """測試串流彙總與快取"""
+
+    def test_monthly_summary(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 124) + make_rows(datetime(2026, 2, 1), 112, 200.0))
+
+        rows = summarize_csv(str(csv_file), 'month', ['download_mbps'], cache_file=None)
+        assert [(row['period'], row['count']) for row in rows] == [('2026-01', 124), ('2026-02', 112)]
+        assert rows[0]['p5'] == pytest.approx(100, rel=0.02)
+        assert rows[0]['p50'] == pytest.approx(104.5, rel=0.02)
+        assert rows[1]['p95'] == pytest.approx(209, rel=0.02)
+
+    def test_rerun_only_reads_new_rows(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        cache_file = str(tmp_path / "cache.json")
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 10))
+
+        assert SummaryBuilder(cache_file).update(str(csv_file)) == 10
+        write_results(csv_file, make_rows(datetime(2026, 1, 5), 3), header=False)
+
+        builder = SummaryBuilder(cache_file)
+        assert builder.update(str(csv_file)) == 3
+        assert builder.summary('month')[0]['count'] == 13
+
+        # 結果與不使用快取重新讀取整個檔案相同
+        assert builder.summary('day') == summarize_csv(str(csv_file), 'day', cache_file=None)
+
+    def test_rewritten_file_rebuilds(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        cache_file = str(tmp_path / "cache.json")
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 10))
+        SummaryBuilder(cache_file).update(str(csv_file))
+
+        csv_file.unlink()
+        write_results(csv_file, make_rows(datetime(2026, 3, 1), 4, download=50.0))
+        builder = SummaryBuilder(cache_file)
+        assert builder.update(str(csv_file)) == 4
+        assert {row['period'] for row in builder.summary('month')} == {'2026-03'}
+
+    def test_partial_last_line_is_deferred(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 2))
+        with open(csv_file, 'a', encoding='utf-8') as f:
+            f.write('2026-01-03 00:00:00,99')
+
+        lines = list(iter_csv_lines(str(csv_file)))
+        assert len(lines) == 3
+        assert lines[0][0][0] == 'timestamp'
+
+    def test_invalid_rows_skipped(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 2))
+        with open(csv_file, 'a', encoding='utf-8') as f:
+            f.write('not a date,1,2,3,a,b,c\n2026-01-02 00:00:00,,50,15,a,b,c\n')
+
+        rows = summarize_csv(str(csv_file), 'month', cache_file=None)
+        counts = {row['metric']: row['count'] for row in rows}
+        assert counts == {'download_mbps': 2, 'upload_mbps': 3, 'ping_ms': 3}
+
+    def test_write_and_format(self, tmp_path):
+        csv_file = tmp_path / "results.csv"
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 5))
+        rows = summarize_csv(str(csv_file), 'week', cache_file=None)
+
+        output = tmp_path / "summary.csv"
+        write_summary_csv(rows, str(output))
+        with open(output, encoding='utf-8-sig') as f:
+            exported = list(csv.DictReader(f))
+        assert list(exported[0]) == ['period', 'metric', 'count', 'p5', 'p50', 'p95']
+        assert 'p95' in format_summary(rows)
+
+
+class TestSummaryCommand:
+    """測試 summary 子指令"""
+
+    def test_summary_command(self, tmp_path, capsys):
+        csv_file = tmp_path / "results.csv"
+        output = tmp_path / "summary.csv"
+        write_results(csv_file, make_rows(datetime(2026, 1, 1), 8))
+
+        speedtest_main(['summary', '--csv', str(csv_file), '--period', 'day', '--metric', 'download_mbps',
+                        '--cache', str(tmp_path / "cache.json"), '--output', str(output)])
+
+        printed = capsys.readouterr().out
+        assert '2026-01-01' in printed and '2026-01-02' in printed
+        assert output.exists()
+
+    def test_missing_csv(self, tmp_path):
+        with patch('network_speedtest.logger') as mock_logger:
+            speedtest_main(['summary', '--csv', str(tmp_path / "missing.csv")])
+        mock_logger.error.assert_called_once()
@@ -0,0 +1,184 @@
+"""
+speedtest_tcp_monitor 模組單元測試
+以本機 TCP 伺服器測試連線延遲、同時監控多個目標與批次寫入資料庫
+"""
+
+import time
+import socket
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+from speedtest_tcp_monitor import parse_target, load_targets, probe_tcp, probe_all, monitor
+from speedtest_store import SpeedtestStore
+from network_speedtest import main as speedtest_main
+
+
+@pytest.fixture
+def listener():
+    """接受連線的本機 TCP 伺服器（由系統在背景完成三向交握）"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1024)
+    yield f"127.0.0.1:{server.getsockname()[1]}"
+    server.close()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"127.0.0.1:{port}"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SpeedtestStore(str(tmp_path / "speedtest.db"))
+    yield store
+    store.close()
+
+
+class TestTargets:
+    """測試監控目標解析"""
+
+    @pytest.mark.parametrize("target, expected", [
+        ("example.com:80", ("example.com", 80)),
+        ("example.com", ("example.com", 443)),
+        ("[::1]:8080", ("::1", 8080)),
+        ("::1", ("::1", 443)),
+    ])
+    def test_parse_target(self, target, expected):
+        assert parse_target(target) == expected
+
+    @pytest.mark.parametrize("target", [":80", "example.com:http"])
+    def test_invalid_target(self, target):
+        with pytest.raises(ValueError):
+            parse_target(target)
+
+    def test_load_targets(self, tmp_path):
+        hosts_file = tmp_path / "hosts.txt"
+        hosts_file.write_text("# 內部服務\ndb.internal:1433\n\nexample.com:80  # 重複\n", encoding='utf-8')
+        assert load_targets("example.com:80, 1.1.1.1", str(hosts_file)) == [
+            "example.com:80", "1.1.1.1:443", "db.internal:1433"
+        ]
+
+
+class TestProbe:
+    """測試 TCP 連線延遲測量"""
+
+    def test_reachable(self, listener):
+        result = asyncio.run(probe_tcp(listener, timeout=1))
+        assert result['latency_ms'] is not None and result['latency_ms'] >= 0
+        assert result['error'] is None
+
+    def test_refused(self, closed_port):
+        result = asyncio.run(probe_tcp(closed_port, timeout=1))
+        assert result['latency_ms'] is None
+        assert result['error']
+
+    def test_timeout(self):
+        async def never_connects(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        with patch('speedtest_tcp_monitor.asyncio.open_connection', never_connects):
+            result = asyncio.run(probe_tcp("127.0.0.1:80", timeout=0.05))
+        assert result['error'] == 'timeout'
+
+    def test_dns_time_not_counted(self, listener):
+        """測試延遲只計算連線，不包含 DNS 查詢的時間"""
+        resolve = asyncio.BaseEventLoop.getaddrinfo
+
+        async def slow_getaddrinfo(self, *args, **kwargs):
+            await asyncio.sleep(0.3)
+            return await resolve(self, *args, **kwargs)
+
+        with patch.object(asyncio.BaseEventLoop, 'getaddrinfo', slow_getaddrinfo):
+            result = asyncio.run(probe_tcp(listener, timeout=1))
+        assert result['error'] is None
+        assert result['latency_ms'] < 300
+
+    def test_dns_timeout(self, listener):
+        async def never_resolves(self, *args, **kwargs):
+            await asyncio.sleep(10)
+
+        with patch.object(asyncio.BaseEventLoop, 'getaddrinfo', never_resolves):
+            result = asyncio.run(probe_tcp(listener, timeout=0.05))
+        assert result['error'] == 'timeout'
+
+    def test_many_targets_concurrently(self, listener, closed_port):
+        targets = [listener] * 300 + [closed_port]
+        started = time.monotonic()
+        results = asyncio.run(probe_all(targets, timeout=1, concurrency=100))
+        assert time.monotonic() - started < 5
+        assert len(results) == 301
+        assert sum(result['latency_ms'] is not None for result in results) == 300
+        assert results[-1]['target'] == closed_port
+
+
+class TestMonitor:
+    """測試持續監控與寫入資料庫"""
+
+    def test_rounds_are_batched_into_store(self, listener, closed_port, store):
+        with patch.object(store, 'add_tcp_results', wraps=store.add_tcp_results) as mock_add:
+            rounds = asyncio.run(monitor([listener, closed_port], store, interval=0.05, timeout=1, rounds=3))
+
+        assert rounds == 3
+        # 每輪一次批次寫入
+        assert mock_add.call_count == 3
+        now = datetime.now()
+        rows = store.query_tcp(now - timedelta(minutes=1), now + timedelta(minutes=1))
+        assert len(rows) == 6
+        assert len(store.query_tcp(now - timedelta(minutes=1), now + timedelta(minutes=1), target=closed_port)) == 3
+        assert all(row['latency_ms'] is None and row['error'] for row in rows if row['target'] == closed_port)
+
+    def test_stop_event(self, listener):
+        async def run():
+            stop = asyncio.Event()
+            task = asyncio.create_task(monitor([listener], None, interval=60, timeout=1, stop=stop))
+            await asyncio.sleep(0.1)
+            stop.set()
+            return await asyncio.wait_for(task, 1)
+
+        assert asyncio.run(run()) == 1
+
+    def test_store_failure_does_not_stop_monitor(self, listener):
+        store = Mock()
+        store.add_tcp_results.side_effect = RuntimeError("disk full")
+        assert asyncio.run(monitor([listener], store, interval=0.01, timeout=1, rounds=2)) == 2
+
+
+class TestTcpRetention:
+    """測試 TCP 監控結果的保留期限"""
+
+    def test_old_rows_deleted(self, tmp_path):
+        store = SpeedtestStore(str(tmp_path / "speedtest.db"), raw_retention_days=7)
+        try:
+            store.add_tcp_results([{'timestamp': '2026-01-01 09:00:00', 'target': 'a:1', 'latency_ms': 1.0}])
+            store.add_tcp_results([{'timestamp': '2026-01-20 09:00:00', 'target': 'a:1', 'latency_ms': 2.0}])
+            rows = store.query_tcp(datetime(2025, 12, 1), datetime(2026, 2, 1))
+            assert [row['latency_ms'] for row in rows] == [2.0]
+        finally:
+            store.close()
+
+
+class TestMonitorCommand:
+    """測試 monitor 子指令"""
+
+    def test_monitor_command(self, listener, tmp_path):
+        db = str(tmp_path / "speedtest.db")
+        with patch('network_speedtest.SPEEDTEST_DB', db):
+            speedtest_main(['monitor', '--hosts', listener, '--rounds', '1', '--timeout', '1'])
+
+        store = SpeedtestStore(db)
+        try:
+            now = datetime.now()
+            assert len(store.query_tcp(now - timedelta(minutes=1), now + timedelta(minutes=1))) == 1
+        finally:
+            store.close()
+
+    def test_no_targets(self):
+        with patch('network_speedtest.logger') as mock_logger:
+            speedtest_main(['monitor', '--hosts', '', '--hosts-file', ''])
+        mock_logger.error.assert_called_once()
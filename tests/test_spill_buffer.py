@@ -0,0 +1,93 @@
+"""
+spill_buffer 模組單元測試
+測試超過記憶體上限時寫入暫存檔並合併排序
+"""
+
+import os
+import random
+import pytest
+from unittest.mock import patch
+from spill_buffer import SpillingBuffer, estimate_size
+
+
+class TestSpillingBuffer:
+    """測試有記憶體上限的排序緩衝區"""
+
+    def test_small_input_stays_in_memory(self):
+        with SpillingBuffer(1024 * 1024) as buffer:
+            buffer.extend([3, 1, 2])
+            assert buffer.spilled_runs == 0
+            assert list(buffer) == [1, 2, 3]
+            assert len(buffer) == 3
+
+    def test_spill_and_merge(self, tmp_path):
+        """測試超過上限時分成多個暫存檔，合併後仍完整排序"""
+        rng = random.Random(3)
+        values = [rng.randrange(1000) for _ in range(5000)]
+
+        with SpillingBuffer(4096, spill_dir=str(tmp_path)) as buffer:
+            buffer.extend(values)
+            assert buffer.spilled_runs > 1
+            assert len(os.listdir(next(tmp_path.iterdir()))) == buffer.spilled_runs
+            assert list(buffer) == sorted(values)
+            # 可以重複迭代
+            assert sum(1 for _ in buffer) == len(values)
+
+        # 關閉後刪除暫存檔
+        assert list(tmp_path.iterdir()) == []
+
+    def test_memory_stays_under_budget(self):
+        """測試記憶體中的資料估計大小不超過上限"""
+        budget = 2000
+        with SpillingBuffer(budget, key=lambda d: d['k']) as buffer:
+            for i in range(500):
+                buffer.append({'k': i % 7, 'v': 'x' * 20})
+                assert buffer._size <= budget
+            assert [d['k'] for d in buffer] == sorted(i % 7 for i in range(500))
+
+    def test_sort_key_is_stable_across_runs(self):
+        """測試相同排序鍵的資料保留加入順序"""
+        items = [{'k': i % 3, 'n': i} for i in range(300)]
+        with SpillingBuffer(1500, key=lambda d: d['k']) as buffer:
+            buffer.extend(items)
+            assert buffer.spilled_runs > 1
+            assert list(buffer) == sorted(items, key=lambda d: d['k'])
+
+    def test_multi_pass_merge(self, tmp_path):
+        """測試 run 太多時先分批合併，合併時每次只開啟上限內的 run 數量"""
+        rng = random.Random(5)
+        values = [rng.randrange(10_000) for _ in range(3000)]
+
+        with patch('spill_buffer.SPILL_CHUNK_SIZE', 10), \
+                SpillingBuffer(2000, spill_dir=str(tmp_path)) as buffer:
+            buffer.extend(values)
+            fan_in = buffer._merge_fan_in()
+            assert buffer.spilled_runs > fan_in
+
+            assert list(buffer) == sorted(values)
+            assert buffer.spilled_runs <= fan_in
+            assert len(os.listdir(next(tmp_path.iterdir()))) == buffer.spilled_runs
+            assert list(buffer) == sorted(values)
+
+    def test_in_memory_items_spilled_before_merge(self, tmp_path):
+        """測試合併前把記憶體中剩下的資料也寫入暫存檔"""
+        with SpillingBuffer(4096, spill_dir=str(tmp_path)) as buffer:
+            buffer.extend(range(1000, 0, -1))
+            assert buffer._items
+            assert next(iter(buffer)) == 1
+            assert buffer._items == []
+            assert len(buffer) == 1000
+
+    def test_estimate_size_counts_dict_values(self):
+        user = {'Id': 'a' * 32, 'LoginName': 'test@example.com'}
+        assert estimate_size(user) > estimate_size({})
+
+    def test_estimate_size_counts_row_fields(self):
+        row = ('a' * 32, 'test@example.com', 'x' * 100)
+        assert estimate_size(row) > sum(len(field) for field in row)
+        assert estimate_size('x' * 100) == len('x' * 100) + estimate_size('')
+
+
+# 如果直接執行此檔案，顯示測試資訊
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,109 @@
+"""
+verify_credentials 模組單元測試
+使用 SQLite 模擬 HireMePlz 的 User 資料表
+"""
+
+import csv
+import pytest
+from sqlalchemy import create_engine, text
+from SHA_256 import password_hash
+from verify_credentials import (
+    build_user_hash_sql,
+    iter_candidates,
+    iter_user_hashes,
+    verify_credentials,
+    main
+)
+
+
+@pytest.fixture
+def user_db(tmp_path):
+    """建立含密碼雜湊的 SQLite User 資料表"""
+    path = tmp_path / 'users.db'
+    engine = create_engine(f"sqlite:///{path}")
+    passwords = {f"{i:032x}": f"secret{i % 7}" for i in range(40)}
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE [User] (Id TEXT PRIMARY KEY, LoginName TEXT, Password TEXT)"))
+        conn.execute(
+            text("INSERT INTO [User] (Id, LoginName, Password) VALUES (:id, :login, :hash)"),
+            [{'id': user_id, 'login': f'u{n}@example.com',
+              # 部分雜湊以大寫儲存，比對時不分大小寫
+              'hash': password_hash(pw, user_id).upper() if n % 2 else password_hash(pw, user_id)}
+             for n, (user_id, pw) in enumerate(passwords.items())]
+        )
+        conn.execute(text("INSERT INTO [User] (Id, LoginName, Password) VALUES ('none', 'x@example.com', NULL)"))
+
+    yield engine, path, passwords
+    engine.dispose()
+
+
+@pytest.fixture
+def candidates_file(tmp_path):
+    path = tmp_path / 'candidates.txt'
+    path.write_text("123456\n\nsecret3\nsecret5 \nsecret0\r\n", encoding='utf-8')
+    return path
+
+
+def read_matches(path):
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        return list(csv.reader(f))
+
+
+class TestCandidates:
+    """測試候選密碼讀取"""
+
+    def test_line_numbers_and_whitespace(self, candidates_file):
+        assert list(iter_candidates(str(candidates_file))) == [
+            (1, '123456'), (3, 'secret3'), (4, 'secret5 '), (5, 'secret0')
+        ]
+
+
+class TestUserHashes:
+    """測試用戶雜湊查詢"""
+
+    def test_rejects_invalid_column(self):
+        with pytest.raises(ValueError):
+            build_user_hash_sql("Password]; DROP TABLE x; --")
+
+    def test_sql_server_table(self):
+        assert "FROM dbo.[User] u" in build_user_hash_sql("PasswordHash")
+
+    def test_batches_skip_null_hash(self, user_db):
+        engine, _, passwords = user_db
+        batches = list(iter_user_hashes(engine, batch_size=16))
+        assert [len(batch) for batch in batches] == [16, 16, 8]
+        assert {user_id for batch in batches for user_id, _, _ in batch} == set(passwords)
+
+
+class TestVerify:
+    """測試密碼比對"""
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_writes_only_matches(self, user_db, candidates_file, tmp_path, workers):
+        engine, _, passwords = user_db
+        output_file = tmp_path / 'matches.csv'
+
+        matched = verify_credentials(engine, str(candidates_file), str(output_file), batch_size=7, workers=workers)
+
+        expected = {(user_id, {'secret3': '3', 'secret0': '5'}[pw])
+                    for user_id, pw in passwords.items() if pw in ('secret3', 'secret0')}
+        rows = read_matches(output_file)
+        assert rows[0] == ['Id', 'LoginName', '候選密碼行號']
+        assert {(row[0], row[2]) for row in rows[1:]} == expected
+        assert matched == len(expected)
+        # 不輸出候選密碼本身
+        assert 'secret' not in output_file.read_text(encoding='utf-8-sig')
+
+    def test_failure_returns_none(self, candidates_file, tmp_path):
+        engine = create_engine("sqlite://")
+        assert verify_credentials(engine, str(candidates_file), str(tmp_path / 'm.csv')) is None
+
+    def test_main_with_sqlite_database(self, user_db, candidates_file, tmp_path):
+        _, path, _ = user_db
+        output_file = tmp_path / 'matches.csv'
+
+        main([str(candidates_file), "--database-url", f"sqlite:///{path}", "--output", str(output_file),
+              "--workers", "1"])
+
+        assert len(read_matches(output_file)) > 1
@@ -3,8 +3,16 @@
 """
 
 import pytest
-from datetime import date
-from week_range import get_week_ranges, get_total_date_range
+from datetime import date, datetime
+from unittest.mock import patch
+from week_range import (
+    get_week_ranges,
+    get_total_date_range,
+    format_total_period,
+    build_calendar,
+    get_bucket_index,
+    BucketIndex
+)
 
 
 class TestWeekRanges:
@@ -69,6 +77,98 @@ class TestWeekRanges:
             assert "週" in label, f"週標籤應包含'週'字: {label}"
 
 
+class TestCalendar:
+    """測試日曆產生與快取"""
+
+    def test_default_period_matches_original_weeks(self):
+        """測試預設期間產生的週與原本手動維護的列表完全相同"""
+        assert get_week_ranges() == [
+            ("2025/11月（第3週 11/17~11/23）", date(2025, 11, 17), date(2025, 11, 23), "2025-11-第3週"),
+            ("2025/11月（第4週 11/24~11/30）", date(2025, 11, 24), date(2025, 11, 30), "2025-11-第4週"),
+            ("2025/12月（第1週 12/1~12/7）", date(2025, 12, 1), date(2025, 12, 7), "2025-12-第1週"),
+            ("2025/12月（第2週 12/8~12/14）", date(2025, 12, 8), date(2025, 12, 14), "2025-12-第2週"),
+            ("2025/12月（第3週 12/15~12/21）", date(2025, 12, 15), date(2025, 12, 21), "2025-12-第3週"),
+            ("2025/12月（第4週 12/22~12/28）", date(2025, 12, 22), date(2025, 12, 28), "2025-12-第4週"),
+            ("2026/01月（第1週 12/29~1/4）", date(2025, 12, 29), date(2026, 1, 4), "2026-01-第1週"),
+            ("2026/01月（第2週 1/5~1/11）", date(2026, 1, 5), date(2026, 1, 11), "2026-01-第2週"),
+        ]
+        assert format_total_period() == "11/17~1/11"
+
+    def test_report_period_from_env(self):
+        with patch.dict('os.environ', {'REPORT_START_DATE': '2024-01-01', 'REPORT_END_DATE': '2024-12-29'}):
+            weeks = get_week_ranges()
+            assert get_total_date_range() == (date(2024, 1, 1), date(2024, 12, 29))
+            assert format_total_period() == "1/1~12/29"
+        assert len(weeks) == 52
+        assert weeks[0][3] == "2024-01-第1週"
+
+    def test_memoized(self):
+        first = build_calendar(date(2020, 1, 1), date(2024, 12, 31))
+        assert build_calendar(date(2020, 1, 1), date(2024, 12, 31)) is first
+        assert get_bucket_index(date(2020, 1, 1), date(2024, 12, 31)) is get_bucket_index(date(2020, 1, 1), date(2024, 12, 31))
+
+    def test_custom_week_start_clips_to_period(self):
+        """測試週日開始的週，第一週裁切到期間開始日"""
+        weeks = build_calendar(date(2025, 11, 19), date(2025, 11, 30), week_start=6)
+        assert [(w[1], w[2]) for w in weeks] == [
+            (date(2025, 11, 19), date(2025, 11, 22)),
+            (date(2025, 11, 23), date(2025, 11, 29)),
+            (date(2025, 11, 30), date(2025, 11, 30)),
+        ]
+
+    def test_custom_week_start_labelled_by_thursday(self):
+        """測試週日開始的週以週四所在的月份歸屬（週三是 12/31、週四是 1/1）"""
+        weeks = build_calendar(date(2025, 12, 21), date(2026, 1, 10), week_start=6)
+        assert [w[3] for w in weeks] == ['2025-12-第4週', '2026-01-第1週', '2026-01-第2週']
+        assert weeks[1][0] == "2026/01月（第1週 12/28~1/3）"
+
+    def test_iso_weeks_across_year(self):
+        weeks = build_calendar(date(2025, 12, 22), date(2026, 1, 4), "iso_week")
+        assert [w[3] for w in weeks] == ["2025-W52", "2026-W01"]
+        assert weeks[1][0] == "2026-W01（12/29~1/4）"
+
+    def test_months_and_quarters(self):
+        months = build_calendar(date(2025, 11, 17), date(2026, 1, 11), "month")
+        assert [(w[3], w[1], w[2]) for w in months] == [
+            ("2025-11", date(2025, 11, 17), date(2025, 11, 30)),
+            ("2025-12", date(2025, 12, 1), date(2025, 12, 31)),
+            ("2026-01", date(2026, 1, 1), date(2026, 1, 11)),
+        ]
+        quarters = build_calendar(date(2025, 1, 1), date(2026, 12, 31), "quarter")
+        assert len(quarters) == 8
+        assert quarters[3] == ("2025 Q4（10/1~12/31）", date(2025, 10, 1), date(2025, 12, 31), "2025-Q4")
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            build_calendar(date(2025, 1, 1), date(2025, 2, 1), "day")
+        with pytest.raises(ValueError):
+            build_calendar(date(2025, 2, 1), date(2025, 1, 1))
+
+
+class TestBucketIndex:
+    """測試日期對應區間的索引"""
+
+    def test_find_date_and_datetime(self):
+        index = get_bucket_index(date(2015, 1, 1), date(2025, 12, 31))
+        buckets = build_calendar(date(2015, 1, 1), date(2025, 12, 31))
+
+        position = index.find(date(2020, 2, 29))
+        assert buckets[position][1] <= date(2020, 2, 29) <= buckets[position][2]
+        assert index.find(datetime(2020, 2, 29, 23, 59)) == position
+        assert index.find(date(2014, 12, 31)) is None
+        assert index.find(date(2026, 1, 1)) is None
+
+    def test_unsorted_buckets_with_gap(self):
+        buckets = [
+            ("B", date(2025, 11, 24), date(2025, 11, 30), "b"),
+            ("A", date(2025, 11, 17), date(2025, 11, 18), "a"),
+        ]
+        index = BucketIndex(buckets)
+        assert index.find(date(2025, 11, 18)) == 1
+        assert index.find(date(2025, 11, 20)) is None
+        assert index.find(date(2025, 11, 30)) == 0
+
+
 # 如果直接執行此檔案，顯示測試資訊
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
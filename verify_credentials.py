@@ -0,0 +1,230 @@
+"""
+HireMe 密碼外洩比對工具
+以 HireMe 的 password_hash 規則，將候選密碼清單逐一與 HireMePlz.dbo.[User] 的密碼雜湊比對，
+只輸出比對成功的用戶與候選密碼的行號（不輸出密碼本身）
+
+用戶分批串流讀取，候選清單每批重新從檔案串流讀取，雜湊在行程池上計算，
+記憶體用量與用戶數、候選數無關
+"""
+
+import os
+import re
+import csv
+import hmac
+import argparse
+from itertools import tee
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from dotenv import load_dotenv
+from logger_config import setup_logger
+from SHA_256 import password_hash_batch, HASH_CHUNK_SIZE
+from hireme import get_db_engine
+
+# 載入 .env 檔案
+load_dotenv()
+
+# 設定 logger
+logger = setup_logger("verify_credentials")
+
+# 存放密碼雜湊的欄位名稱
+PASSWORD_HASH_COLUMN = os.getenv("HIREME_PASSWORD_HASH_COLUMN", "Password")
+
+# 每批讀取的用戶數
+USER_BATCH_SIZE = 1000
+
+# 每比對多少個雜湊回報一次進度
+PROGRESS_INTERVAL = 1_000_000
+
+# 欄位名稱只允許英數與底線，避免組 SQL 時被注入
+_COLUMN_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def build_user_hash_sql(hash_column: str, schema: Optional[str] = "dbo") -> str:
+    """
+    建立讀取用戶 Id 與密碼雜湊的查詢
+
+    Args:
+        hash_column: 密碼雜湊欄位名稱
+        schema: 資料表 schema（SQLite 測試資料庫為 None）
+
+    Returns:
+        查詢語句
+
+    Raises:
+        ValueError: 欄位名稱不合法
+    """
+    if not _COLUMN_NAME.match(hash_column):
+        raise ValueError(f"不合法的欄位名稱: {hash_column}")
+    table = f"{schema}.[User]" if schema else "[User]"
+    return f"""
+    SELECT u.Id, u.LoginName, u.[{hash_column}] AS PasswordHash
+    FROM {table} u
+    WHERE u.[{hash_column}] IS NOT NULL
+    """
+
+
+def iter_user_hashes(engine: Engine, hash_column: str = PASSWORD_HASH_COLUMN,
+                     batch_size: int = USER_BATCH_SIZE) -> Iterator[List[Tuple[str, str, str]]]:
+    """
+    以伺服器端游標分批讀取用戶 Id 與密碼雜湊
+
+    Args:
+        engine: HireMePlz 資料庫引擎（或 SQLite 測試資料庫）
+        hash_column: 密碼雜湊欄位名稱
+        batch_size: 每批讀取的用戶數
+
+    Yields:
+        每批 (Id, LoginName, 密碼雜湊) 的列表
+    """
+    schema = None if engine.dialect.name == "sqlite" else "dbo"
+    sql = build_user_hash_sql(hash_column, schema)
+
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+
+    try:
+        result = session.execute(text(sql), execution_options={"stream_results": True})
+        for rows in result.partitions(batch_size):
+            yield [(str(row.Id), row.LoginName or '', str(row.PasswordHash)) for row in rows]
+
+    finally:
+        session.close()
+
+
+def iter_candidates(candidates_file: str) -> Iterator[Tuple[int, str]]:
+    """
+    串流讀取候選密碼檔（每行一個，保留前後空白，略過空行）
+
+    Args:
+        candidates_file: 候選密碼檔案路徑（UTF-8）
+
+    Yields:
+        (行號, 候選密碼)
+    """
+    with open(candidates_file, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        for line_no, line in enumerate(f, start=1):
+            candidate = line.rstrip('\r\n')
+            if candidate:
+                yield line_no, candidate
+
+
+def iter_matches(user_batches: Iterator[List[Tuple[str, str, str]]], candidates_file: str,
+                 workers: Optional[int] = None,
+                 chunk_size: int = HASH_CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+    """
+    比對每位用戶與每個候選密碼
+
+    Args:
+        user_batches: iter_user_hashes 的結果
+        candidates_file: 候選密碼檔案路徑
+        workers: 計算雜湊的行程數
+        chunk_size: 每個工作單位的雜湊數
+
+    Yields:
+        比對成功的 (Id, LoginName, 候選密碼行號)
+    """
+    def attempts():
+        for users in user_batches:
+            for line_no, candidate in iter_candidates(candidates_file):
+                for user_id, login_name, stored_hash in users:
+                    yield user_id, login_name, stored_hash, line_no, candidate
+
+    # 一份送去計算雜湊，一份保留比對所需的資訊；
+    # 兩者的落差只有處理中的工作單位，記憶體用量固定
+    for_hashing, for_matching = tee(attempts())
+    hashes = password_hash_batch(
+        ((candidate, user_id) for user_id, _, _, _, candidate in for_hashing),
+        workers=workers,
+        chunk_size=chunk_size
+    )
+
+    checked = 0
+    for (user_id, login_name, stored_hash, line_no, _), computed in zip(for_matching, hashes):
+        # 以固定時間比較，避免比對時間洩漏雜湊內容
+        if hmac.compare_digest(computed.encode('ascii'), stored_hash.strip().lower().encode('utf-8')):
+            yield user_id, login_name, line_no
+
+        checked += 1
+        if checked % PROGRESS_INTERVAL == 0:
+            logger.info(f"已比對 {checked:,} 個雜湊")
+
+
+def verify_credentials(engine: Engine, candidates_file: str, output_file: str = "credential_matches.csv",
+                       hash_column: str = PASSWORD_HASH_COLUMN, batch_size: int = USER_BATCH_SIZE,
+                       workers: Optional[int] = None) -> Optional[int]:
+    """
+    比對候選密碼清單並將比對成功的用戶寫入 CSV
+
+    Args:
+        engine: HireMePlz 資料庫引擎（或 SQLite 測試資料庫）
+        candidates_file: 候選密碼檔案路徑
+        output_file: 輸出檔案名稱
+        hash_column: 密碼雜湊欄位名稱
+        batch_size: 每批讀取的用戶數
+        workers: 計算雜湊的行程數
+
+    Returns:
+        比對成功的筆數，如果失敗則返回 None
+    """
+    try:
+        matched = 0
+        with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Id', 'LoginName', '候選密碼行號'])
+
+            user_batches = iter_user_hashes(engine, hash_column, batch_size)
+            for match in iter_matches(user_batches, candidates_file, workers):
+                writer.writerow(match)
+                matched += 1
+
+        logger.info(f"比對完成，共 {matched} 筆相符，結果已儲存至: {output_file}")
+        return matched
+
+    except Exception as e:
+        logger.error(f"比對密碼失敗: {e}", exc_info=True)
+        return None
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    主函數
+
+    Args:
+        argv: 命令列參數（預設使用 sys.argv）
+    """
+    parser = argparse.ArgumentParser(description="以 HireMe 密碼雜湊規則比對外洩的候選密碼清單")
+    parser.add_argument("candidates", help="候選密碼檔案（UTF-8，每行一個）")
+    parser.add_argument("--output", default="credential_matches.csv", help="比對結果檔案")
+    parser.add_argument("--hash-column", default=PASSWORD_HASH_COLUMN, help="User 資料表的密碼雜湊欄位")
+    parser.add_argument("--batch-size", type=int, default=USER_BATCH_SIZE, help="每批讀取的用戶數")
+    parser.add_argument("--workers", type=int, default=None, help="計算雜湊的行程數（預設為 CPU 數量）")
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="改用指定的資料庫（例如 sqlite:///users.db，資料表為 [User]），預設連線 HireMePlz"
+    )
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+    else:
+        engine = get_db_engine("HireMePlz")
+    if not engine:
+        logger.error("無法創建資料庫引擎，程式結束")
+        return
+
+    try:
+        matched = verify_credentials(engine, args.candidates, args.output, args.hash_column,
+                                     args.batch_size, args.workers)
+        if matched is not None:
+            print(f"\n共 {matched:,} 筆相符，結果已儲存至: {args.output}\n")
+
+    finally:
+        engine.dispose()
+        logger.info("資料庫引擎已關閉")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,176 @@
 """
 週範圍定義模組
 統一管理所有週的日期範圍定義
+
+報告期間預設為 2025/11/17~2026/1/11，可用環境變數 REPORT_START_DATE、REPORT_END_DATE
+（YYYY-MM-DD）調整；週、月、季的區間由日曆自動產生並快取，不需手動編輯
 """
 
-from typing import List, Tuple
-from datetime import date
+import os
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# 預設報告期間
+DEFAULT_START_DATE = date(2025, 11, 17)
+DEFAULT_END_DATE = date(2026, 1, 11)
+
+# 支援的區間單位
+BUCKET_UNITS = ("week", "iso_week", "month", "quarter")
+
+
+def _report_date(name: str, default: date) -> date:
+    value = os.getenv(name)
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else default
+
+
+def get_report_period() -> Tuple[date, date]:
+    """
+    取得報告期間
+
+    Returns:
+        (開始日期, 結束日期)
+    """
+    return (
+        _report_date("REPORT_START_DATE", DEFAULT_START_DATE),
+        _report_date("REPORT_END_DATE", DEFAULT_END_DATE),
+    )
+
+
+def _short(day: date) -> str:
+    return f"{day.month}/{day.day}"
+
+
+def _unit_start(day: date, unit: str, week_start: int) -> date:
+    """取得日期所在區間的第一天"""
+    if unit == "week":
+        return day - timedelta(days=(day.weekday() - week_start) % 7)
+    if unit == "iso_week":
+        return day - timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    return date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+
+
+def _next_unit_start(start: date, unit: str) -> date:
+    """取得下一個區間的第一天"""
+    if unit in ("week", "iso_week"):
+        return start + timedelta(days=7)
+    months = 1 if unit == "month" else 3
+    month = start.month - 1 + months
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+
+def _describe(unit_start: date, start: date, end: date, unit: str, week_start: int = 0) -> Tuple[str, str]:
+    """
+    產生區間的描述與標籤
+
+    週以週四所在的月份歸屬（與 ISO 週相同的規則），週次為該月第幾個週四；
+    週的第一天不是週一時，週四不一定是第四天
+    """
+    dates = f"{_short(start)}~{_short(end)}"
+    if unit == "week":
+        thursday = unit_start + timedelta(days=(3 - week_start) % 7)
+        week_no = (thursday.day - 1) // 7 + 1
+        return (f"{thursday.year}/{thursday.month:02d}月（第{week_no}週 {dates}）",
+                f"{thursday.year}-{thursday.month:02d}-第{week_no}週")
+    if unit == "iso_week":
+        iso_year, iso_week, _ = unit_start.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}（{dates}）", f"{iso_year}-W{iso_week:02d}"
+    if unit == "month":
+        return f"{unit_start.year}/{unit_start.month:02d}月（{dates}）", f"{unit_start.year}-{unit_start.month:02d}"
+    quarter = (unit_start.month - 1) // 3 + 1
+    return f"{unit_start.year} Q{quarter}（{dates}）", f"{unit_start.year}-Q{quarter}"
+
+
+@lru_cache(maxsize=None)
+def build_calendar(start_date: date, end_date: date, unit: str = "week",
+                   week_start: int = 0) -> Tuple[Tuple[str, date, date, str], ...]:
+    """
+    產生涵蓋期間的連續區間，相同參數只計算一次
+
+    第一個與最後一個區間會裁切到期間內
+
+    Args:
+        start_date: 開始日期
+        end_date: 結束日期（包含）
+        unit: week（自訂起始日的週）、iso_week、month 或 quarter
+        week_start: unit 為 week 時每週的第一天（0 = 週一，6 = 週日）
+
+    Returns:
+        區間的 tuple，每個元素包含 (描述, 開始日期, 結束日期, 標籤)
+
+    Raises:
+        ValueError: 單位不支援或期間不正確
+    """
+    if unit not in BUCKET_UNITS:
+        raise ValueError(f"不支援的區間單位: {unit}（可用: {', '.join(BUCKET_UNITS)}）")
+    if start_date > end_date:
+        raise ValueError(f"開始日期 {start_date} 晚於結束日期 {end_date}")
+
+    buckets = []
+    unit_start = _unit_start(start_date, unit, week_start)
+    while unit_start <= end_date:
+        next_start = _next_unit_start(unit_start, unit)
+        bucket_start = max(unit_start, start_date)
+        bucket_end = min(next_start - timedelta(days=1), end_date)
+        description, label = _describe(unit_start, bucket_start, bucket_end, unit, week_start)
+        buckets.append((description, bucket_start, bucket_end, label))
+        unit_start = next_start
+    return tuple(buckets)
+
+
+class BucketIndex:
+    """以二分搜尋找出日期所屬區間的索引"""
+
+    __slots__ = ('_order', '_starts', '_ends')
+
+    def __init__(self, buckets):
+        """
+        Args:
+            buckets: 區間列表，格式同 get_week_ranges()（不需排序，可以不連續）
+        """
+        # 依開始日期排序，並記錄原本的位置
+        self._order = sorted(range(len(buckets)), key=lambda i: buckets[i][1])
+        self._starts = [buckets[i][1] for i in self._order]
+        self._ends = [buckets[i][2] for i in self._order]
+
+    def find(self, value) -> Optional[int]:
+        """
+        找出日期所屬區間
+
+        Args:
+            value: date 或 datetime
+
+        Returns:
+            區間在原列表中的索引，不屬於任何區間時返回 None
+        """
+        # datetime 是 date 的子類別，只比較日期部分
+        if isinstance(value, datetime):
+            value = value.date()
+        # 找到開始日期 <= value 的最後一個區間
+        pos = bisect_right(self._starts, value) - 1
+        if pos >= 0 and value <= self._ends[pos]:
+            return self._order[pos]
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_bucket_index(start_date: date, end_date: date, unit: str = "week", week_start: int = 0) -> BucketIndex:
+    """
+    取得 build_calendar 結果的索引，相同參數只建立一次
+
+    Args:
+        start_date: 開始日期
+        end_date: 結束日期（包含）
+        unit: 區間單位
+        week_start: unit 為 week 時每週的第一天
+
+    Returns:
+        區間索引
+    """
+    return BucketIndex(build_calendar(start_date, end_date, unit, week_start))
 
 
 def get_week_ranges() -> List[Tuple[str, date, date, str]]:
@@ -14,17 +180,7 @@ def get_week_ranges() -> List[Tuple[str, date, date, str]]:
     Returns:
         週的列表，每個元素包含 (描述, 開始日期, 結束日期, 週標籤)
     """
-    weeks = [
-        ("2025/11月（第3週 11/17~11/23）", date(2025, 11, 17), date(2025, 11, 23), "2025-11-第3週"),
-        ("2025/11月（第4週 11/24~11/30）", date(2025, 11, 24), date(2025, 11, 30), "2025-11-第4週"),
-        ("2025/12月（第1週 12/1~12/7）", date(2025, 12, 1), date(2025, 12, 7), "2025-12-第1週"),
-        ("2025/12月（第2週 12/8~12/14）", date(2025, 12, 8), date(2025, 12, 14), "2025-12-第2週"),
-        ("2025/12月（第3週 12/15~12/21）", date(2025, 12, 15), date(2025, 12, 21), "2025-12-第3週"),
-        ("2025/12月（第4週 12/22~12/28）", date(2025, 12, 22), date(2025, 12, 28), "2025-12-第4週"),
-        ("2026/01月（第1週 12/29~1/4）", date(2025, 12, 29), date(2026, 1, 4), "2026-01-第1週"),
-        ("2026/01月（第2週 1/5~1/11）", date(2026, 1, 5), date(2026, 1, 11), "2026-01-第2週"),
-    ]
-    return weeks
+    return list(build_calendar(*get_report_period()))
 
 
 def get_total_date_range() -> Tuple[date, date]:
@@ -34,7 +190,18 @@ def get_total_date_range() -> Tuple[date, date]:
     Returns:
         (開始日期, 結束日期)
     """
-    weeks = get_week_ranges()
+    weeks = build_calendar(*get_report_period())
     start_date = weeks[0][1]  # 第一個週的開始日期
     end_date = weeks[-1][2]  # 最後一個週的結束日期
     return start_date, end_date
+
+
+def format_total_period() -> str:
+    """
+    取得總日期範圍的簡短描述
+
+    Returns:
+        例如 "11/17~1/11"
+    """
+    start_date, end_date = get_total_date_range()
+    return f"{_short(start_date)}~{_short(end_date)}"